@@ -0,0 +1,231 @@
+"""Benchmark the diff tokenizers on a synthetic 10k-file, 1M-line diff.
+
+Compares the current functions in lazypr.diff with the regex-per-line
+implementations they replaced, reproduced below as the baseline.
+
+Usage:
+    python benchmarks/bench_diff.py [--files N] [--lines N] [--repeat N]
+"""
+
+import argparse
+import io
+import re
+import time
+import tracemalloc
+from typing import Callable
+
+from lazypr.diff import (
+    _DiffStreamFilter,
+    filter_large_files,
+    index_diff,
+    index_diff_bytes,
+    parse_diff_lines,
+    rebuild_diff_with_files,
+)
+from lazypr.ignore import IgnoreMatcher
+
+
+def synthetic_diff(num_files: int, lines_per_file: int) -> str:
+    """Build a diff of num_files modified files with lines_per_file lines each."""
+    hunk_lines = max(1, lines_per_file - 5)
+    body = "".join(
+        (
+            f"+    value_{n} = compute(value_{n - 1}, {n})  # updated\n"
+            if n % 3
+            else f" unchanged context line {n}\n"
+        )
+        for n in range(hunk_lines)
+    )
+    return "".join(
+        f"diff --git a/src/pkg_{i % 100}/module_{i}.py b/src/pkg_{i % 100}/module_{i}.py\n"
+        f"index 1234567..89abcde 100644\n"
+        f"--- a/src/pkg_{i % 100}/module_{i}.py\n"
+        f"+++ b/src/pkg_{i % 100}/module_{i}.py\n"
+        f"@@ -1,{hunk_lines} +1,{hunk_lines} @@\n" + body
+        for i in range(num_files)
+    )
+
+
+# -----------------------------------------------------------------------------
+# Baseline: the original implementations, one regex match per header line
+# and a list of line strings per file
+# -----------------------------------------------------------------------------
+
+
+def _legacy_is_diff_content_line(line: str) -> bool:
+    if line.startswith(("index ", "--- ", "+++ ", "@@")):
+        return True
+    if line.startswith(("+", "-", " ")):
+        return True
+    return line == "\\ No newline at end of file"
+
+
+def legacy_parse_diff_lines(diff: str) -> dict[str, int]:
+    file_lines: dict[str, int] = {}
+    current_file: str | None = None
+    current_count = 0
+    lines = diff.replace("\r\n", "\n").split("\n")
+    if lines and lines[-1] == "":
+        lines = lines[:-1]
+    for line in lines:
+        if line.startswith("diff --git "):
+            if current_file is not None:
+                file_lines[current_file] = current_count
+            match = re.match(r"diff --git a/(.*) b/(.*)", line)
+            if match:
+                current_file = match.group(2)
+                current_count = 1
+            else:
+                current_file = None
+                current_count = 0
+        elif current_file is not None:
+            if line == "Binary files differ":
+                current_file = None
+                current_count = 0
+            elif _legacy_is_diff_content_line(line):
+                current_count += 1
+    if current_file is not None:
+        file_lines[current_file] = current_count
+    return file_lines
+
+
+def legacy_rebuild_diff_with_files(diff: str, allowed_files: list[str]) -> str:
+    allowed_set = set(allowed_files)
+    filtered_lines: list[str] = []
+    include_current = False
+    for line in diff.split("\n"):
+        if line.startswith("diff --git "):
+            match = re.match(r"diff --git a/(.*) b/(.*)", line)
+            include_current = bool(match) and match.group(2) in allowed_set
+            if include_current:
+                filtered_lines.append(line)
+        elif include_current:
+            filtered_lines.append(line)
+    return "\n".join(filtered_lines).rstrip() + "\n" if filtered_lines else ""
+
+
+def legacy_stream_filter(data: bytes, max_lines: int) -> str:
+    """Line-by-line pipe filter that decodes every line and joins per-file lists."""
+    kept: list[str] = []
+    buffer: list[str] = []
+    count = 0
+    current = False
+    for raw in io.BytesIO(data):
+        line = raw.decode("utf-8", errors="replace")
+        stripped = line.rstrip("\r\n")
+        if stripped.startswith("diff --git "):
+            if current:
+                kept.append("".join(buffer))
+            buffer = [line]
+            current = bool(re.match(r"diff --git a/(.*) b/(.*)", stripped))
+            count = 1
+            continue
+        if not current:
+            continue
+        if _legacy_is_diff_content_line(stripped):
+            count += 1
+        if count > max_lines:
+            current = False
+            buffer = []
+            continue
+        buffer.append(line)
+    if current:
+        kept.append("".join(buffer))
+    return "".join(kept)
+
+
+def current_stream_filter(data: bytes, max_lines: int) -> str:
+    """The pipe filter used by get_filtered_diff_remote(), fed 64 KiB reads."""
+    stream_filter = _DiffStreamFilter(max_lines, IgnoreMatcher([]))
+    pipe = io.BytesIO(data)
+    while chunk := pipe.read(1 << 16):
+        stream_filter.feed(chunk)
+    return stream_filter.close().decode("utf-8", errors="replace")
+
+
+# -----------------------------------------------------------------------------
+
+
+def best_time(func: Callable[[], object], repeat: int) -> float:
+    """Return the fastest of repeat runs, in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def peak_memory(func: Callable[[], object]) -> int:
+    """Return the peak memory allocated while running func, in bytes."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=10_000)
+    parser.add_argument("--lines", type=int, default=100, help="lines per file")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    diff = synthetic_diff(args.files, args.lines)
+    data = diff.encode()
+    allowed = [f.path for f in index_diff(diff)][::2]
+    max_lines = args.lines - 1  # Drops every file, after scanning all of it
+
+    print(
+        f"Synthetic diff: {args.files:,} files, {diff.count(chr(10)):,} lines, "
+        f"{len(data) / 1e6:.1f} MB (best of {args.repeat})\n"
+    )
+    cases = [
+        (
+            "parse_diff_lines",
+            lambda: legacy_parse_diff_lines(diff),
+            lambda: parse_diff_lines(diff),
+        ),
+        (
+            "rebuild_diff_with_files",
+            lambda: legacy_rebuild_diff_with_files(diff, allowed),
+            lambda: rebuild_diff_with_files(diff, allowed),
+        ),
+        (
+            "filter_large_files",
+            lambda: legacy_rebuild_diff_with_files(
+                diff,
+                [p for p, n in legacy_parse_diff_lines(diff).items() if n <= 50],
+            ),
+            lambda: filter_large_files(diff, 50),
+        ),
+        (
+            "index (str vs bytes)",
+            lambda: index_diff(diff),
+            lambda: index_diff_bytes(data),
+        ),
+        (
+            "stream filter (pipe)",
+            lambda: legacy_stream_filter(data, max_lines),
+            lambda: current_stream_filter(data, max_lines),
+        ),
+    ]
+
+    print(
+        f"{'function':<26}{'baseline':>10}{'current':>10}{'speedup':>9}"
+        f"{'peak MB':>10}{'(baseline)':>12}"
+    )
+    for name, baseline, current in cases:
+        baseline_time = best_time(baseline, args.repeat)
+        current_time = best_time(current, args.repeat)
+        print(
+            f"{name:<26}{baseline_time * 1000:>8.0f}ms{current_time * 1000:>8.0f}ms"
+            f"{baseline_time / current_time:>8.1f}x"
+            f"{peak_memory(current) / 1e6:>10.1f}{peak_memory(baseline) / 1e6:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,28 @@
 """LazyPR - AI-powered PR creation from git diffs."""
 
+import asyncio
+import importlib
 import os
 import subprocess
-import typer
-from rich.console import Console
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional, Union
 
-from .config import get_max_diff_lines, get_github_token
+import click
+import typer
+from typer.core import TyperGroup
+
+from .config import (
+    get_context_lines,
+    get_function_context,
+    get_github_token,
+    get_logfire_enabled,
+    get_max_concurrency,
+    get_max_diff_lines,
+    get_model_name,
+    parse_context_lines,
+)
 
 from .validation import (
     ValidationError,
@@ -17,11 +34,16 @@ from .validation import (
     has_commits_ahead,
     is_branch_pushed_to_remote,
     push_branch_to_remote,
+    run_preflight_checks,
+    run_repository_checks,
 )
 
 from .diff import (
     DiffError,
+    file_diff_hashes,
     get_diff_remote,
+    get_filtered_diff_remote,
+    prepare_prompt_diff,
     parse_diff_lines,
     filter_large_files,
     rebuild_diff_with_files,
@@ -33,18 +55,80 @@ from .ignore import (
     matches_pattern,
 )
 
-from .ai import (
-    generate_pr_content,
+from . import daemon
+from .profiling import Profiler, phase, profiling
+from .usage import (
+    TokenUsage,
+    format_cost,
+    get_usage_log_path,
+    load_usage_records,
+    record_usage,
+)
+
+from .cache import (
+    BranchState,
+    branch_state_key,
+    format_age,
+    get_cache_dir,
+    list_cache_entries,
+    load_branch_state,
+    prune_cache,
+    store_branch_state,
+)
+
+if TYPE_CHECKING:
+    from rich.console import Group
+
+    from .ai import PRContent
+
+# The AI stack (pydantic-ai, pydantic, httpx) and rich take hundreds of
+# milliseconds to import, so they are loaded only once they are needed.
+# These names are still importable from lazypr as before.
+_AI_EXPORTS = (
+    "PRContent",
+    "generate_pr_content",
+    "get_cached_pr_content",
+    "prepare_pr_agent",
 )
 
-# Create typer app and console
-console = Console()
-app = typer.Typer(help="AI-powered PR creation from git diffs")
+
+def __getattr__(name: str):
+    """Import the AI module on first access to one of its exports."""
+    if name in _AI_EXPORTS:
+        return getattr(importlib.import_module(".ai", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class _DefaultCreateGroup(TyperGroup):
+    """Command group that runs "create" when no other command is named.
+
+    Keeps ``lazypr --base main``, from before lazypr had subcommands, working.
+    """
+
+    def parse_args(self, ctx: click.Context, args: list[str]) -> list[str]:
+        group_options = {opt for param in self.get_params(ctx) for opt in param.opts}
+        if not args or (args[0] not in self.commands and args[0] not in group_options):
+            args = ["create", *args]
+        return super().parse_args(ctx, args)
+
+
+# Create typer app
+app = typer.Typer(help="AI-powered PR creation from git diffs", cls=_DefaultCreateGroup)
 
 
 # PR creation function
-def create_pr(title: str, description: str, base: str, web: bool = True) -> None:
-    """Create a PR using gh CLI."""
+def create_pr(
+    title: str,
+    description: str,
+    base: str,
+    web: bool = True,
+    head: Optional[str] = None,
+) -> str:
+    """Create a PR using gh CLI.
+
+    Opens the PR for head, or for the current branch when head is None.
+    Returns gh's output, which is the PR URL unless web is set.
+    """
     # Get GitHub token from config or environment
     token = get_github_token()
 
@@ -57,24 +141,77 @@ def create_pr(title: str, description: str, base: str, web: bool = True) -> None
     if web:
         cmd.append("-w")
     cmd += ["--base", base, "--title", title, "--body", description]
+    if head:
+        cmd += ["--head", head]
 
     try:
-        subprocess.run(
-            cmd,
-            check=True,
-            env=env,
-            capture_output=True,
-            text=True,
-        )
+        with phase("gh pr create"):
+            result = subprocess.run(
+                cmd,
+                check=True,
+                env=env,
+                capture_output=True,
+                text=True,
+            )
     except subprocess.CalledProcessError as e:
         error_msg = e.stderr.strip() if e.stderr else str(e)
         raise ValidationError(f"Failed to create PR: {error_msg}") from e
+    return result.stdout.strip()
+
+
+def edit_pr(title: str, description: str, head: Optional[str] = None) -> str:
+    """Replace the title and description of an open PR using gh CLI.
+
+    Edits the PR for head, or for the current branch when head is None.
+    Returns gh's output, which is the PR URL.
+    """
+    token = get_github_token()
+    env = os.environ.copy()
+    if token:
+        env["GITHUB_TOKEN"] = token
+
+    cmd = ["gh", "pr", "edit"]
+    if head:
+        cmd.append(head)
+    cmd += ["--title", title, "--body", description]
+
+    try:
+        with phase("gh pr edit"):
+            result = subprocess.run(
+                cmd,
+                check=True,
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+    except subprocess.CalledProcessError as e:
+        error_msg = e.stderr.strip() if e.stderr else str(e)
+        raise ValidationError(f"Failed to update PR: {error_msg}") from e
+    return result.stdout.strip()
 
 
 # Available languages for PR generation
 LANGUAGE_CHOICES = ["en", "pt", "es", "fr", "de", "zh", "ja", "ko", "it", "ru"]
 
 
+def _parse_context_option(value: Optional[str]) -> Optional[Union[int, str]]:
+    """Validate --context: a number of lines or "auto"."""
+    if value is None:
+        return None
+    try:
+        return parse_context_lines(value)
+    except ValueError:
+        raise typer.BadParameter("must be a number of lines or 'auto'")
+
+
+_CONTEXT_HELP = (
+    "Unchanged lines shown around each change, or 'auto' to fit them to the "
+    "token budget per file (default: LAZYPR_CONTEXT_LINES, or git's 3)."
+)
+_FUNCTION_CONTEXT_HELP = "Show whole changed functions for files with small diffs."
+_OFFLINE_HELP = "Diff against the base branch as last fetched, never fetching it."
+
+
 # CLI command
 @app.command(name="create")
 def create_cmd(
@@ -95,35 +232,227 @@ def create_cmd(
         "--dry-run",
         help="Show generated title and description without creating the PR.",
     ),
+    no_cache: bool = typer.Option(
+        False,
+        "--no-cache",
+        help="Always call the model, ignoring previously generated content.",
+    ),
+    context: Optional[str] = typer.Option(
+        None, "--context", help=_CONTEXT_HELP, callback=_parse_context_option
+    ),
+    function_context: bool = typer.Option(
+        False, "--function-context", help=_FUNCTION_CONTEXT_HELP
+    ),
+    offline: bool = typer.Option(False, "--offline", help=_OFFLINE_HELP),
+    profile: bool = typer.Option(
+        False,
+        "--profile",
+        help="Print how long each phase took (git, model, gh) when done.",
+    ),
+    trace: Optional[Path] = typer.Option(
+        None,
+        "--trace",
+        help="Write the phase timings as a Chrome trace file (open in Perfetto).",
+        dir_okay=False,
+    ),
 ) -> None:
     """Create a PR with AI-generated title and description."""
-    import asyncio
+    enabled = profile or trace is not None or get_logfire_enabled()
+    with profiling(Profiler() if enabled else None) as profiler:
+        try:
+            asyncio.run(
+                create(
+                    base,
+                    lang,
+                    yes=yes,
+                    dry_run=dry_run,
+                    use_cache=not no_cache,
+                    context=context,
+                    function_context=function_context,
+                    offline=offline,
+                )
+            )
+        finally:
+            # Report even when the run fails, that is often when it matters
+            if profile:
+                typer.echo(profiler.report(), err=True)
+            if trace is not None:
+                profiler.write_trace(trace)
+
+
+@app.command(name="update")
+def update_cmd(
+    base: str = typer.Option(..., "--base", help="Base branch the PR is against"),
+    lang: str = typer.Option(
+        "en",
+        "--lang",
+        help="Language for the PR title and description (en, pt, es, fr, de, zh, ja, ko, it, ru)",
+        case_sensitive=False,
+    ),
+    dry_run: bool = typer.Option(
+        False,
+        "--dry-run",
+        help="Show the updated title and description without editing the PR.",
+    ),
+    full: bool = typer.Option(
+        False,
+        "--full",
+        help="Regenerate from the whole diff, not just the files changed since the last run.",
+    ),
+    context: Optional[str] = typer.Option(
+        None, "--context", help=_CONTEXT_HELP, callback=_parse_context_option
+    ),
+    function_context: bool = typer.Option(
+        False, "--function-context", help=_FUNCTION_CONTEXT_HELP
+    ),
+    offline: bool = typer.Option(False, "--offline", help=_OFFLINE_HELP),
+) -> None:
+    """Refresh the title and description of the current branch's PR."""
+    asyncio.run(
+        update(
+            base,
+            lang,
+            dry_run=dry_run,
+            full=full,
+            context=context,
+            function_context=function_context,
+            offline=offline,
+        )
+    )
 
-    asyncio.run(create(base, lang, yes=yes, dry_run=dry_run))
 
+@app.command(name="cache")
+def cache_cmd(
+    clear: bool = typer.Option(False, "--clear", help="Remove every cache entry."),
+    prune: bool = typer.Option(
+        False,
+        "--prune",
+        help="Evict least recently used entries over LAZYPR_CACHE_MAX_BYTES.",
+    ),
+) -> None:
+    """Inspect and prune the cache of generated PR content."""
+    if clear or prune:
+        removed = prune_cache(0 if clear else None)
+        typer.echo(f"Removed {removed} cache entries.")
+
+    entries = list_cache_entries()
+    total = sum(entry.size for entry in entries)
+    typer.echo(f"Cache directory: {get_cache_dir()}")
+    typer.echo(f"Entries: {len(entries)} ({total / 1024:.1f} KiB)")
+    for entry in entries:
+        typer.echo(
+            f"  {entry.key[:12]}  {entry.size:>7} B  {format_age(entry.last_used)}"
+        )
 
-async def create(
-    base: str, language: str = "en", yes: bool = False, dry_run: bool = False
+
+@app.command(name="usage")
+def usage_cmd(
+    days: int = typer.Option(
+        30, "--days", help="Summarize the last N days (0 for the whole log)."
+    ),
 ) -> None:
-    """Async implementation of create command."""
-    # Validation checks
-    if not is_git_repo():
-        raise ValidationError("Not in a git repository")
+    """Summarize the tokens and estimated cost of past runs."""
+    since = time.time() - days * 86400 if days > 0 else None
+    records = load_usage_records(since)
+    period = f"last {days} day(s)" if days > 0 else "all time"
+    typer.echo(f"Usage log: {get_usage_log_path()}")
+    typer.echo(f"Runs ({period}): {len(records)}")
+
+    by_model: dict[str, list[TokenUsage]] = {}
+    for record in records:
+        by_model.setdefault(record.model, []).append(record.usage)
+    for model, usages in sorted(by_model.items()):
+        typer.echo(f"  {model or '(unknown model)'}: {_usage_totals(usages)}")
+    if len(by_model) > 1:
+        typer.echo(f"  Total: {_usage_totals([r.usage for r in records])}")
+
+
+@app.command(name="batch")
+def batch_cmd(
+    branches: Optional[list[str]] = typer.Argument(
+        None, help="Remote branches to open PRs for"
+    ),
+    base: str = typer.Option(..., "--base", help="Base branch to compare against"),
+    glob: Optional[str] = typer.Option(
+        None,
+        "--glob",
+        help="Also include remote branches matching this pattern, e.g. 'release/*'",
+    ),
+    lang: str = typer.Option(
+        "en",
+        "--lang",
+        help="Language for the PR titles and descriptions",
+        case_sensitive=False,
+    ),
+    concurrency: Optional[int] = typer.Option(
+        None,
+        "--concurrency",
+        help="Maximum concurrent model requests (default: LAZYPR_MAX_CONCURRENCY)",
+    ),
+    dry_run: bool = typer.Option(
+        False,
+        "--dry-run",
+        help="Show generated titles without creating the PRs.",
+    ),
+    no_cache: bool = typer.Option(
+        False,
+        "--no-cache",
+        help="Always call the model, ignoring previously generated content.",
+    ),
+    offline: bool = typer.Option(
+        False,
+        "--offline",
+        help="Use the remote branches as last fetched, never fetching them.",
+    ),
+) -> None:
+    """Create PRs for many branches at once."""
+    asyncio.run(
+        create_batch(
+            base,
+            branches or [],
+            glob,
+            lang,
+            max_concurrency=concurrency,
+            dry_run=dry_run,
+            use_cache=not no_cache,
+            offline=offline,
+        )
+    )
 
-    if not has_gh_cli():
-        raise ValidationError("gh CLI not installed")
 
-    if not gh_is_authenticated():
-        raise ValidationError("gh CLI not authenticated. Run 'gh auth login'")
+@app.command(name="daemon")
+def daemon_cmd() -> None:
+    """Keep a warm process that generates PR content for `lazypr create`."""
+    path = daemon.get_socket_path()
+    try:
+        asyncio.run(
+            daemon.serve(
+                path, ready=lambda: typer.echo(f"lazypr daemon listening on {path}")
+            )
+        )
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        typer.echo("lazypr daemon stopped.")
 
-    if not has_remote("origin"):
-        raise ValidationError("No 'origin' remote found")
 
-    current_branch = get_current_branch()
+async def create(
+    base: str,
+    language: str = "en",
+    yes: bool = False,
+    dry_run: bool = False,
+    use_cache: bool = True,
+    context: Optional[Union[int, str]] = None,
+    function_context: bool = False,
+    offline: bool = False,
+) -> None:
+    """Async implementation of create command."""
+    # Validation checks, run concurrently
+    with phase("preflight checks"):
+        checks = await run_preflight_checks(base)
+    current_branch = checks.current_branch
     typer.echo(f"Current branch: {current_branch}")
 
     # Check if branch is pushed to remote
-    if not dry_run and not is_branch_pushed_to_remote(current_branch):
+    if not dry_run and not checks.branch_pushed:
         if yes:
             typer.echo(f"Pushing to origin/{current_branch}...")
             push_branch_to_remote(current_branch, "origin")
@@ -138,37 +467,59 @@ async def create(
             push_branch_to_remote(current_branch, "origin")
             typer.echo("Push successful.")
 
-    if not has_commits_ahead(base):
-        raise ValidationError(f"No commits ahead of '{base}'")
-
-    # Get and filter diff from remote base branch
-    typer.echo(f"Getting diff from {base}...")
-    diff = get_diff_remote(base)
-
-    if not diff.strip():
-        raise DiffError("No changes to include in PR")
-
-    # Filter large files
-    max_lines = get_max_diff_lines()
-    filtered_diff = filter_large_files(diff, max_lines)
-
-    # Load and apply ignore patterns
-    patterns = load_ignore_patterns()
-    file_lines = parse_diff_lines(filtered_diff)
-    filtered_files = apply_ignore_patterns(list(file_lines.keys()), patterns)
-
-    # Rebuild diff with only allowed files
-    if set(file_lines.keys()) != set(filtered_files):
-        filtered_diff = rebuild_diff_with_files(filtered_diff, filtered_files)
-
-    if not filtered_diff.strip():
-        raise DiffError("No changes left after filtering")
-
-    with console.status("[bold green]Generating PR content with AI...", spinner="dots"):
-        pr_content = await generate_pr_content(filtered_diff, language)
+    # Hand generation to a running daemon if there is one. Otherwise build
+    # the AI agent and connect to the provider while git fetches and diffs;
+    # neither depends on the other
+    connection = await daemon.connect()
+    agent_task = None if connection else asyncio.create_task(_prepare_agent())
+    try:
+        diff, omitted_files = await _get_prompt_diff(
+            base, context, function_context, offline
+        )
+    except BaseException:
+        if agent_task is not None:
+            agent_task.cancel()
+        if connection is not None:
+            connection[1].close()
+        raise
+
+    usage = TokenUsage()
+    pr_content = None
+    if connection is not None:
+        try:
+            with _live_view() as show_partial, phase("daemon"):
+                pr_content = await daemon.request_pr_content(
+                    connection,
+                    diff,
+                    language,
+                    omitted_files,
+                    use_cache=use_cache,
+                    on_partial=show_partial,
+                    usage=usage,
+                )
+        except daemon.DaemonError as e:
+            typer.echo(f"The lazypr daemon failed ({e}); running locally.")
+        else:
+            if pr_content is None:
+                typer.echo("The lazypr daemon uses a different model; running locally.")
+        if pr_content is None:
+            agent_task = asyncio.create_task(_prepare_agent())
+
+    if pr_content is None:
+        pr_content = await _generate_locally(
+            agent_task, diff, language, omitted_files, use_cache, usage
+        )
 
     typer.echo(f"\nTitle: {pr_content.title}")
     typer.echo(f"Description:\n{pr_content.description}\n")
+    if usage.requests:
+        typer.echo(usage.summary())
+        record_usage("create", get_model_name() or "", usage)
+    # Lets `lazypr update` send only the files that change from here on
+    store_branch_state(
+        branch_state_key(current_branch, base),
+        BranchState(pr_content.title, pr_content.description, file_diff_hashes(diff)),
+    )
 
     if dry_run:
         return
@@ -181,6 +532,293 @@ async def create(
     create_pr(pr_content.title, pr_content.description, base, web=not yes)
 
 
+async def update(
+    base: str,
+    language: str = "en",
+    dry_run: bool = False,
+    full: bool = False,
+    context: Optional[Union[int, str]] = None,
+    function_context: bool = False,
+    offline: bool = False,
+) -> None:
+    """Async implementation of update command."""
+    with phase("preflight checks"):
+        checks = await run_preflight_checks(base)
+    current_branch = checks.current_branch
+    typer.echo(f"Current branch: {current_branch}")
+    if not dry_run and not checks.branch_pushed:
+        raise ValidationError(
+            f"Branch '{current_branch}' has unpushed commits; push them first."
+        )
+
+    agent_task = asyncio.create_task(_prepare_agent())
+    try:
+        diff, omitted_files = await _get_prompt_diff(
+            base, context, function_context, offline
+        )
+    except BaseException:
+        agent_task.cancel()
+        raise
+
+    key = branch_state_key(current_branch, base)
+    state = None if full else load_branch_state(key)
+    if state is None:
+        typer.echo("No previous run for this branch; generating from the whole diff.")
+
+    ai = await _import_ai()
+    usage = TokenUsage()
+    with _live_view() as show_partial:
+        with phase("wait for agent"):
+            agent = await agent_task
+        with phase("generate"):
+            pr_content, new_state = await ai.update_pr_content(
+                diff,
+                state,
+                language,
+                omitted_files,
+                agent=agent,
+                on_partial=show_partial,
+                usage=usage,
+            )
+    store_branch_state(key, new_state)
+
+    typer.echo(f"\nTitle: {pr_content.title}")
+    typer.echo(f"Description:\n{pr_content.description}\n")
+    if usage.requests:
+        typer.echo(usage.summary())
+        record_usage("update", get_model_name() or "", usage)
+    elif state is not None:
+        typer.echo("No files changed since the last run.")
+
+    if dry_run:
+        return
+
+    typer.echo("Updating PR...")
+    typer.echo(edit_pr(pr_content.title, pr_content.description))
+
+
+async def create_batch(
+    base: str,
+    branches: list[str],
+    glob: Optional[str] = None,
+    language: str = "en",
+    max_concurrency: Optional[int] = None,
+    dry_run: bool = False,
+    use_cache: bool = True,
+    offline: bool = False,
+) -> None:
+    """Async implementation of batch command."""
+    from . import batch as batch_mode
+
+    await run_repository_checks("origin")
+
+    # One fetch for the base and every branch; a glob needs every remote
+    # branch fetched before it can be resolved
+    if not offline:
+        typer.echo("Fetching branches...")
+        await asyncio.to_thread(
+            batch_mode.fetch_branches, base, None if glob else branches, "origin"
+        )
+    branches = await asyncio.to_thread(
+        batch_mode.resolve_branches, branches, glob, "origin"
+    )
+    branches = [b for b in branches if b != base]
+    if not branches:
+        raise ValidationError("No branches to create PRs for")
+
+    typer.echo(f"Generating PR content for {len(branches)} branch(es)...")
+    usage = TokenUsage()
+    results = await batch_mode.run_batch(
+        base,
+        branches,
+        create_pr,
+        language,
+        patterns=load_ignore_patterns(),
+        max_concurrency=max_concurrency or get_max_concurrency(),
+        dry_run=dry_run,
+        use_cache=use_cache,
+        on_result=lambda r: typer.echo(f"  {r.branch}: {r.status}"),
+        usage=usage,
+    )
+
+    from rich.console import Console
+    from rich.table import Table
+
+    table = Table(title=f"PRs against {base}")
+    for column in ("Branch", "Status", "Title", "URL / Error"):
+        table.add_column(column)
+    for r in results:
+        table.add_row(r.branch, r.status, r.title or "", r.url or r.error or "")
+    Console().print(table)
+    if usage.requests:
+        typer.echo(usage.summary())
+        record_usage("batch", get_model_name() or "", usage)
+
+    if any(r.status == "failed" for r in results):
+        raise typer.Exit(1)
+
+
+async def _get_prompt_diff(
+    base: str,
+    context: Optional[Union[int, str]] = None,
+    function_context: bool = False,
+    offline: bool = False,
+) -> tuple[str, list[str]]:
+    """Get the diff to generate PR content from, and the files left out of it.
+
+    context and function_context override LAZYPR_CONTEXT_LINES and
+    LAZYPR_FUNCTION_CONTEXT. offline diffs against the base branch as last
+    fetched.
+    """
+    if context is None:
+        context = get_context_lines()
+    function_context = function_context or get_function_context()
+
+    # Get the diff from the remote base branch; large and ignored files
+    # are excluded before git generates their patches
+    typer.echo(f"Getting diff from {base}...")
+    max_lines = get_max_diff_lines()
+    patterns = load_ignore_patterns()
+    with phase("diff"):
+        filtered = await asyncio.to_thread(
+            get_filtered_diff_remote,
+            base,
+            max_lines,
+            patterns,
+            fetch=not offline,
+            context=context,
+            function_context=function_context,
+        )
+
+    if not filtered.text.strip():
+        raise DiffError("No changes left after filtering")
+
+    omitted_files = [stat.summary() for stat in filtered.omitted]
+    if omitted_files:
+        typer.echo(f"Omitted {len(omitted_files)} large file(s) from the diff.")
+
+    prompt_diff = prepare_prompt_diff(filtered.text, context)
+    condensed, fitted, packed = (
+        prompt_diff.condensed,
+        prompt_diff.fitted,
+        prompt_diff.packed,
+    )
+    if condensed and condensed.saved_tokens > 0:
+        typer.echo(
+            f"Condensed diff, saving ~{condensed.saved_tokens} tokens: "
+            f"{condensed.cosmetic_hunks} whitespace or reordering hunk(s), "
+            f"{condensed.moved_blocks} moved block(s)."
+        )
+    if fitted and fitted.trimmed_lines:
+        typer.echo(
+            f"Narrowed diff context to save ~{fitted.saved_tokens} tokens: "
+            f"{fitted.trimmed_lines} context line(s) trimmed."
+        )
+    if packed and (packed.reduced_hunks or packed.reduced_files):
+        typer.echo(
+            f"Packed diff into ~{packed.tokens} tokens: {packed.full_hunks} "
+            f"hunk(s) in full, {packed.reduced_hunks} reduced to headers."
+        )
+    return prompt_diff.text, omitted_files
+
+
+async def _generate_locally(
+    agent_task: "asyncio.Task",
+    diff: str,
+    language: str,
+    omitted_files: list[str],
+    use_cache: bool,
+    usage: TokenUsage,
+) -> "PRContent":
+    """Generate PR content in this process, reusing a cached result if any."""
+    ai = await _import_ai()
+    with phase("cache lookup"):
+        cached = (
+            ai.get_cached_pr_content(diff, language, omitted_files)
+            if use_cache
+            else None
+        )
+    if cached is not None:
+        agent_task.cancel()
+        typer.echo("Using cached PR content (pass --no-cache to regenerate).")
+        return cached
+
+    with _live_view() as show_partial:
+        with phase("wait for agent"):
+            agent = await agent_task
+        with phase("generate"):
+            return await ai.generate_pr_content(
+                diff,
+                language,
+                omitted_files,
+                agent=agent,
+                use_cache=use_cache,
+                on_partial=show_partial,
+                usage=usage,
+            )
+
+
+@contextmanager
+def _live_view():
+    """Show a spinner, then PR content as it streams in.
+
+    Yields a callback that renders partial content. The final text is
+    printed separately, so the live view is cleared on exit.
+    """
+    from rich.live import Live
+    from rich.spinner import Spinner
+    from rich.text import Text
+
+    spinner = Spinner(
+        "dots", text=Text("Generating PR content with AI...", style="bold green")
+    )
+    with Live(spinner, transient=True) as live:
+        yield lambda partial: live.update(_render_partial(partial))
+
+
+def _usage_totals(usages: list[TokenUsage]) -> str:
+    """Describe the combined usage of several runs for `lazypr usage`."""
+    requests = sum(u.requests for u in usages)
+    input_tokens = sum(u.input_tokens for u in usages)
+    output_tokens = sum(u.output_tokens for u in usages)
+    cached_tokens = sum(u.cache_read_tokens for u in usages)
+    priced = [u.cost for u in usages if u.cost is not None]
+    cached = f" ({cached_tokens:,} cached)" if cached_tokens else ""
+    # Without a single priced run, a ~$0 total would only be misleading
+    cost = format_cost(sum(priced) if priced else None)
+    text = (
+        f"{len(usages)} run(s), {requests} request(s), {input_tokens:,} in{cached}, "
+        f"{output_tokens:,} out, {cost}"
+    )
+    if priced and len(priced) < len(usages):
+        text += f" ({len(usages) - len(priced)} run(s) with unknown price)"
+    return text
+
+
+async def _import_ai():
+    """Import lazypr.ai in a worker thread, keeping the event loop free."""
+    with phase("import AI stack"):
+        return await asyncio.to_thread(importlib.import_module, ".ai", __name__)
+
+
+async def _prepare_agent():
+    """Import the AI stack and prepare the PR agent."""
+    ai = await _import_ai()
+    return await ai.prepare_pr_agent()
+
+
+def _render_partial(content: "PRContent | daemon.DaemonContent") -> "Group":
+    """Render partially generated PR content for the live view."""
+    from rich.console import Group
+    from rich.text import Text
+
+    return Group(
+        Text.assemble(("Title: ", "bold"), content.title),
+        Text("Description:", style="bold"),
+        Text(content.description),
+    )
+
+
 def main() -> None:
     """Entry point for the CLI."""
     app()
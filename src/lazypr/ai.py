@@ -1,74 +1,72 @@
 """AI functions for PR content generation."""
 
-from typing import Optional
+import asyncio
+import inspect
+import json
+from typing import Any, Callable, Optional
 
+import httpx
 from pydantic import BaseModel, Field
 from pydantic_ai import Agent
-from pydantic_ai.models import ModelSettings
-
-from .config import get_model_name
-
-
-# Custom exceptions
-class AIError(Exception):
-    """Raised when AI generation fails."""
-
-    pass
-
-
-# Pydantic models
-class PRContent(BaseModel):
-    """PR title and description generated by AI."""
-
-    title: str = Field(description="Concise PR title (max 72 chars)")
-    description: str = Field(description="PR description summarizing the changes")
-
-
-def create_pr_agent() -> Agent:
-    """Create a PydanticAI agent for PR generation."""
-    model_name = get_model_name()
-
-    if not model_name:
-        raise AIError("LAZYPR_MODEL environment variable not set")
-
-    # Create agent with structured output
-    agent = Agent(
-        model=model_name,
-        output_type=PRContent,
-        system_prompt="""You are a helpful assistant that generates clear and professional pull request titles and descriptions from git diffs.
+from pydantic_ai.models import ModelSettings, infer_model
+from pydantic_ai.providers import infer_provider, infer_provider_class
+from pydantic_ai.usage import RunUsage
+
+from .cache import BranchState, load_cached, make_cache_key, store_cached
+from .config import (
+    get_context_tokens,
+    get_max_concurrency,
+    get_max_input_tokens,
+    get_model_name,
+    get_prompt_cache,
+)
+from .diff import file_diff_hashes, pack_diff, rebuild_diff_with_files, split_diff
+from .profiling import phase
+from .tokens import estimate_tokens
+from .usage import TokenUsage, estimate_cost
+
+# Bump whenever the prompt or output format changes, so cached PR content
+# generated with an older prompt is not reused.
+PROMPT_VERSION = "3"
+
+LANGUAGE_NAMES = {
+    "en": "English",
+    "pt": "Brazilian Portuguese",
+    "es": "Spanish",
+    "fr": "French",
+    "de": "German",
+    "zh": "Simplified Chinese",
+    "ja": "Japanese",
+    "ko": "Korean",
+    "it": "Italian",
+    "ru": "Russian",
+}
+
+# HTTP client shared by all providers, created on first use
+_http_client: Optional[Any] = None
+# Agents built by create_pr_agent(), keyed by model, settings and prompt cache
+_pr_agents: dict[tuple[str, str, str], Agent] = {}
+
+# Room left in each request for instructions around the diff chunk
+_PROMPT_OVERHEAD_TOKENS = 2000
+
+# Model settings per LAZYPR_PROMPT_CACHE mode. Each diff is usually sent
+# once, so "prefix" only caches the static system prompt and tool definitions;
+# writing the diff to the cache would cost more than it saves.
+_PROMPT_CACHE_SETTINGS: dict[str, dict[str, Any]] = {
+    "off": {},
+    "prefix": {"cache": {"messages": False}},
+    "all": {"cache": True},
+}
+
+_PR_SYSTEM_PROMPT = """You are a helpful assistant that generates clear and professional pull request titles and descriptions from git diffs.
 
 Always output valid JSON with fields: title (max 72 chars), description
-""",
-        model_settings=ModelSettings(
-            temperature=0.3,
-        ),
-    )
-
-    return agent
-
-
-async def generate_pr_content(diff: str, language: str = "en") -> PRContent:
-    """Generate PR title and description from diff using AI."""
-    agent = create_pr_agent()
-
-    # Build language instruction
-    language_names = {
-        "en": "English",
-        "pt": "Brazilian Portuguese",
-        "es": "Spanish",
-        "fr": "French",
-        "de": "German",
-        "zh": "Simplified Chinese",
-        "ja": "Japanese",
-        "ko": "Korean",
-        "it": "Italian",
-        "ru": "Russian",
-    }
-    lang_name = language_names.get(language, "English")
-
-    prompt = f"""You are an assistant specialized in documenting Pull Requests clearly and professionally.
+"""
 
-IMPORTANT: You must respond entirely in {lang_name}.
+# Static PR instructions, sent as part of the system prompt. Keep anything
+# that varies (language, diff) out of it so the prompt prefix stays cacheable.
+_PR_INSTRUCTIONS = """You are an assistant specialized in documenting Pull Requests clearly and professionally.
 
 Analyze the provided code diff and generate a PR description following this structure:
 
@@ -114,16 +112,698 @@ Use `##` markdown headings for each section title in the description (e.g. `## S
 - Don't copy commit messages directly
 - Don't be overly technical in the summary
 - Don't use conventional commits format in the title (no `fix:`, `feat:`, `chore:` prefixes)
+"""
 
----
+_CHUNK_SUMMARY_PROMPT = """Summarize this part of a pull request diff for a reviewer.
 
-Now generate the PR title and description for the following diff:
+- Group the changes by file or directory, 1-2 short bullets each
+- Mention behaviour changes, new or removed public APIs, and tests
+- Don't speculate beyond what the diff shows
 
 ```diff
-{diff}
-```
+{chunk}
+```"""
+
+_FILE_SUMMARY_PROMPT = """Summarize the changes to each file in this part of a pull request diff for a reviewer.
+
+- One or two short sentences per file
+- Mention behaviour changes, new or removed public APIs, and tests
+- Don't speculate beyond what the diff shows
+
+Answer with an object mapping each file path, exactly as in the diff, to its summary.
+
+```diff
+{chunk}
+```"""
+
+_MERGE_SUMMARY_PROMPT = """Merge these summaries of parts of one pull request into a single shorter summary.
+
+- Keep every behaviour change, API change and test change
+- Drop repetition and minor details
+
+{chunk}"""
+
+
+# Custom exceptions
+class AIError(Exception):
+    """Raised when AI generation fails."""
+
+    pass
+
+
+# Pydantic models
+class PRContent(BaseModel):
+    """PR title and description generated by AI."""
+
+    title: str = Field(description="Concise PR title (max 72 chars)")
+    description: str = Field(description="PR description summarizing the changes")
+
+
+def create_pr_agent(
+    model_name: Optional[str] = None, settings: Optional[ModelSettings] = None
+) -> Agent:
+    """Create a PydanticAI agent for PR generation.
+
+    Agents are memoized by model name and settings, so repeated calls in one
+    process reuse the same agent, model and provider client. Every provider
+    shares the HTTP client from get_http_client(), so keep-alive connections
+    survive across generations. Provider prompt caching is requested as set
+    by LAZYPR_PROMPT_CACHE, unless settings include a cache setting.
+
+    Args:
+        model_name: Model to use; defaults to LAZYPR_MODEL
+        settings: Model settings; defaults to a temperature of 0.3
+
+    Raises:
+        AIError: If no model is configured
+    """
+    model_name = model_name or get_model_name()
+
+    if not model_name:
+        raise AIError("LAZYPR_MODEL environment variable not set")
+
+    if settings is None:
+        settings = ModelSettings(temperature=0.3)
+    prompt_cache = get_prompt_cache()
+    # Settings may hold dicts and lists (extra_headers, stop_sequences), so
+    # key on a canonical serialization instead of the values themselves
+    key = (
+        model_name,
+        json.dumps(settings, sort_keys=True, default=repr),
+        prompt_cache,
+    )
+    agent = _pr_agents.get(key)
+    if agent is None:
+        agent = _pr_agents[key] = _build_pr_agent(model_name, settings, prompt_cache)
+    return agent
+
+
+def get_http_client() -> Any:
+    """Return the HTTP client shared by every model provider lazypr creates.
+
+    This is an httpx.AsyncClient, or an httpx2.AsyncClient with pydantic-ai
+    versions whose providers have moved to httpx2. Pooled connections belong
+    to the event loop that opened them, so use lazypr from a single event
+    loop, or call close_http_client() before that loop ends.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _new_http_client()
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client and forget agents built around it."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    _pr_agents.clear()
+
+
+async def prepare_pr_agent() -> Agent:
+    """Build the PR agent and open a connection to its provider.
+
+    Neither step depends on the diff, so callers can run this concurrently
+    with fetching and diffing to take it off the time to first token.
+    """
+    with phase("create agent"):
+        agent = await asyncio.to_thread(create_pr_agent)
+    with phase("warm up connection"):
+        await warm_up_model(agent.model)
+    return agent
+
+
+async def warm_up_model(model: Any, timeout: float = 5.0) -> None:
+    """Open a keep-alive connection to the model provider ahead of time.
+
+    Sends a HEAD request to the provider's base URL through the model's own
+    HTTP client, so the DNS lookup and TLS handshake are done and pooled
+    before the real request. Best effort: any failure is ignored.
+    """
+    base_url = getattr(model, "base_url", None)
+    sdk_client = getattr(model, "client", None)
+    http_client = getattr(sdk_client, "_client", None)
+    head = getattr(http_client, "head", None)
+    if not base_url or head is None:
+        return
+    try:
+        await head(base_url, timeout=timeout)
+    except Exception:
+        pass
+
+
+def get_cached_pr_content(
+    diff: str, language: str = "en", omitted_files: Optional[list[str]] = None
+) -> Optional[PRContent]:
+    """Return PR content previously generated for the same inputs, if any.
+
+    The cache key covers the diff, omitted files, model name, language and
+    PROMPT_VERSION.
+    """
+    value = load_cached(_pr_cache_key(diff, language, omitted_files))
+    if value is None:
+        return None
+    try:
+        return PRContent.model_validate(value)
+    except ValueError:
+        return None
+
+
+async def generate_pr_content(
+    diff: str,
+    language: str = "en",
+    omitted_files: Optional[list[str]] = None,
+    agent: Optional[Agent] = None,
+    use_cache: bool = False,
+    on_partial: Optional[Callable[[PRContent], None]] = None,
+    usage: Optional[TokenUsage] = None,
+) -> PRContent:
+    """Generate PR title and description from diff using AI.
+
+    omitted_files lists one-line summaries of changed files that were left
+    out of the diff, so the model still knows they changed. Pass an agent
+    from prepare_pr_agent() to reuse an already warmed-up one. With
+    use_cache, a result cached for the same inputs is returned without
+    calling the model, and new results are stored. With on_partial, the
+    output is streamed and on_partial is called with each partial
+    PRContent as it arrives; the returned object is still fully validated.
+    With usage, the estimated and reported tokens of every model request,
+    and their estimated cost, are added to it.
+
+    If the prompt is estimated over LAZYPR_MAX_INPUT_TOKENS, the diff is
+    packed to fit before any request is sent.
+
+    Raises:
+        AIError: If the prompt cannot fit in LAZYPR_MAX_INPUT_TOKENS
+    """
+    if use_cache:
+        cached = get_cached_pr_content(diff, language, omitted_files)
+        if cached is not None:
+            return cached
+
+    lang_name = LANGUAGE_NAMES.get(language, "English")
+    prompt_diff = diff
+    estimated = _estimate_input_tokens(diff, lang_name, omitted_files)
+    max_input_tokens = get_max_input_tokens()
+    if max_input_tokens and estimated > max_input_tokens:
+        prompt_diff, estimated = _fit_input_budget(
+            diff,
+            estimated,
+            max_input_tokens,
+            lambda packed: _estimate_input_tokens(packed, lang_name, omitted_files),
+        )
+
+    if agent is None:
+        agent = create_pr_agent()
+
+    run_usage = RunUsage()
+    try:
+        if estimate_tokens(prompt_diff) > get_context_tokens():
+            # Too large for one prompt: summarize chunks first, then reduce
+            with phase("summarize diff"):
+                summaries = await summarize_diff(
+                    prompt_diff, agent.model, usage=run_usage
+                )
+            changes = (
+                "Now generate the PR title and description from the following "
+                "summaries of the diff, which was too large to include directly. "
+                "Each summary covers a group of files:\n\n" + "\n\n".join(summaries)
+            )
+        else:
+            changes = _diff_changes(prompt_diff)
+        changes += _omitted_listing(omitted_files)
+
+        prompt = _build_pr_prompt(lang_name, changes)
+        output = await _run_pr_prompt(agent, prompt, on_partial, run_usage)
+    finally:
+        if usage is not None:
+            usage.add(_token_usage(run_usage, agent.model, estimated))
+    if use_cache and isinstance(output, PRContent):
+        store_cached(_pr_cache_key(diff, language, omitted_files), output.model_dump())
+    return output
+
+
+async def update_pr_content(
+    diff: str,
+    state: Optional[BranchState],
+    language: str = "en",
+    omitted_files: Optional[list[str]] = None,
+    agent: Optional[Agent] = None,
+    on_partial: Optional[Callable[[PRContent], None]] = None,
+    usage: Optional[TokenUsage] = None,
+) -> tuple[PRContent, BranchState]:
+    """Regenerate PR content, sending only the files changed since last time.
+
+    Files whose changes hash the same as in state keep their summaries;
+    the others are summarized per file, and the previous title and
+    description are then updated from the summaries. Without a state, the
+    content is generated from the whole diff. When no file changed, the
+    previous content is returned without calling the model.
+
+    Like generate_pr_content(), the changed files' diff is packed if the
+    requests are estimated over LAZYPR_MAX_INPUT_TOKENS.
+
+    Args:
+        diff: The branch diff
+        state: The branch's state from the last generation, if any
+        language: Language code of the content
+        omitted_files: Summaries of files left out of the diff
+        agent: The PR agent; defaults to create_pr_agent()
+        on_partial: Called with partial content while it streams in
+        usage: Accumulates the tokens and cost of the model requests
+
+    Returns:
+        The new content and the branch state to store for the next update
+
+    Raises:
+        AIError: If the requests cannot fit in LAZYPR_MAX_INPUT_TOKENS
+    """
+    hashes = file_diff_hashes(diff)
+    if state is None:
+        content = await generate_pr_content(
+            diff,
+            language,
+            omitted_files,
+            agent=agent,
+            on_partial=on_partial,
+            usage=usage,
+        )
+        return content, BranchState(content.title, content.description, hashes)
+
+    changed = [path for path, h in hashes.items() if state.file_hashes.get(path) != h]
+    removed = sorted(set(state.file_hashes) - set(hashes))
+    summaries = {
+        path: summary
+        for path, summary in state.summaries.items()
+        if path in hashes and path not in changed
+    }
+    if not changed and not removed:
+        content = PRContent(title=state.title, description=state.description)
+        return content, BranchState(
+            content.title, content.description, hashes, summaries
+        )
+
+    lang_name = LANGUAGE_NAMES.get(language, "English")
+    changed_diff = rebuild_diff_with_files(diff, changed)
+    # The new summaries are not known yet; estimate them as empty
+    pending = {**summaries, **{path: "" for path in changed}}
+
+    def estimate(changed_diff: str) -> int:
+        return _estimate_update_tokens(
+            changed_diff, state, changed, removed, pending, lang_name, omitted_files
+        )
+
+    estimated = estimate(changed_diff)
+    max_input_tokens = get_max_input_tokens()
+    if max_input_tokens and estimated > max_input_tokens:
+        changed_diff, estimated = _fit_input_budget(
+            changed_diff, estimated, max_input_tokens, estimate
+        )
+
+    if agent is None:
+        agent = create_pr_agent()
+    run_usage = RunUsage()
+    try:
+        if changed:
+            with phase("summarize changed files"):
+                new_summaries = await summarize_files(
+                    changed_diff, agent.model, usage=run_usage
+                )
+            summaries.update(
+                (path, new_summaries.get(path, "Changed.")) for path in changed
+            )
+        # Check again with the summaries the model actually wrote
+        estimated = _estimate_update_tokens(
+            changed_diff, state, changed, removed, summaries, lang_name, omitted_files
+        )
+        if max_input_tokens and estimated > max_input_tokens:
+            raise AIError(
+                f"PR update prompt needs ~{estimated:,} tokens, "
+                f"over LAZYPR_MAX_INPUT_TOKENS ({max_input_tokens:,})"
+            )
+        changes = _update_changes(state, changed, removed, summaries)
+        prompt = _build_pr_prompt(lang_name, changes + _omitted_listing(omitted_files))
+        output = await _run_pr_prompt(agent, prompt, on_partial, run_usage)
+    finally:
+        if usage is not None:
+            usage.add(_token_usage(run_usage, agent.model, estimated))
+    return output, BranchState(output.title, output.description, hashes, summaries)
+
+
+async def summarize_files(
+    diff: str,
+    model: Any,
+    max_tokens: Optional[int] = None,
+    max_concurrency: Optional[int] = None,
+    usage: Optional[RunUsage] = None,
+) -> dict[str, str]:
+    """Summarize each file of a diff separately.
+
+    Like summarize_diff(), the diff is split into groups of whole files
+    summarized concurrently, but each request returns one summary per file.
+
+    Args:
+        diff: The diff text
+        model: The model to summarize with
+        max_tokens: Token limit per request; defaults to LAZYPR_CONTEXT_TOKENS
+            minus room for the instructions
+        max_concurrency: Parallel requests; defaults to LAZYPR_MAX_CONCURRENCY
+        usage: Accumulates the tokens used by the summary requests
+
+    Returns:
+        A summary per file path; files the model left out are missing
+    """
+    if max_tokens is None:
+        max_tokens = max(1000, get_context_tokens() - _PROMPT_OVERHEAD_TOKENS)
+    if max_concurrency is None:
+        max_concurrency = get_max_concurrency()
+
+    agent = create_summary_agent(model, output_type=dict[str, str])
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def summarize(chunk: str) -> dict[str, str]:
+        async with semaphore:
+            prompt = _FILE_SUMMARY_PROMPT.format(chunk=chunk)
+            return (await agent.run(prompt, usage=usage)).output
+
+    summaries: dict[str, str] = {}
+    for result in await asyncio.gather(
+        *(summarize(c) for c in split_diff(diff, max_tokens))
+    ):
+        summaries.update(result)
+    return summaries
+
+
+async def summarize_diff(
+    diff: str,
+    model: Any,
+    max_tokens: Optional[int] = None,
+    max_concurrency: Optional[int] = None,
+    usage: Optional[RunUsage] = None,
+) -> list[str]:
+    """Summarize a large diff in chunks (the map step of map-reduce).
+
+    The diff is split into groups of whole files that each fit in max_tokens
+    and the groups are summarized concurrently, at most max_concurrency at a
+    time. If the summaries together still exceed max_tokens they are
+    summarized again, so the result always fits in one prompt.
+
+    Args:
+        diff: The diff text
+        model: The model to summarize with
+        max_tokens: Token limit per request; defaults to LAZYPR_CONTEXT_TOKENS
+            minus room for the instructions
+        max_concurrency: Parallel requests; defaults to LAZYPR_MAX_CONCURRENCY
+        usage: Accumulates the tokens used by the summary requests
+
+    Returns:
+        One summary per chunk, in diff order
+    """
+    if max_tokens is None:
+        max_tokens = max(1000, get_context_tokens() - _PROMPT_OVERHEAD_TOKENS)
+    if max_concurrency is None:
+        max_concurrency = get_max_concurrency()
+
+    agent = create_summary_agent(model)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def summarize(template: str, chunk: str) -> str:
+        async with semaphore:
+            result = await agent.run(template.format(chunk=chunk), usage=usage)
+            return result.output
+
+    summaries = await asyncio.gather(
+        *(summarize(_CHUNK_SUMMARY_PROMPT, c) for c in split_diff(diff, max_tokens))
+    )
+    # Reduce level by level until the summaries fit in a single prompt
+    while len(summaries) > 1 and estimate_tokens("\n\n".join(summaries)) > max_tokens:
+        groups = _group_texts(summaries, max_tokens)
+        summaries = await asyncio.gather(
+            *(summarize(_MERGE_SUMMARY_PROMPT, g) for g in groups)
+        )
+    return list(summaries)
+
+
+def create_summary_agent(model: Any, output_type: Any = str) -> Agent:
+    """Create an agent that summarizes parts of a diff, as plain text by default."""
+    return Agent(
+        model=model,
+        output_type=output_type,
+        system_prompt="You summarize parts of git diffs accurately and concisely.",
+        model_settings=ModelSettings(
+            temperature=0.3,
+        ),
+    )
+
+
+async def _run_pr_prompt(
+    agent: Agent,
+    prompt: str,
+    on_partial: Optional[Callable[[PRContent], None]],
+    usage: RunUsage,
+) -> PRContent:
+    """Run the PR agent on a prompt, streaming if on_partial is given."""
+    with phase("model"):
+        if on_partial is None:
+            return (await agent.run(prompt, usage=usage)).output
+        return await _stream_pr_content(agent, prompt, on_partial, usage)
+
+
+async def _stream_pr_content(
+    agent: Agent,
+    prompt: str,
+    on_partial: Callable[[PRContent], None],
+    usage: Optional[RunUsage] = None,
+) -> PRContent:
+    """Run the agent with structured streaming, reporting partial output."""
+    async with agent.run_stream(prompt, usage=usage) as result:
+        # Partials only validate once every field has started, so the title
+        # shows up complete and the description then grows token by token
+        async for partial in result.stream_output(debounce_by=0.05):
+            on_partial(partial)
+        output = await result.get_output()
+    return PRContent.model_validate(output)
+
+
+def _build_pr_agent(
+    model_name: str, settings: ModelSettings, prompt_cache: str
+) -> Agent:
+    """Build the PR agent for a model name and settings."""
+    model_settings = ModelSettings(**_PROMPT_CACHE_SETTINGS[prompt_cache])
+    model_settings.update(settings)
+    # Create agent with structured output. Resolving the model here builds the
+    # provider client up front instead of on the first request.
+    return Agent(
+        model=infer_model(model_name, provider_factory=_create_provider),
+        output_type=PRContent,
+        system_prompt=(_PR_SYSTEM_PROMPT, _PR_INSTRUCTIONS),
+        model_settings=model_settings,
+    )
+
+
+def _create_provider(provider_name: str) -> Any:
+    """Create a model provider that uses the shared HTTP client when it can."""
+    if provider_name.startswith("gateway/"):
+        return infer_provider(provider_name)
+    try:
+        provider_class = infer_provider_class(provider_name)
+    except ValueError as e:
+        raise AIError(f"Unknown model provider '{provider_name}'") from e
+    if "http_client" in inspect.signature(provider_class).parameters:
+        try:
+            return provider_class(http_client=get_http_client())
+        except TypeError:
+            # The provider's SDK needs a different client type
+            pass
+    return provider_class()
+
+
+def _new_http_client() -> Any:
+    """Create an HTTP client of the type the installed providers expect."""
+    try:
+        from pydantic_ai.models import create_async_httpx2_client
+    except ImportError:
+        return httpx.AsyncClient(timeout=httpx.Timeout(timeout=600, connect=5))
+    return create_async_httpx2_client()
+
+
+def _group_texts(texts: list[str], max_tokens: int) -> list[str]:
+    """Join consecutive texts into groups of at most max_tokens each."""
+    groups: list[str] = []
+    current: list[str] = []
+    current_tokens = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and current_tokens + tokens > max_tokens:
+            groups.append("\n\n".join(current))
+            current = []
+            current_tokens = 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append("\n\n".join(current))
+    # Always make progress, even if every text is larger than max_tokens
+    if len(groups) == len(texts) and len(texts) > 1:
+        groups = ["\n\n".join(texts[i : i + 2]) for i in range(0, len(texts), 2)]
+    return groups
+
+
+def _diff_changes(diff: str) -> str:
+    """Describe the changes for the PR prompt with the diff inline."""
+    return (
+        "Now generate the PR title and description for the following diff:"
+        f"\n\n```diff\n{diff}\n```"
+    )
 
-Provide output as JSON with fields: title, description"""
 
-    result = await agent.run(prompt)
-    return result.output
+def _update_changes(
+    state: BranchState,
+    changed: list[str],
+    removed: list[str],
+    summaries: dict[str, str],
+) -> str:
+    """Describe the changes for the PR prompt of an incremental update."""
+    sections = [
+        "Now update this PR title and description, written for an earlier "
+        "version of the branch, so they describe the whole branch as it is "
+        "now. Keep what is still accurate.",
+        f"Previous title: {state.title}\n\nPrevious description:\n{state.description}",
+    ]
+    if changed:
+        listing = "\n".join(f"- {path}: {summaries[path]}" for path in changed)
+        sections.append(f"Files changed since then:\n{listing}")
+    if removed:
+        listing = "\n".join(f"- {path}" for path in removed)
+        sections.append(f"Files the branch no longer changes:\n{listing}")
+    unchanged = [path for path in summaries if path not in changed]
+    if unchanged:
+        listing = "\n".join(f"- {path}: {summaries[path]}" for path in unchanged)
+        sections.append(f"Other changed files, unchanged since then:\n{listing}")
+    return "\n\n".join(sections)
+
+
+def _omitted_listing(omitted_files: Optional[list[str]]) -> str:
+    """List files left out of the diff for the PR prompt, if any."""
+    if not omitted_files:
+        return ""
+    listing = "\n".join(f"- {f}" for f in omitted_files)
+    return (
+        "\n\nThese files also changed but were left out of the diff because "
+        f"they are too large:\n{listing}"
+    )
+
+
+def _estimate_input_tokens(
+    diff: str, lang_name: str, omitted_files: Optional[list[str]]
+) -> int:
+    """Estimate the input tokens of generating PR content for a diff.
+
+    Counts the system prompt and the user prompt with the whole diff inline.
+    Diffs that get summarized first cost somewhat more than this.
+    """
+    prompt = _build_pr_prompt(
+        lang_name, _diff_changes(diff) + _omitted_listing(omitted_files)
+    )
+    system_tokens = estimate_tokens(_PR_SYSTEM_PROMPT + _PR_INSTRUCTIONS)
+    return system_tokens + estimate_tokens(prompt)
+
+
+def _estimate_update_tokens(
+    changed_diff: str,
+    state: BranchState,
+    changed: list[str],
+    removed: list[str],
+    summaries: dict[str, str],
+    lang_name: str,
+    omitted_files: Optional[list[str]],
+) -> int:
+    """Estimate the input tokens of an incremental update.
+
+    Counts the summarize_files() requests for changed_diff and the PR
+    prompt built from the summaries.
+    """
+    max_tokens = max(1000, get_context_tokens() - _PROMPT_OVERHEAD_TOKENS)
+    chunks = split_diff(changed_diff, max_tokens) if changed_diff else []
+    changes = _update_changes(state, changed, removed, summaries)
+    prompt = _build_pr_prompt(lang_name, changes + _omitted_listing(omitted_files))
+    return sum(
+        estimate_tokens(_FILE_SUMMARY_PROMPT.format(chunk=chunk)) for chunk in chunks
+    ) + estimate_tokens(_PR_SYSTEM_PROMPT + _PR_INSTRUCTIONS + prompt)
+
+
+def _fit_input_budget(
+    diff: str,
+    estimated: int,
+    max_input_tokens: int,
+    estimate: Callable[[str], int],
+) -> tuple[str, int]:
+    """Pack a diff so the prompts sending it fit in max_input_tokens.
+
+    Args:
+        diff: The diff to pack
+        estimated: The input token estimate with the diff as is
+        max_input_tokens: The limit to fit in
+        estimate: Estimates the input tokens with a packed diff
+
+    Returns:
+        The packed diff and the new input token estimate
+
+    Raises:
+        AIError: If the prompt is still over the limit with the diff packed
+    """
+    overhead = estimated - estimate_tokens(diff)
+    packed = pack_diff(diff, max(0, max_input_tokens - overhead))
+    estimated = estimate(packed.text)
+    if estimated > max_input_tokens:
+        raise AIError(
+            f"PR prompt needs ~{estimated:,} tokens even with the diff packed, "
+            f"over LAZYPR_MAX_INPUT_TOKENS ({max_input_tokens:,})"
+        )
+    return packed.text, estimated
+
+
+def _token_usage(run_usage: RunUsage, model: Any, estimated: int) -> TokenUsage:
+    """Convert pydantic-ai usage to TokenUsage, pricing it for the model."""
+    cost: Optional[float] = 0.0
+    if run_usage.requests:
+        cost = estimate_cost(
+            model.model_name,
+            getattr(model, "system", None),
+            run_usage.input_tokens,
+            run_usage.output_tokens,
+            cache_read_tokens=run_usage.cache_read_tokens,
+            cache_write_tokens=run_usage.cache_write_tokens,
+        )
+    return TokenUsage(
+        requests=run_usage.requests,
+        input_tokens=run_usage.input_tokens,
+        output_tokens=run_usage.output_tokens,
+        estimated_tokens=estimated,
+        cost=cost,
+        cache_read_tokens=run_usage.cache_read_tokens,
+        cache_write_tokens=run_usage.cache_write_tokens,
+    )
+
+
+def _build_pr_prompt(lang_name: str, changes: str) -> str:
+    """Build the user prompt: the parts that vary between runs.
+
+    Everything static is in the system prompt, ahead of this, so it forms a
+    byte-stable prefix that providers can serve from their prompt cache.
+    """
+    return (
+        f"IMPORTANT: You must respond entirely in {lang_name}.\n\n{changes}\n\n"
+        "Provide output as JSON with fields: title, description"
+    )
+
+
+def _pr_cache_key(diff: str, language: str, omitted_files: Optional[list[str]]) -> str:
+    """Build the cache key for generated PR content."""
+    return make_cache_key(
+        PROMPT_VERSION,
+        get_model_name() or "",
+        language,
+        "\n".join(omitted_files or []),
+        diff,
+    )
@@ -0,0 +1,291 @@
+"""Batch mode: generate and open PRs for many branches at once."""
+
+import asyncio
+import fnmatch
+import subprocess
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from .config import (
+    get_context_lines,
+    get_function_context,
+    get_max_diff_lines,
+    get_rate_limit,
+)
+from .diff import (
+    DiffError,
+    get_filtered_diff_remote,
+    prepare_prompt_diff,
+)
+from .usage import TokenUsage
+
+# Retries for requests the provider rejects with HTTP 429
+_MAX_RATE_LIMIT_RETRIES = 3
+_RATE_LIMIT_BACKOFF_SECONDS = 5.0
+
+
+@dataclass
+class BatchResult:
+    """Outcome of one branch in a batch run."""
+
+    branch: str
+    status: str = "pending"
+    title: Optional[str] = None
+    url: Optional[str] = None
+    error: Optional[str] = None
+
+
+class RateLimiter:
+    """Space out requests so at most rate_per_minute start each minute."""
+
+    def __init__(self, rate_per_minute: float):
+        self._interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until the next request may start."""
+        if not self._interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_start - now
+            self._next_start = max(now, self._next_start) + self._interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def resolve_branches(
+    branches: list[str], pattern: Optional[str], remote: str = "origin"
+) -> list[str]:
+    """Combine explicit branches with remote branches matching a glob.
+
+    Args:
+        branches: Branch names given explicitly
+        pattern: Glob over ``git branch -r``, with or without the remote
+            prefix (e.g. "release/*" or "origin/release/*")
+        remote: The remote the branches live on
+
+    Returns:
+        Branch names without the remote prefix, in order and deduplicated
+
+    Raises:
+        DiffError: If an explicit branch is not on the remote
+    """
+    prefix = f"{remote}/"
+    result = subprocess.run(
+        ["git", "branch", "-r"], capture_output=True, text=True, check=True
+    )
+    remote_branches = [
+        ref.removeprefix(prefix)
+        for ref in (line.strip() for line in result.stdout.splitlines())
+        if ref.startswith(prefix) and " -> " not in ref
+    ]
+
+    missing = [b for b in branches if b not in remote_branches]
+    if missing:
+        raise DiffError(f"Branches not found on '{remote}': {', '.join(missing)}")
+
+    resolved = list(branches)
+    if pattern:
+        pattern = pattern.removeprefix(prefix)
+        resolved += [b for b in remote_branches if fnmatch.fnmatchcase(b, pattern)]
+    return list(dict.fromkeys(resolved))
+
+
+def fetch_branches(
+    base: str, branches: Optional[list[str]], remote: str = "origin"
+) -> None:
+    """Fetch the base branch and every batch branch with a single git fetch.
+
+    Args:
+        base: The base branch name
+        branches: Branches to fetch, or None to fetch every remote branch
+            (needed before resolving a glob)
+        remote: The remote to fetch from
+
+    Raises:
+        DiffError: If the fetch fails
+    """
+    if branches is None:
+        cmd = ["git", "fetch", "--prune", remote]
+    else:
+        cmd = ["git", "fetch", remote] + [
+            f"+refs/heads/{b}:refs/remotes/{remote}/{b}"
+            for b in dict.fromkeys([base, *branches])
+        ]
+    try:
+        subprocess.run(
+            cmd,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except subprocess.CalledProcessError as e:
+        error_msg = e.stderr.strip() if e.stderr else str(e)
+        raise DiffError(f"Failed to fetch branches: {error_msg}") from e
+
+
+async def run_batch(
+    base: str,
+    branches: list[str],
+    open_pr: Callable[..., str],
+    language: str = "en",
+    patterns: Optional[list[str]] = None,
+    max_concurrency: int = 4,
+    dry_run: bool = False,
+    use_cache: bool = True,
+    remote: str = "origin",
+    executor: Optional[Executor] = None,
+    on_result: Optional[Callable[[BatchResult], None]] = None,
+    usage: Optional[TokenUsage] = None,
+) -> list[BatchResult]:
+    """Generate PR content for many branches and open their PRs.
+
+    Expects the base and all branches to be fetched already, see
+    fetch_branches(). Diffs are computed in a thread pool, and each
+    branch's generation starts as soon as its diff is ready, with at most
+    max_concurrency model requests in flight. Requests to the provider are
+    spaced to LAZYPR_RATE_LIMIT per minute, and requests it rejects with
+    HTTP 429 are retried after its Retry-After delay or an exponential
+    backoff. PRs are opened one by one at the end, through open_pr.
+
+    Args:
+        base: The base branch name (e.g., "main")
+        branches: Branch names on the remote
+        open_pr: Called as open_pr(title, description, base, web=False,
+            head=branch) and returns the PR URL; normally create_pr
+        language: Language code for the PR content
+        patterns: .lazyprignore patterns for files to drop
+        max_concurrency: Maximum concurrent model requests
+        dry_run: Generate content without opening PRs
+        use_cache: Reuse and store generated content in the PR cache
+        remote: The remote the branches live on
+        executor: Executor for the diffs; defaults to a thread pool
+        on_result: Called as each branch finishes generating
+        usage: Accumulates the tokens and cost of every model request
+
+    Returns:
+        One result per branch, in the order given
+    """
+    from . import ai
+
+    agent = await ai.prepare_pr_agent()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limiter = RateLimiter(get_rate_limit())
+    max_lines = get_max_diff_lines()
+    context = get_context_lines()
+    function_context = get_function_context()
+    loop = asyncio.get_running_loop()
+    # Threads, not processes: the diffs mostly wait on git subprocesses, and
+    # forking after the agent has started threads is unsafe
+    pool = executor or ThreadPoolExecutor(max_workers=min(len(branches), 8) or 1)
+
+    async def generate(branch: str) -> tuple[BatchResult, Any]:
+        result = BatchResult(branch=branch)
+        try:
+            filtered = await loop.run_in_executor(
+                pool,
+                get_filtered_diff_remote,
+                base,
+                max_lines,
+                patterns,
+                remote,
+                f"{remote}/{branch}",
+                False,
+                context,
+                function_context,
+            )
+            if not filtered.text.strip():
+                result.status = "skipped"
+                result.error = "No changes left after filtering"
+                return result, None
+            omitted_files = [stat.summary() for stat in filtered.omitted]
+            diff = prepare_prompt_diff(filtered.text, context).text
+            async with semaphore:
+                content = await _generate_with_backoff(
+                    ai,
+                    limiter,
+                    diff,
+                    language,
+                    omitted_files,
+                    agent,
+                    use_cache,
+                    usage,
+                )
+            result.status = "generated"
+            result.title = content.title
+            return result, content
+        except Exception as e:
+            result.status = "failed"
+            result.error = str(e) or type(e).__name__
+            return result, None
+        finally:
+            if on_result is not None:
+                on_result(result)
+
+    try:
+        generated = await asyncio.gather(*(generate(b) for b in branches))
+    finally:
+        if executor is None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    for result, content in generated:
+        if content is None or dry_run:
+            continue
+        try:
+            result.url = await asyncio.to_thread(
+                open_pr,
+                content.title,
+                content.description,
+                base,
+                web=False,
+                head=result.branch,
+            )
+            result.status = "created"
+        except Exception as e:
+            result.status = "failed"
+            result.error = str(e) or type(e).__name__
+    return [result for result, _ in generated]
+
+
+async def _generate_with_backoff(
+    ai: Any,
+    limiter: RateLimiter,
+    diff: str,
+    language: str,
+    omitted_files: list[str],
+    agent: Any,
+    use_cache: bool,
+    usage: Optional[TokenUsage],
+) -> Any:
+    """Generate PR content, backing off when the provider rate limits us."""
+    for attempt in range(_MAX_RATE_LIMIT_RETRIES + 1):
+        await limiter.acquire()
+        try:
+            return await ai.generate_pr_content(
+                diff,
+                language,
+                omitted_files,
+                agent=agent,
+                use_cache=use_cache,
+                usage=usage,
+            )
+        except Exception as e:
+            if (
+                getattr(e, "status_code", None) != 429
+                or attempt == _MAX_RATE_LIMIT_RETRIES
+            ):
+                raise
+            await asyncio.sleep(_retry_delay(e, attempt))
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Seconds to wait before retrying a rate limited request."""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return _RATE_LIMIT_BACKOFF_SECONDS * 2**attempt
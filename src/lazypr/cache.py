@@ -0,0 +1,192 @@
+"""On-disk cache of generated PR content and per-branch generation state."""
+
+import hashlib
+import json
+import os
+import subprocess
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from .config import get_cache_max_bytes
+
+
+@dataclass
+class CacheEntry:
+    """A cached item as listed by list_cache_entries()."""
+
+    key: str
+    path: Path
+    size: int
+    last_used: float
+
+
+@dataclass
+class BranchState:
+    """What the last generation for a branch was based on and produced.
+
+    file_hashes maps each file in the diff to file_diff_hashes() of its
+    changes, and summaries holds the per-file summaries made so far, so
+    `lazypr update` only has to summarize files that changed since.
+    """
+
+    title: str
+    description: str
+    file_hashes: dict[str, str] = field(default_factory=dict)
+    summaries: dict[str, str] = field(default_factory=dict)
+
+
+def get_cache_dir() -> Path:
+    """Return the lazypr cache directory.
+
+    Uses $XDG_CACHE_HOME/lazypr, falling back to ~/.cache/lazypr.
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(base) / "lazypr"
+
+
+def make_cache_key(*parts: str) -> str:
+    """Build a content-addressed key from the given parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        encoded = part.encode("utf-8")
+        # Length-prefix each part so ("ab", "c") and ("a", "bc") differ
+        digest.update(len(encoded).to_bytes(8, "big"))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+def load_cached(key: str) -> Optional[dict]:
+    """Load a cached value, marking it as recently used.
+
+    Returns None when the key is missing or the entry is unreadable.
+    """
+    path = _entry_path(key)
+    try:
+        with open(path, "r") as f:
+            value = json.load(f)
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def store_cached(key: str, value: dict) -> None:
+    """Store a value and evict least recently used entries over the size limit.
+
+    Failures are ignored: the cache is an optimization, never a requirement.
+    """
+    path = _entry_path(key)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError):
+        return
+    prune_cache()
+
+
+def branch_state_key(branch: str, base: str, repo: Optional[Path] = None) -> str:
+    """Build the cache key of a branch's state in a repository.
+
+    Args:
+        branch: The branch the PR is for
+        base: The branch the PR is against
+        repo: The repository directory; defaults to the root of the current
+            one, so the key is the same from any of its subdirectories
+    """
+    return make_cache_key("branch", str(repo or _repo_root()), base, branch)
+
+
+def _repo_root() -> Path:
+    """Return the current repository's root, or the current directory."""
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--show-toplevel"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (subprocess.CalledProcessError, OSError):
+        return Path.cwd()
+    return Path(result.stdout.strip() or Path.cwd())
+
+
+def load_branch_state(key: str) -> Optional[BranchState]:
+    """Load the state stored for a branch, or None if there is none."""
+    value = load_cached(key)
+    if value is None:
+        return None
+    try:
+        return BranchState(**value)
+    except TypeError:
+        return None
+
+
+def store_branch_state(key: str, state: BranchState) -> None:
+    """Store the state of a branch's latest generation."""
+    store_cached(key, asdict(state))
+
+
+def list_cache_entries() -> list[CacheEntry]:
+    """List cache entries, most recently used first."""
+    entries: list[CacheEntry] = []
+    entries_dir = get_cache_dir() / "pr"
+    if not entries_dir.is_dir():
+        return entries
+    for path in entries_dir.glob("*.json"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append(
+            CacheEntry(
+                key=path.stem, path=path, size=stat.st_size, last_used=stat.st_mtime
+            )
+        )
+    entries.sort(key=lambda entry: entry.last_used, reverse=True)
+    return entries
+
+
+def prune_cache(max_bytes: Optional[int] = None) -> int:
+    """Evict least recently used entries until the cache fits in max_bytes.
+
+    Args:
+        max_bytes: Size limit; defaults to LAZYPR_CACHE_MAX_BYTES. Use 0 to
+            clear the cache.
+
+    Returns:
+        The number of entries removed
+    """
+    if max_bytes is None:
+        max_bytes = get_cache_max_bytes()
+
+    removed = 0
+    total = 0
+    for entry in list_cache_entries():
+        total += entry.size
+        if total <= max_bytes:
+            continue
+        try:
+            entry.path.unlink()
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def format_age(timestamp: float) -> str:
+    """Describe how long ago a timestamp was, e.g. "5m ago"."""
+    seconds = max(0, int(time.time() - timestamp))
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size:
+            return f"{seconds // size}{unit} ago"
+    return f"{seconds}s ago"
+
+
+def _entry_path(key: str) -> Path:
+    """Return the file path for a cache key."""
+    return get_cache_dir() / "pr" / f"{key}.json"
@@ -1,18 +1,154 @@
 """Configuration functions for LazyPR."""
 
 import os
-from typing import Optional
+from typing import Optional, Union
 
 from .config_file import get_github_token as _get_github_token_from_config
 
 
 def get_max_diff_lines() -> int:
-    """Get max diff lines from environment variable."""
-    value = os.environ.get("LAZYPR_MAX_DIFF_LINES", "1000")
+    """Get max diff lines from environment variable.
+
+    With a token budget set, the default is raised to a safety cap: files
+    over the budget are reduced by pack_diff() instead of dropped.
+    """
+    default = 20000 if get_token_budget() > 0 else 1000
+    value = os.environ.get("LAZYPR_MAX_DIFF_LINES", str(default))
+    try:
+        return int(value)
+    except ValueError:
+        return default
+
+
+def get_token_budget() -> int:
+    """Get the token budget the diff is packed into (0 disables packing)."""
+    value = os.environ.get("LAZYPR_TOKEN_BUDGET", "0")
+    try:
+        return max(0, int(value))
+    except ValueError:
+        return 0
+
+
+def get_condense_diff() -> bool:
+    """Check whether diffs are condensed before prompting (on by default).
+
+    Condensing drops whitespace-only and reordering hunks, collapses moved
+    blocks and trims context lines; see condense_diff().
+    """
+    return os.environ.get("LAZYPR_CONDENSE", "1").lower() not in ("0", "false", "no")
+
+
+def parse_context_lines(value: str) -> Union[int, str]:
+    """Parse a diff context setting: a number of lines or "auto".
+
+    Raises:
+        ValueError: If the value is neither
+    """
+    value = value.strip().lower()
+    if value == "auto":
+        return value
+    lines = int(value)
+    if lines < 0:
+        raise ValueError(f"context lines must not be negative: {lines}")
+    return lines
+
+
+def get_context_lines() -> Optional[Union[int, str]]:
+    """Get the unchanged lines shown around each change in the diff.
+
+    Returns a number of lines, "auto" to fit each file's context to the
+    token budget, or None (the default) for git's own default.
+    """
+    value = os.environ.get("LAZYPR_CONTEXT_LINES", "")
+    try:
+        return parse_context_lines(value) if value else None
+    except ValueError:
+        return None
+
+
+def get_function_context() -> bool:
+    """Check whether small files are diffed with whole changed functions."""
+    value = os.environ.get("LAZYPR_FUNCTION_CONTEXT", "")
+    return value.lower() in ("1", "true", "yes")
+
+
+def get_max_input_tokens() -> int:
+    """Get the hard limit on estimated input tokens per PR (0 is unlimited).
+
+    Diffs over the limit are packed to fit, and generation is aborted if
+    they still do not.
+    """
+    value = os.environ.get("LAZYPR_MAX_INPUT_TOKENS", "0")
+    try:
+        return max(0, int(value))
+    except ValueError:
+        return 0
+
+
+def get_context_tokens() -> int:
+    """Get the largest diff, in estimated tokens, sent in a single prompt.
+
+    Larger diffs are summarized in chunks first (map-reduce).
+    """
+    value = os.environ.get("LAZYPR_CONTEXT_TOKENS", "100000")
+    try:
+        return int(value)
+    except ValueError:
+        return 100000
+
+
+def get_fetch_ttl() -> float:
+    """Get how long, in seconds, a fetched base branch is used without checking.
+
+    After that the remote is asked whether the branch moved before fetching.
+    """
+    value = os.environ.get("LAZYPR_FETCH_TTL", "60")
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return 60.0
+
+
+def get_max_concurrency() -> int:
+    """Get the maximum number of concurrent model requests."""
+    value = os.environ.get("LAZYPR_MAX_CONCURRENCY", "4")
+    try:
+        return max(1, int(value))
+    except ValueError:
+        return 4
+
+
+def get_rate_limit() -> float:
+    """Get the maximum model requests per minute in batch mode (0 is unlimited)."""
+    value = os.environ.get("LAZYPR_RATE_LIMIT", "0")
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return 0.0
+
+
+def get_logfire_enabled() -> bool:
+    """Check whether phases and model calls are traced with logfire."""
+    return os.environ.get("LAZYPR_LOGFIRE", "").lower() in ("1", "true", "yes")
+
+
+def get_prompt_cache() -> str:
+    """Get what providers are asked to cache of each prompt.
+
+    "prefix" (the default) caches the static system prompt and tool
+    definitions, "all" also caches the diff, and "off" asks for nothing.
+    """
+    value = os.environ.get("LAZYPR_PROMPT_CACHE", "prefix").lower()
+    return value if value in ("off", "prefix", "all") else "prefix"
+
+
+def get_cache_max_bytes() -> int:
+    """Get the PR content cache size limit from environment variable."""
+    value = os.environ.get("LAZYPR_CACHE_MAX_BYTES", str(10 * 1024 * 1024))
     try:
         return int(value)
     except ValueError:
-        return 1000
+        return 10 * 1024 * 1024
 
 
 def get_model_name() -> Optional[str]:
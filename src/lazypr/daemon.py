@@ -0,0 +1,212 @@
+"""Optional background daemon that keeps the AI stack warm between runs."""
+
+import asyncio
+import json
+import os
+import signal
+import tempfile
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from .config import get_model_name
+from .usage import TokenUsage
+
+# Longest message line either side reads; a request carries the whole diff
+_MAX_MESSAGE_BYTES = 256 * 1024 * 1024
+
+
+class DaemonError(Exception):
+    """Raised when the daemon fails to generate PR content."""
+
+    pass
+
+
+@dataclass
+class DaemonContent:
+    """PR content received from the daemon."""
+
+    title: str
+    description: str
+
+
+def get_socket_path() -> Path:
+    """Return the daemon's Unix socket path.
+
+    Uses $XDG_RUNTIME_DIR/lazypr/daemon.sock, falling back to a per-user
+    directory in the system temp directory.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        base = Path(runtime_dir) / "lazypr"
+    else:
+        base = Path(tempfile.gettempdir()) / f"lazypr-{os.getuid()}"
+    return base / "daemon.sock"
+
+
+async def connect(
+    socket_path: Optional[Path] = None,
+) -> Optional[tuple[asyncio.StreamReader, asyncio.StreamWriter]]:
+    """Connect to a running daemon.
+
+    Returns:
+        The connection's reader and writer, or None if no daemon is running
+    """
+    path = socket_path or get_socket_path()
+    if not _is_user_owned(path):
+        return None
+    try:
+        return await asyncio.open_unix_connection(str(path), limit=_MAX_MESSAGE_BYTES)
+    except OSError:
+        return None
+
+
+async def request_pr_content(
+    connection: tuple[asyncio.StreamReader, asyncio.StreamWriter],
+    diff: str,
+    language: str = "en",
+    omitted_files: Optional[list[str]] = None,
+    use_cache: bool = False,
+    on_partial: Optional[Callable[[DaemonContent], None]] = None,
+    usage: Optional[TokenUsage] = None,
+) -> Optional[DaemonContent]:
+    """Ask the daemon to generate PR content over an open connection.
+
+    Args:
+        connection: Reader and writer from connect()
+        diff: The diff text
+        language: Language code for the PR content
+        omitted_files: Summaries of files left out of the diff
+        use_cache: Whether the daemon may use and fill the PR content cache
+        on_partial: Called with partial content as it streams in
+        usage: Accumulates the tokens and cost the daemon reports
+
+    Returns:
+        The generated content, or None if the daemon cannot serve this
+        request (e.g. it runs with a different model) and the caller should
+        generate in-process instead
+
+    Raises:
+        DaemonError: If generation fails or the connection drops
+    """
+    reader, writer = connection
+    request = {
+        "model": get_model_name(),
+        "diff": diff,
+        "language": language,
+        "omitted_files": omitted_files or [],
+        "use_cache": use_cache,
+    }
+    try:
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+        while line := await reader.readline():
+            message = json.loads(line)
+            if "partial" in message:
+                if on_partial is not None:
+                    on_partial(DaemonContent(**message["partial"]))
+            elif "result" in message:
+                if usage is not None and "usage" in message:
+                    usage.add(TokenUsage(**message["usage"]))
+                return DaemonContent(**message["result"])
+            elif "unsupported" in message:
+                return None
+            else:
+                raise DaemonError(message.get("error", "Unknown daemon error"))
+    except (OSError, ValueError, TypeError) as e:
+        raise DaemonError(f"Lost connection to lazypr daemon: {e}") from e
+    finally:
+        writer.close()
+    raise DaemonError("lazypr daemon closed the connection")
+
+
+async def serve(
+    socket_path: Optional[Path] = None, ready: Optional[Callable[[], None]] = None
+) -> None:
+    """Serve PR generation requests on a Unix socket until cancelled.
+
+    Imports the AI stack and prepares the agent once up front; every request
+    then reuses the same agent and its pooled provider connections.
+
+    Args:
+        socket_path: Where to listen; defaults to get_socket_path()
+        ready: Called once the daemon accepts connections
+
+    Raises:
+        DaemonError: If another daemon is already listening on the socket
+    """
+    from . import ai
+
+    path = socket_path or get_socket_path()
+    _prepare_socket_dir(path.parent)
+    probe = await connect(path)
+    if probe is not None:
+        writer = probe[1]
+        writer.close()
+        await writer.wait_closed()
+        raise DaemonError(f"lazypr daemon already running on {path}")
+    path.unlink(missing_ok=True)
+
+    agent = await ai.prepare_pr_agent()
+    model_name = get_model_name()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        def send(message: dict[str, Any]) -> None:
+            writer.write(json.dumps(message).encode() + b"\n")
+
+        try:
+            request = json.loads(await reader.readline())
+            if request.get("model") != model_name:
+                send({"unsupported": f"daemon serves model {model_name}"})
+                return
+            usage = TokenUsage()
+            content = await ai.generate_pr_content(
+                request["diff"],
+                request.get("language", "en"),
+                request.get("omitted_files") or None,
+                agent=agent,
+                use_cache=request.get("use_cache", False),
+                on_partial=lambda partial: send({"partial": partial.model_dump()}),
+                usage=usage,
+            )
+            send({"result": content.model_dump(), "usage": asdict(usage)})
+        except Exception as e:
+            send({"error": str(e) or type(e).__name__})
+        finally:
+            try:
+                await writer.drain()
+            except OSError:
+                pass
+            writer.close()
+
+    server = await asyncio.start_unix_server(
+        handle, path=str(path), limit=_MAX_MESSAGE_BYTES
+    )
+    # Stop cleanly, removing the socket, when terminated by a service manager
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    try:
+        os.chmod(path, 0o600)
+        if ready is not None:
+            ready()
+        async with server:
+            await server.serve_forever()
+    finally:
+        loop.remove_signal_handler(signal.SIGTERM)
+        path.unlink(missing_ok=True)
+
+
+def _prepare_socket_dir(directory: Path) -> None:
+    """Create the socket directory, readable by the current user only."""
+    directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if not _is_user_owned(directory):
+        raise DaemonError(f"{directory} is not owned by the current user")
+    os.chmod(directory, 0o700)
+
+
+def _is_user_owned(path: Path) -> bool:
+    """Check that a path exists and belongs to the current user."""
+    try:
+        return path.stat().st_uid == os.getuid()
+    except OSError:
+        return False
@@ -1,7 +1,23 @@
 """Diff parsing and filtering functions."""
 
+import hashlib
+import heapq
 import re
 import subprocess
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator
+
+from .config import (
+    get_condense_diff,
+    get_context_tokens,
+    get_fetch_ttl,
+    get_token_budget,
+)
+from .ignore import IgnoreMatcher, to_git_pathspecs
+from .profiling import phase
+from .tokens import CHARS_PER_TOKEN, estimate_tokens
 
 
 # Custom exceptions
@@ -11,16 +27,162 @@ class DiffError(Exception):
     pass
 
 
+_TEST_PATH_RE = re.compile(
+    r"(^|/)(tests?|spec|__tests__)/"
+    r"|(^|/)test_[^/]*$"
+    r"|_test\.[^/.]+$"
+    r"|\.(test|spec)\.[^/]+$"
+)
+_NO_NEWLINE_MARKER = "\\ No newline at end of file"
+# Hunk line ranges, which shift when the base branch changes earlier lines
+_HUNK_RANGE_RE = re.compile(
+    r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@", re.MULTILINE
+)
+# Lines of a hunk body, the last one possibly without a newline
+_LINE_RE = re.compile(r"[^\n]*\n|[^\n]+\Z")
+# Smallest block condense_diff() reports as moved: non-blank lines, and
+# alphanumeric characters like git's --color-moved
+_MIN_MOVED_LINES = 3
+_MIN_MOVED_CHARS = 20
+# Files where leading indentation is part of the syntax, so condense_diff()
+# never calls a re-indentation cosmetic
+_INDENT_SENSITIVE_RE = re.compile(
+    r"\.(py|pyi|pyx|yaml|yml|hs|coffee|nim|fs|sass|pug|haml|slim|mk)$"
+    r"|(^|/)(GNU)?[Mm]akefile$",
+)
+# Lines whose order condense_diff() may call cosmetic: imports and includes
+_IMPORT_LINE_RE = re.compile(
+    r"(import|from \S+ import|#\s*(include|import)|@import|using|use|require)\b"
+)
+# Context widths fit_diff_context() narrows each file through, widest first;
+# "auto" context asks git for the widest
+_CONTEXT_LEVELS = (10, 5, 3, 1, 0)
+# Files with at most this many changed lines are shown with whole functions
+# when function context is on, up to this many files (one pathspec each)
+_FUNCTION_CONTEXT_MAX_LINES = 50
+_FUNCTION_CONTEXT_MAX_FILES = 200
+# Oversized and ignored files excluded from git diff by name, largest first;
+# past this the argument list gets too long, and _DiffStreamFilter drops the
+# rest as they stream by
+_MAX_EXCLUDED_FILES = 1000
+# Bytes of the git diff pipe read at a time
+_READ_SIZE = 1 << 16
+# Options making the patch format independent of the user's git config
+_PATCH_OPTIONS = ["--no-color", "--no-ext-diff", "--src-prefix=a/", "--dst-prefix=b/"]
+# Escapes git uses in C-quoted paths, besides three-digit octal bytes
+_C_ESCAPES = {
+    "a": 7,
+    "b": 8,
+    "t": 9,
+    "n": 10,
+    "v": 11,
+    "f": 12,
+    "r": 13,
+    '"': 34,
+    "\\": 92,
+}
+# Lockfiles are generated by package managers and not worth describing
+_LOCKFILE_NAMES = frozenset(
+    {
+        "Cargo.lock",
+        "Gemfile.lock",
+        "Pipfile.lock",
+        "Podfile.lock",
+        "bun.lockb",
+        "composer.lock",
+        "flake.lock",
+        "go.sum",
+        "mix.lock",
+        "npm-shrinkwrap.json",
+        "package-lock.json",
+        "packages.lock.json",
+        "pdm.lock",
+        "pnpm-lock.yaml",
+        "poetry.lock",
+        "pubspec.lock",
+        "uv.lock",
+        "yarn.lock",
+    }
+)
+_MINIFIED_PATH_RE = re.compile(r"[.-]min\.(js|mjs|css)$|\.(js|mjs|css)\.map$")
+# No hand-written line is this long; minified bundles and generated data are.
+# Only added and removed lines count: an edit next to an unwrapped paragraph
+# of prose is still worth sending
+_LONG_LINE_RE = re.compile(rb"\n[+-][^\n]{999}")
+# Extended header lines between "diff --git" and the first hunk, at most
+_MAX_EXTENDED_HEADER_LINES = 8
+# Extended header lines of files with no content changes
+_METADATA_PREFIXES = (
+    "old mode ",
+    "new mode ",
+    "similarity index ",
+    "rename from ",
+    "rename to ",
+    "copy from ",
+    "copy to ",
+)
+
+
+@dataclass(frozen=True)
+class _DiffSyntax:
+    """Patterns for tokenizing a diff given as str or as bytes.
+
+    ``token`` matches the newline before every line that matters: file
+    headers, hunk headers, and lines that are not diff content (empty lines
+    and extended headers such as modes, renames and "Binary files differ").
+    A single scan over a span in C then replaces a Python loop per line;
+    content lines are counted with ``count`` on the newline.
+    """
+
+    newline: Any
+    carriage_return: Any
+    header_prefix: Any
+    token: re.Pattern
+    binary_prefix: Any
+    binary_suffix: Any
+
+    @classmethod
+    def build(cls, kind: type) -> "_DiffSyntax":
+        def encode(text: str) -> Any:
+            return text if kind is str else text.encode()
+
+        token = (
+            r"\n(?:"
+            r"(?P<header>diff --git )"
+            # Matches patterns like @@ -1,1000 +1,1000 @@ or @@ -1 +1 @@
+            r"|(?P<hunk>@@ -\d+(?:,\d+)? \+\d+,?(?P<count>\d+)? @@)"
+            r"|(?![-+ ]|@@|index |" + re.escape(_NO_NEWLINE_MARKER) + r"))"
+        )
+        return cls(
+            newline=encode("\n"),
+            carriage_return=encode("\r"),
+            header_prefix=encode("diff --git "),
+            token=re.compile(encode(token)),
+            binary_prefix=encode("Binary files "),
+            binary_suffix=encode(" differ"),
+        )
+
+
+_STR_SYNTAX = _DiffSyntax.build(str)
+_BYTES_SYNTAX = _DiffSyntax.build(bytes)
+# Characters a token match may look at past the end of the scanned span
+_TOKEN_LOOKAHEAD = len(_NO_NEWLINE_MARKER) + 1
+
+
 # =============================================================================
 # PUBLIC API
 # =============================================================================
 
 
-def get_diff(base: str) -> str:
-    """Get diff from base branch to current HEAD."""
+def get_diff(base: str, context: int | str | None = None) -> str:
+    """Get diff from base branch to current HEAD.
+
+    context is the number of unchanged lines around each change, or None
+    for git's default (see get_filtered_diff_remote()).
+    """
     try:
         result = subprocess.run(
-            ["git", "diff", f"{base}...HEAD"],
+            ["git", "diff", *_context_options(context), f"{base}...HEAD"],
             capture_output=True,
             text=True,
             check=True,
@@ -30,7 +192,12 @@ def get_diff(base: str) -> str:
         raise DiffError(f"Failed to get diff from base branch '{base}'") from e
 
 
-def get_diff_remote(base: str, remote: str = "origin") -> str:
+def get_diff_remote(
+    base: str,
+    remote: str = "origin",
+    context: int | str | None = None,
+    fetch: bool = True,
+) -> str:
     """Get diff from remote base branch to current HEAD.
 
     This compares against the remote branch (e.g., origin/main) rather than
@@ -43,6 +210,9 @@ def get_diff_remote(base: str, remote: str = "origin") -> str:
     Args:
         base: The base branch name (e.g., "main")
         remote: The preferred remote name (default: "origin")
+        context: Unchanged lines around each change; None for git's default
+        fetch: Update the remote base branch first; pass False to work
+            offline with the refs fetched before
 
     Returns:
         The diff output as a string
@@ -50,14 +220,15 @@ def get_diff_remote(base: str, remote: str = "origin") -> str:
     Raises:
         DiffError: If no suitable branch reference is found
     """
-    candidates = _remote_candidates(base, preferred=remote)
+    candidates = (
+        _fetched_candidates(base, preferred=remote)
+        if fetch
+        else _remote_candidates(base, preferred=remote)
+    )
     for ref in candidates:
-        if "/" in ref:
-            remote_name = ref.split("/")[0]
-            _fetch_remote_branch(remote_name, base)
         try:
             result = subprocess.run(
-                ["git", "diff", f"{ref}...HEAD"],
+                ["git", "diff", *_context_options(context), f"{ref}...HEAD"],
                 capture_output=True,
                 text=True,
                 check=True,
@@ -68,12 +239,263 @@ def get_diff_remote(base: str, remote: str = "origin") -> str:
     raise DiffError(f"Failed to get diff: no remote tracking branch found for '{base}'")
 
 
+@dataclass(slots=True)
+class FileStat:
+    """Per-file change counts from ``git diff --numstat``.
+
+    ``added`` and ``deleted`` are None for binary files.
+    """
+
+    path: str
+    added: int | None
+    deleted: int | None
+    old_path: str | None = None
+
+    @property
+    def changed_lines(self) -> int:
+        """Number of added plus deleted lines (0 for binary files)."""
+        return (self.added or 0) + (self.deleted or 0)
+
+    def summary(self) -> str:
+        """One-line description such as "src/app.py (+120 -4)"."""
+        if self.added is None:
+            return f"{self.path} (binary)"
+        return f"{self.path} (+{self.added} -{self.deleted})"
+
+
+@dataclass
+class FilteredDiff:
+    """A filtered diff plus the files left out of it for being too large."""
+
+    text: str
+    omitted: list[FileStat] = field(default_factory=list)
+
+
+def get_diff_numstat(
+    ref: str, pathspecs: list[str] | None = None, head: str = "HEAD"
+) -> list[FileStat]:
+    """Get per-file added/deleted line counts from ref to head.
+
+    This is cheap compared to a full diff because git produces no patch text.
+
+    Args:
+        ref: The ref to compare against (e.g., "origin/main")
+        pathspecs: Optional git pathspecs limiting the files
+        head: The ref whose changes are counted (default: "HEAD")
+
+    Returns:
+        One FileStat per changed file
+
+    Raises:
+        subprocess.CalledProcessError: If the git command fails
+    """
+    cmd = ["git", "diff", "--numstat", "-z", f"{ref}...{head}"]
+    if pathspecs:
+        cmd += ["--", *pathspecs]
+    with phase("git diff --numstat"):
+        result = subprocess.run(cmd, capture_output=True, check=True)
+    return _parse_numstat(result.stdout.decode("utf-8", errors="replace"))
+
+
+def get_generated_paths(paths: list[str]) -> dict[str, str]:
+    """Find files that .gitattributes marks as generated or not diffable.
+
+    Asks ``git check-attr`` for the ``linguist-generated`` and ``diff``
+    attributes, from the repository root since diff paths are relative to
+    it. Errors are ignored, as attributes only refine the diff.
+
+    Args:
+        paths: Paths relative to the repository root
+
+    Returns:
+        The reason each marked path has no useful diff, such as
+        "generated file"
+    """
+    if not paths:
+        return {}
+    try:
+        with phase("git check-attr"):
+            root = subprocess.run(
+                ["git", "rev-parse", "--show-toplevel"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+            result = subprocess.run(
+                ["git", "check-attr", "-z", "--stdin", "linguist-generated", "diff"],
+                input="\0".join(paths) + "\0",
+                capture_output=True,
+                text=True,
+                check=True,
+                cwd=root or None,
+            )
+    except (subprocess.CalledProcessError, OSError):
+        return {}
+
+    reasons: dict[str, str] = {}
+    fields = result.stdout.split("\0")
+    for i in range(0, len(fields) - 2, 3):
+        path, attribute, value = fields[i : i + 3]
+        if attribute == "linguist-generated" and value in ("set", "true"):
+            reasons[path] = "generated file"
+        elif attribute == "diff" and value == "unset":
+            reasons.setdefault(path, "binary file")
+    return reasons
+
+
+def generated_file_reason(
+    path: str, marked: dict[str, str] | None = None
+) -> str | None:
+    """Explain why a file's diff is not worth sending to the model.
+
+    Args:
+        path: The file path
+        marked: Reasons from get_generated_paths()
+
+    Returns:
+        A short reason such as "lockfile", or None for ordinary files
+    """
+    if marked and path in marked:
+        return marked[path]
+    name = path.rsplit("/", 1)[-1]
+    if name in _LOCKFILE_NAMES:
+        return "lockfile"
+    if _MINIFIED_PATH_RE.search(name):
+        return "minified file"
+    return None
+
+
+def get_filtered_diff_remote(
+    base: str,
+    max_lines: int,
+    patterns: list[str] | None = None,
+    remote: str = "origin",
+    head: str = "HEAD",
+    fetch: bool = True,
+    context: int | str | None = None,
+    function_context: bool = False,
+) -> FilteredDiff:
+    """Get the diff against the remote base branch, filtering per file.
+
+    Works in two phases. First ``git diff --numstat`` sizes every file
+    without generating patch text; files that are ignored or already known
+    to exceed max_lines are excluded from the second phase, so their patches
+    are never generated. Ignore patterns that git can express are passed to
+    git as exclude pathspecs in both phases.
+
+    The patch text is then read incrementally from a pipe and each file is
+    dropped as soon as it is known to exceed max_lines, so peak memory is
+    bounded by the largest kept file rather than by the whole branch diff.
+    Generated files (see generated_file_reason()) and files with very long
+    lines are replaced by a one-line stub.
+
+    With function_context, small files are diffed a second time with
+    ``git diff --function-context``, which shows every changed function
+    whole, and that version is used unless it exceeds max_lines.
+
+    Args:
+        base: The base branch name (e.g., "main")
+        max_lines: Files whose effective line count exceeds this are dropped
+        patterns: .lazyprignore patterns for files to drop
+        remote: The preferred remote name (default: "origin")
+        head: The ref whose changes are diffed (default: "HEAD")
+        fetch: Update the base branch first (see _fetch_remote_branch());
+            pass False when the caller has already fetched it, or to work
+            offline
+        context: Unchanged lines around each change: None for git's default,
+            or "auto" for the widest context fit_diff_context() narrows
+        function_context: Show whole functions for small files
+
+    Returns:
+        The filtered diff and the files omitted for being too large
+
+    Raises:
+        DiffError: If no suitable branch reference is found, or git cannot
+            be run
+    """
+    pathspecs, fallback_patterns = to_git_pathspecs(patterns or [])
+    matcher = IgnoreMatcher(fallback_patterns)
+    candidates = (
+        _fetched_candidates(base, preferred=remote)
+        if fetch
+        else _remote_candidates(base, preferred=remote)
+    )
+    for ref in candidates:
+        try:
+            stats = get_diff_numstat(ref, pathspecs, head)
+        except subprocess.CalledProcessError:
+            continue
+        except OSError as e:
+            raise DiffError(f"Failed to run git diff: {e}") from e
+
+        oversized = [s for s in stats if s.changed_lines > max_lines]
+        with phase("ignore matching"):
+            ignored = [s for s in stats if matcher.is_ignored(s.path)]
+        largest = sorted(
+            oversized + ignored, key=lambda s: s.changed_lines, reverse=True
+        )
+        excluded = [
+            f":(top,exclude,literal){path}"
+            for s in largest[:_MAX_EXCLUDED_FILES]
+            for path in (s.path, s.old_path)
+            if path is not None
+        ]
+
+        skipped = {s.path for s in oversized + ignored}
+        generated = get_generated_paths(
+            [s.path for s in stats if s.path not in skipped]
+        )
+
+        options = [*_PATCH_OPTIONS, *_context_options(context)]
+        cmd = ["git", "diff", *options, f"{ref}...{head}"]
+        if pathspecs or excluded:
+            cmd += ["--", *pathspecs, *excluded]
+        try:
+            with phase("git diff"):
+                text, dropped = _stream_filtered_diff(
+                    cmd, max_lines, matcher, generated
+                )
+        except subprocess.CalledProcessError:
+            continue
+        except OSError as e:
+            raise DiffError(f"Failed to run git diff: {e}") from e
+
+        small = [
+            f":(top,literal){s.path}"
+            for s in stats
+            if 0 < s.changed_lines <= _FUNCTION_CONTEXT_MAX_LINES
+            and s.old_path is None
+            and s.path not in skipped
+            and s.path not in generated
+        ]
+        if function_context and small:
+            cmd = ["git", "diff", *options, "--function-context", f"{ref}...{head}"]
+            cmd += ["--", *small[:_FUNCTION_CONTEXT_MAX_FILES]]
+            with phase("git diff --function-context"):
+                text = _with_function_context(text, cmd, max_lines, matcher)
+
+        dropped_set = set(dropped) - {s.path for s in oversized}
+        omitted = oversized + [s for s in stats if s.path in dropped_set]
+        return FilteredDiff(text=text, omitted=omitted)
+    raise DiffError(f"Failed to get diff: no remote tracking branch found for '{base}'")
+
+
+def _fetched_candidates(base: str, preferred: str) -> Iterator[str]:
+    """Yield candidate refs to diff against, fetching remote refs first."""
+    for ref in _remote_candidates(base, preferred=preferred):
+        if "/" in ref:
+            remote_name = ref.split("/")[0]
+            _fetch_remote_branch(remote_name, base)
+        yield ref
+
+
 def _remote_candidates(base: str, preferred: str) -> list[str]:
     """Return candidate remote refs to diff against, preferred remote first."""
     try:
-        result = subprocess.run(
-            ["git", "branch", "-r"], capture_output=True, text=True, check=True
-        )
+        with phase("git branch -r"):
+            result = subprocess.run(
+                ["git", "branch", "-r"], capture_output=True, text=True, check=True
+            )
         remote_branches = [b.strip() for b in result.stdout.splitlines()]
     except subprocess.CalledProcessError:
         remote_branches = []
@@ -91,96 +513,167 @@ def _remote_candidates(base: str, preferred: str) -> list[str]:
 
 
 def _fetch_remote_branch(remote: str, branch: str) -> None:
-    """Fetch a branch from a remote to update the local tracking ref.
+    """Update the local tracking ref of a remote branch, if it is stale.
+
+    The fetch is skipped when the last fetch, within LAZYPR_FETCH_TTL
+    seconds, brought the commit the tracking ref points to, or when
+    ``git ls-remote`` shows the remote branch has not moved. Only the one
+    branch is fetched, without tags.
 
     Silently ignores errors so callers proceed with the cached ref when
     offline or when the remote does not have the branch.
     """
     try:
-        subprocess.run(
-            ["git", "fetch", remote, branch],
-            capture_output=True,
-            text=True,
-            check=True,
-        )
+        with phase("git rev-parse"):
+            result = subprocess.run(
+                [
+                    "git",
+                    "rev-parse",
+                    "--git-path",
+                    "FETCH_HEAD",
+                    f"refs/remotes/{remote}/{branch}",
+                ],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+        fetch_head, local_sha = result.stdout.split()
+    except (subprocess.CalledProcessError, ValueError):
+        local_sha = None
+    else:
+        if _fetched_recently(Path(fetch_head), branch, local_sha, get_fetch_ttl()):
+            return
+
+    try:
+        with phase("git ls-remote"):
+            result = subprocess.run(
+                ["git", "ls-remote", "--heads", remote, f"refs/heads/{branch}"],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+    except subprocess.CalledProcessError:
+        # Unreachable remote: a fetch would fail the same way
+        return
+    remote_sha = result.stdout.split("\t", 1)[0].strip()
+    if not remote_sha or remote_sha == local_sha:
+        return
+
+    try:
+        with phase("git fetch"):
+            subprocess.run(
+                [
+                    "git",
+                    "fetch",
+                    "--no-tags",
+                    remote,
+                    f"+refs/heads/{branch}:refs/remotes/{remote}/{branch}",
+                ],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
     except subprocess.CalledProcessError:
         pass
 
 
-def parse_diff_lines(diff: str) -> dict[str, int]:
-    """Parse diff and return a dict mapping file paths to actual line counts."""
-    file_lines: dict[str, int] = {}
-    current_file: str | None = None
-    current_count = 0
+def _fetched_recently(fetch_head: Path, branch: str, sha: str, ttl: float) -> bool:
+    """Check whether FETCH_HEAD, written less than ttl seconds ago, has sha."""
+    try:
+        if time.time() - fetch_head.stat().st_mtime > ttl:
+            return False
+        lines = fetch_head.read_text(errors="replace").splitlines()
+    except OSError:
+        return False
+    return any(
+        line.startswith(f"{sha}\t") and f"\tbranch '{branch}' of " in line
+        for line in lines
+    )
 
-    # Normalize line endings and split
-    lines = diff.replace("\r\n", "\n").split("\n")
-    # Remove trailing empty line if present
-    if lines and lines[-1] == "":
-        lines = lines[:-1]
 
-    for line in lines:
-        # Check for file header
-        if line.startswith("diff --git "):
-            # Save previous file count
-            if current_file is not None:
-                file_lines[current_file] = current_count
-            # Extract new file path
-            match = re.match(r"diff --git a/(.*) b/(.*)", line)
-            if match:
-                current_file = match.group(2)
-                current_count = 1  # Count the diff --git line
-            else:
-                current_file = None
-                current_count = 0
-        elif current_file is not None:
-            # Check for binary files
-            if line == "Binary files differ":
-                # Remove binary file from tracking
-                current_file = None
-                current_count = 0
-            elif _is_diff_content_line(line):
-                current_count += 1
-            # Ignore empty lines and separators between files
+@dataclass(slots=True)
+class FileDiff:
+    """Per-file record produced by a single pass over a diff.
 
-    # Save last file
-    if current_file is not None:
-        file_lines[current_file] = current_count
+    ``start`` and ``end`` are character offsets into the indexed diff text, so
+    a file's patch is ``diff[start:end]`` without copying any other file.
+    ``old_path`` is set for renames and copies.
+    """
 
-    return file_lines
+    path: str
+    start: int
+    end: int
+    line_count: int = 1  # The "diff --git" header counts as a line
+    max_hunk_count: int = 0
+    is_binary: bool = False
+    old_path: str | None = None
+    hunks: int = 0
 
+    @property
+    def effective_line_count(self) -> int:
+        """Line count used for size filtering.
 
-def filter_large_files(diff: str, max_lines: int) -> str:
-    """Remove files from diff that exceed max_lines."""
-    if not diff.strip():
-        return ""
+        Uses the largest hunk header count when it exceeds the actual line
+        count (e.g. "@@ -1,1000 +1,1000 @@" counts as 1000 lines).
+        """
+        actual = 0 if self.is_binary else self.line_count
+        return max(actual, self.max_hunk_count)
 
-    file_lines = _get_effective_line_count(diff)
-    files_to_remove = {f for f, count in file_lines.items() if count > max_lines}
 
-    if not files_to_remove:
-        return diff
+def index_diff(diff: str) -> list[FileDiff]:
+    """Tokenize a diff once into per-file records.
+
+    File headers, hunk headers and the few lines that are not diff content
+    are found by regular expression scans over each file's span, so the
+    text is never split into lines. Text before the first "diff --git"
+    header, and files whose header cannot be parsed, are not indexed.
+
+    Paths are exact even when they contain spaces or " b/", or are C-quoted
+    by git; a renamed file's paths come from its "rename from/to" lines.
+
+    Args:
+        diff: The diff text
+
+    Returns:
+        One FileDiff per file, in diff order
+    """
+    return _index_diff(diff, _STR_SYNTAX)
 
-    # Normalize line endings and split
-    lines = diff.replace("\r\n", "\n").split("\n")
-    # Remove trailing empty line if present for processing
-    has_trailing_newline = lines and lines[-1] == ""
-    if has_trailing_newline:
-        lines = lines[:-1]
 
-    # Collect lines for each file separately
-    files_in_diff = _collect_files_from_diff(lines)
+def index_diff_bytes(data: bytes | bytearray) -> list[FileDiff]:
+    """Tokenize raw git diff output into per-file records without decoding it.
 
-    # Rebuild diff without large files
-    filtered_lines: list[str] = []
-    for filename, file_lines_list in files_in_diff.items():
-        if filename not in files_to_remove:
-            filtered_lines.extend(file_lines_list)
+    Like index_diff(), but ``start`` and ``end`` are byte offsets, so a
+    file's patch is ``memoryview(data)[start:end]`` without copying. Only
+    each file's header line is decoded, for its path.
 
-    if not filtered_lines:
+    Args:
+        data: The diff output as bytes
+
+    Returns:
+        One FileDiff per file, in diff order
+    """
+    return _index_diff(data, _BYTES_SYNTAX)
+
+
+def parse_diff_lines(diff: str) -> dict[str, int]:
+    """Parse diff and return a dict mapping file paths to actual line counts."""
+    return {f.path: f.line_count for f in index_diff(diff) if not f.is_binary}
+
+
+def filter_large_files(diff: str, max_lines: int) -> str:
+    """Remove files from diff that exceed max_lines."""
+    if not diff.strip():
         return ""
 
-    return "\n".join(filtered_lines) + "\n"
+    text = diff.replace("\r\n", "\n") if "\r\n" in diff else diff
+    files = index_diff(text)
+    kept = [f for f in files if f.effective_line_count <= max_lines]
+
+    if len(kept) == len(files):
+        return diff
+
+    return _join_file_spans(text, kept)
 
 
 def rebuild_diff_with_files(diff: str, allowed_files: list[str]) -> str:
@@ -194,25 +687,285 @@ def rebuild_diff_with_files(diff: str, allowed_files: list[str]) -> str:
         A new diff string containing only the allowed files
     """
     allowed_set = set(allowed_files)
-    filtered_lines: list[str] = []
-    current_file: str | None = None
-    include_current = False
-
-    for line in diff.split("\n"):
-        if line.startswith("diff --git "):
-            match = re.match(r"diff --git a/(.*) b/(.*)", line)
-            if match:
-                current_file = match.group(2)
-                include_current = current_file in allowed_set
-            else:
-                include_current = False
+    kept = [f for f in index_diff(diff) if f.path in allowed_set]
+    if not kept:
+        return ""
+    return "".join(diff[f.start : f.end] for f in kept).rstrip() + "\n"
+
+
+def file_diff_hashes(diff: str) -> dict[str, str]:
+    """Hash each file's changes, to tell which files changed between runs.
+
+    Only the hunks are hashed, without their line ranges: the header's
+    "index" line and the ranges also change when the base branch moves on
+    without touching the file's changes. Files without hunks, such as
+    binary files and renames, hash their whole patch.
+
+    Args:
+        diff: The diff text
+
+    Returns:
+        A hex digest per file path
+    """
+    hashes: dict[str, str] = {}
+    for f in index_diff(diff):
+        first_hunk = diff.find("\n@@", f.start, f.end)
+        changes = diff[f.start if first_hunk == -1 else first_hunk : f.end]
+        changes = _HUNK_RANGE_RE.sub("@@", changes)
+        digest = hashlib.sha256(f"{f.path}\0{changes}".encode("utf-8", "replace"))
+        hashes[f.path] = digest.hexdigest()
+    return hashes
+
+
+def split_diff(diff: str, max_tokens: int) -> list[str]:
+    """Split a diff into chunks of whole files, each within max_tokens.
 
-            if include_current:
-                filtered_lines.append(line)
-        elif include_current:
-            filtered_lines.append(line)
+    Consecutive files are grouped together, and git orders files by path, so
+    files from the same directory tend to share a chunk. A single file larger
+    than max_tokens is truncated to fit.
+
+    Args:
+        diff: The diff text
+        max_tokens: Estimated token limit per chunk
+
+    Returns:
+        The chunks, in diff order
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks: list[str] = []
+    current: list[str] = []
+    current_tokens = 0
 
-    return "\n".join(filtered_lines).rstrip() + "\n" if filtered_lines else ""
+    for f in index_diff(diff):
+        text = diff[f.start : f.end]
+        if len(text) > max_chars:
+            text = text[:max_chars] + "\n[... truncated ...]\n"
+        tokens = estimate_tokens(text)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("".join(current))
+            current = []
+            current_tokens = 0
+        current.append(text)
+        current_tokens += tokens
+
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+@dataclass
+class PackedDiff:
+    """A diff packed into a token budget by pack_diff()."""
+
+    text: str
+    tokens: int
+    full_hunks: int = 0
+    reduced_hunks: int = 0
+    reduced_files: int = 0
+
+
+def is_test_path(path: str) -> bool:
+    """Check whether a path looks like a test file."""
+    return _TEST_PATH_RE.search(path) is not None
+
+
+def pack_diff(diff: str, max_tokens: int) -> PackedDiff:
+    """Fit a diff into a global token budget, degrading instead of dropping.
+
+    Every file is first reduced to its minimal form: deleted files and pure
+    renames to their header lines, everything else to its file header plus
+    the "@@" line of each hunk. Hunk bodies are then added back by priority
+    (source before tests, smaller hunks first) while they fit. If even the
+    minimal forms exceed the budget, the lowest-priority files are reduced
+    to their "diff --git" line.
+
+    Args:
+        diff: The diff text
+        max_tokens: Estimated token budget for the whole diff
+
+    Returns:
+        The packed diff and counts of what was kept or reduced
+    """
+    files = [_PackFile.from_span(f, diff[f.start : f.end]) for f in index_diff(diff)]
+    by_priority = sorted(
+        range(len(files)), key=lambda i: (files[i].is_test, files[i].body_tokens)
+    )
+
+    used = sum(f.minimal_tokens for f in files)
+    reduced_files = 0
+    for i in reversed(by_priority):
+        if used <= max_tokens:
+            break
+        pack_file = files[i]
+        used -= pack_file.minimal_tokens - estimate_tokens(pack_file.first_line)
+        pack_file.header_only = True
+        reduced_files += 1
+
+    hunks = [
+        (files[i].is_test, estimate_tokens(hunk), i, j)
+        for i in by_priority
+        if not (files[i].header_only or files[i].collapsed)
+        for j, hunk in enumerate(files[i].hunks)
+    ]
+    for _, _, i, j in sorted(hunks):
+        extra = files[i].hunk_upgrade_tokens(j)
+        if used + extra <= max_tokens:
+            files[i].full_hunks.add(j)
+            used += extra
+
+    text = "".join(f.render() for f in files)
+    total_hunks = sum(len(f.hunks) for f in files if not f.collapsed)
+    full_hunks = sum(len(f.full_hunks) for f in files)
+    return PackedDiff(
+        text=text,
+        tokens=estimate_tokens(text),
+        full_hunks=full_hunks,
+        reduced_hunks=total_hunks - full_hunks,
+        reduced_files=reduced_files,
+    )
+
+
+@dataclass
+class CondensedDiff:
+    """A diff condensed by condense_diff() or fit_diff_context()."""
+
+    text: str
+    saved_tokens: int = 0
+    cosmetic_hunks: int = 0
+    moved_blocks: int = 0
+    trimmed_lines: int = 0
+
+
+def condense_diff(diff: str, context_lines: int | None = None) -> CondensedDiff:
+    """Drop the parts of a diff that cost tokens without carrying meaning.
+
+    Three passes, each keeping the rest of the diff as git wrote it:
+
+    - If context_lines is given, unchanged context lines are trimmed to
+      that many around each change, splitting hunks whose changes end up
+      further apart, like ``git diff -U<context_lines>``.
+    - Hunks that only change whitespace or blank lines (what
+      ``git diff -w --ignore-blank-lines`` hides), such as formatter runs,
+      or only reorder import and include lines are reduced to their "@@"
+      line and a note. Files with nothing else are reduced to their header.
+      In languages like Python and YAML, a change of leading indentation
+      is never reduced.
+    - Blocks of lines removed in one place and added unchanged, ignoring
+      indentation, in another are replaced on both sides by a
+      "[moved N lines from X to Y]" note.
+
+    Args:
+        diff: The diff text
+        context_lines: Unchanged lines to keep before and after each change;
+            None keeps them all
+
+    Returns:
+        The condensed diff, counts of what was condensed and the estimated
+        tokens saved
+    """
+    files = [
+        _CondenseFile.from_span(f, diff[f.start : f.end]) for f in index_diff(diff)
+    ]
+    result = CondensedDiff(text=diff)
+    for condense_file in files:
+        if context_lines is not None:
+            result.trimmed_lines += condense_file.trim_context(context_lines)
+        result.cosmetic_hunks += condense_file.reduce_cosmetic_hunks()
+    result.moved_blocks = _collapse_moved_blocks(files)
+    if result.trimmed_lines or result.cosmetic_hunks or result.moved_blocks:
+        result.text = "".join(f.render() for f in files)
+        result.saved_tokens = estimate_tokens(diff) - estimate_tokens(result.text)
+    return result
+
+
+def fit_diff_context(diff: str, max_tokens: int) -> CondensedDiff:
+    """Narrow the context of the largest files until the diff fits max_tokens.
+
+    Meant for a diff generated with wide context (see "auto" in
+    get_filtered_diff_remote()): while the estimated tokens exceed the
+    budget, the file currently taking the most tokens has its context
+    trimmed to the next width in _CONTEXT_LEVELS, down to the changed
+    lines alone. Small diffs keep their full context. A diff that still
+    does not fit is left to pack_diff().
+
+    Args:
+        diff: The diff text
+        max_tokens: Estimated token budget for the whole diff
+
+    Returns:
+        The diff with its context fitted, the lines trimmed and the
+        estimated tokens saved
+    """
+    files = [
+        _CondenseFile.from_span(f, diff[f.start : f.end]) for f in index_diff(diff)
+    ]
+    tokens = [estimate_tokens(f.render()) for f in files]
+    levels = [0] * len(files)
+    largest = [(-tokens[i], i) for i, f in enumerate(files) if f.hunks]
+    heapq.heapify(largest)
+    total = estimate_tokens(diff)
+    result = CondensedDiff(text=diff)
+    while total > max_tokens and largest:
+        _, i = heapq.heappop(largest)
+        result.trimmed_lines += files[i].trim_context(_CONTEXT_LEVELS[levels[i]])
+        levels[i] += 1
+        trimmed = estimate_tokens(files[i].render())
+        total -= tokens[i] - trimmed
+        tokens[i] = trimmed
+        if levels[i] < len(_CONTEXT_LEVELS):
+            heapq.heappush(largest, (-trimmed, i))
+    if result.trimmed_lines:
+        result.text = "".join(f.render() for f in files)
+        result.saved_tokens = estimate_tokens(diff) - estimate_tokens(result.text)
+    return result
+
+
+@dataclass
+class PromptDiff:
+    """A filtered diff shaped for the prompt by prepare_prompt_diff().
+
+    Each step's result is kept for reporting, or None if it did not run.
+    """
+
+    text: str
+    condensed: CondensedDiff | None = None
+    fitted: CondensedDiff | None = None
+    packed: PackedDiff | None = None
+
+
+def prepare_prompt_diff(diff: str, context: int | str | None = None) -> PromptDiff:
+    """Condense, fit and pack a filtered diff as configured.
+
+    The steps shared by every command that prompts with a diff:
+    condense_diff() unless LAZYPR_CONDENSE is off, fit_diff_context() for
+    "auto" context, and pack_diff() when LAZYPR_TOKEN_BUDGET is set.
+
+    Args:
+        diff: The filtered diff text
+        context: The context the diff was generated with
+
+    Returns:
+        The diff to prompt with, and the result of each step that ran
+    """
+    result = PromptDiff(text=diff)
+    if get_condense_diff():
+        with phase("condense diff"):
+            result.condensed = condense_diff(result.text)
+        result.text = result.condensed.text
+
+    token_budget = get_token_budget()
+    if context == "auto":
+        with phase("fit diff context"):
+            result.fitted = fit_diff_context(
+                result.text, token_budget or get_context_tokens()
+            )
+        result.text = result.fitted.text
+
+    if token_budget:
+        with phase("pack diff"):
+            result.packed = pack_diff(result.text, token_budget)
+        result.text = result.packed.text
+    return result
 
 
 # =============================================================================
@@ -220,94 +973,824 @@ def rebuild_diff_with_files(diff: str, allowed_files: list[str]) -> str:
 # =============================================================================
 
 
-def _is_diff_content_line(line: str) -> bool:
-    """Check if a line is part of a file's diff content (not a separator).
+def _index_diff(text: Any, syntax: _DiffSyntax) -> list[FileDiff]:
+    """Index a diff given as str or bytes; see index_diff()."""
+    files: list[FileDiff] = []
+    length = len(text)
+    # Lines start after each newline before this offset
+    last = length - 1 if text.endswith(syntax.newline) else length
+
+    if text.startswith(syntax.header_prefix):
+        start: int | None = 0
+    else:
+        header = _scan_lines(None, text, 0, last, syntax)
+        start = None if header is None else header + 1
+
+    while start is not None:
+        newline = text.find(syntax.newline, start)
+        header_end = length if newline == -1 else newline
+        record = _new_file_record(text, start, header_end, length, syntax)
+        if record is not None and record.old_path is not None:
+            _refine_paths(record, text, newline, length, syntax)
+        header = None
+        if newline != -1:
+            header = _scan_lines(record, text, newline, last, syntax)
+        if record is not None:
+            if header is not None:
+                record.end = header + 1
+            files.append(record)
+        start = None if header is None else header + 1
+    return files
+
 
-    Diff content lines include:
-    - Index lines: "index 123..456 100644"
-    - Source file markers: "--- a/file.py"
-    - Target file markers: "+++ b/file.py"
-    - Hunk headers: "@@ -1,5 +1,5 @@"
-    - Content lines starting with +, -, or space
-    - "No newline at end of file" marker
+def _new_file_record(
+    text: Any, start: int, end: int, file_end: int, syntax: _DiffSyntax
+) -> FileDiff | None:
+    """Start a file record from the "diff --git" line at text[start:end]."""
+    if end > start and text.endswith(syntax.carriage_return, start, end):
+        end -= 1
+    line = text[start:end]
+    if not isinstance(line, str):
+        line = line.decode("utf-8", errors="replace")
+    paths = _parse_header_paths(line)
+    if paths is None:
+        return None
+    old_path, path = paths
+    return FileDiff(
+        path=path,
+        start=start,
+        end=file_end,
+        old_path=None if old_path == path else old_path,
+    )
+
+
+def _parse_header_paths(line: str) -> tuple[str, str] | None:
+    """Parse the old and new paths from a "diff --git" line.
+
+    git C-quotes paths with special characters, but not paths with spaces,
+    so "a/x b/y b/z" splits two ways. Unchanged paths are split where both
+    halves match; for renames the split is a guess that _refine_paths()
+    corrects from the rename lines.
+
+    Returns:
+        The old and new path, or None if the line cannot be parsed
     """
-    # Header lines that are part of diff content
-    if line.startswith(("index ", "--- ", "+++ ", "@@")):
-        return True
-    # Content change lines
-    if line.startswith(("+", "-", " ")):
-        return True
-    # Special marker for missing newline
-    return line == "\\ No newline at end of file"
-
-
-def _parse_hunk_line_count(line: str) -> int | None:
-    """Extract the number of added lines from a hunk header like '@@ -1,1000 +1,1000 @@'."""
-    # Match patterns like @@ -1,1000 +1,1000 @@ or @@ -1 +1 @@
-    # The number after the comma in the + section is the line count
-    match = re.match(r"@@ -\d+(?:,\d+)? \+\d+,?(\d+)? @@", line)
-    if match:
-        count_str = match.group(1)
-        if count_str:
-            return int(count_str)
+    rest = line[len("diff --git ") :]
+    if rest.startswith('"'):
+        quoted = _unquote_path(rest)
+        if quoted is None or rest[quoted[1] : quoted[1] + 1] != " ":
+            return None
+        old, new = quoted[0], _parse_path(rest[quoted[1] + 1 :])
+    elif rest.endswith('"'):
+        # Quotes inside a quoted path are escaped, so the last ' "' opens it
+        split = rest.rfind(' "')
+        old, new = rest[:split], _parse_path(rest[split + 1 :])
+    else:
+        half = len(rest) // 2
+        if rest[half : half + 3] == " b/" and rest[2:half] == rest[half + 3 :]:
+            split = half
+        else:
+            split = rest.find(" b/")
+        old, new = rest[:split], rest[split + 1 :]
+    if new is None or not old.startswith("a/") or not new.startswith("b/"):
+        return None
+    return old[2:], new[2:]
+
+
+def _parse_path(value: str, prefix: str = "") -> str | None:
+    """Parse a path that git may have C-quoted, removing its prefix.
+
+    Returns:
+        The path, or None if it is malformed or lacks the prefix
+    """
+    if value.startswith('"'):
+        quoted = _unquote_path(value)
+        if quoted is None:
+            return None
+        path = quoted[0]
+    else:
+        # git ends "---"/"+++" names containing spaces with a tab
+        path = value.rstrip("\t")
+    if not path.startswith(prefix):
+        return None
+    return path[len(prefix) :]
+
+
+def _unquote_path(text: str) -> tuple[str, int] | None:
+    """Decode the C-quoted path git writes for names with special characters.
+
+    Returns:
+        The path and the offset after its closing quote, or None if text
+        does not start with a well-formed quoted path
+    """
+    out = bytearray()
+    i = 1
+    while i < len(text):
+        char = text[i]
+        if char == '"':
+            return out.decode("utf-8", errors="replace"), i + 1
+        if char != "\\":
+            out += char.encode()
+            i += 1
+        elif text[i + 1 : i + 2] in _C_ESCAPES:
+            out.append(_C_ESCAPES[text[i + 1]])
+            i += 2
+        elif re.fullmatch(r"[0-3][0-7]{2}", text[i + 1 : i + 4]):
+            out.append(int(text[i + 1 : i + 4], 8))
+            i += 4
+        else:
+            return None
     return None
 
 
-def _get_effective_line_count(diff: str) -> dict[str, int]:
-    """Get effective line count for filtering purposes.
+def _refine_paths(
+    record: FileDiff, text: Any, newline: int, end: int, syntax: _DiffSyntax
+) -> None:
+    """Take a renamed or copied file's exact paths from its extended header.
 
-    Uses hunk header line count when available (e.g., @@ -1,1000 +1,1000 @@ returns 1000),
-    otherwise falls back to actual line count.
+    Reads the "rename from/to" (or "copy from/to") and "---"/"+++" lines
+    after the "diff --git" line ending at ``newline``, up to ``end``.
     """
-    actual_counts = parse_diff_lines(diff)
-    effective_counts: dict[str, int] = {}
+    old_path = new_path = None
+    for line in _extended_header_lines(text, newline, end, syntax):
+        if line.startswith(("rename from ", "copy from ")):
+            old_path = _parse_path(line.split(" ", 2)[2])
+        elif line.startswith(("rename to ", "copy to ")):
+            new_path = _parse_path(line.split(" ", 2)[2])
+        elif line.startswith("--- ") and old_path is None:
+            old_path = _parse_path(line[4:], "a/")
+        elif line.startswith("+++ ") and new_path is None:
+            new_path = _parse_path(line[4:], "b/")
+    if old_path is not None:
+        record.old_path = old_path
+    if new_path is not None:
+        record.path = new_path
 
-    # Normalize line endings and split
-    lines = diff.replace("\r\n", "\n").split("\n")
-    if lines and lines[-1] == "":
-        lines = lines[:-1]
 
-    current_file: str | None = None
+def _extended_header_lines(
+    text: Any, newline: int, end: int, syntax: _DiffSyntax
+) -> list[str]:
+    """Decode the lines between a "diff --git" line and the first hunk."""
+    lines: list[str] = []
+    while newline != -1 and newline + 1 < end:
+        if len(lines) == _MAX_EXTENDED_HEADER_LINES:
+            break
+        line_end = text.find(syntax.newline, newline + 1, end)
+        line = text[newline + 1 : end if line_end == -1 else line_end]
+        if not isinstance(line, str):
+            line = line.decode("utf-8", errors="replace")
+        line = line.rstrip("\r")
+        if line.startswith(("@@", "diff --git ")):
+            break
+        lines.append(line)
+        newline = line_end
+    return lines
 
+
+def _summarize_metadata_only(record: FileDiff, patch: str) -> str | None:
+    """Collapse a rename-only or mode-only file to a one-line summary.
+
+    Keeps the "diff --git" line and replaces the extended header with a
+    line in the style of ``git diff --summary``, e.g.
+    "rename old.py => new.py (100%)" or "mode change 100644 => 100755".
+
+    Returns:
+        The collapsed patch, or None if the file has other changes
+    """
+    header, *lines = [line.rstrip("\r") for line in patch.rstrip("\n").split("\n")]
+    if not lines or not all(line.startswith(_METADATA_PREFIXES) for line in lines):
+        return None
+    values = {}
     for line in lines:
-        if line.startswith("diff --git "):
-            match = re.match(r"diff --git a/(.*) b/(.*)", line)
-            if match:
-                current_file = match.group(2)
-                # Type-safe: current_file is now confirmed to be str
-                effective_counts[current_file] = actual_counts.get(current_file, 0)
-        elif current_file is not None and line.startswith("@@"):
-            hunk_count = _parse_hunk_line_count(line)
-            if hunk_count is not None and hunk_count > effective_counts.get(
-                current_file, 0
-            ):
-                effective_counts[current_file] = hunk_count
+        words = line.split(" ", 2)
+        values[" ".join(words[:2])] = words[2]
+    parts = []
+    for kind in ("rename", "copy"):
+        if f"{kind} from" in values:
+            similarity = values.get("similarity index")
+            part = f"{kind} {record.old_path} => {record.path}"
+            parts.append(f"{part} ({similarity})" if similarity else part)
+    if "old mode" in values and "new mode" in values:
+        parts.append(f"mode change {values['old mode']} => {values['new mode']}")
+    if not parts:
+        return None
+    return f"{header}\n{', '.join(parts)}\n"
 
-    return effective_counts
 
+def _scan_lines(
+    record: FileDiff | None, text: Any, first: int, last: int, syntax: _DiffSyntax
+) -> int | None:
+    """Update a file record with its lines in text[first:last].
 
-def _collect_files_from_diff(lines: list[str]) -> dict[str, list[str]]:
-    """Collect lines for each file in a diff.
+    Scans the lines starting right after each newline in text[first:last],
+    which must all end by ``last``, and stops at the next file header.
+    Diff content lines are index, "---"/"+++", hunk header, "+"/"-"/" "
+    and "No newline" lines. Lines after a "Binary files differ" marker are
+    not counted, though their hunk headers still are.
 
     Args:
-        lines: List of diff lines (without trailing empty line)
+        record: The file's record, or None to only find the next header
+        text: The diff as str or bytes
+        first: Offset of the newline before the first line to scan
+        last: Offset after the newline before the last line to scan
+        syntax: Patterns matching the type of text
 
     Returns:
-        Dict mapping file paths to their diff lines
+        The offset of the newline before the next file header, or None if
+        there is none in the span
     """
-    files_in_diff: dict[str, list[str]] = {}
-    current_file: str | None = None
+    header = None
+    counted_to = binary_at = last
+    non_content = 0
+    was_binary = record is None or record.is_binary
+    lookahead_end = min(len(text), last + _TOKEN_LOOKAHEAD)
+    for match in syntax.token.finditer(text, first, lookahead_end):
+        newline = match.start()
+        if newline >= last:
+            break
+        kind = match.lastgroup
+        if kind == "header":
+            header = counted_to = newline
+            break
+        if record is None:
+            continue
+        if kind == "hunk":
+            record.hunks += 1
+            count = match.group("count")
+            if count and int(count) > record.max_hunk_count:
+                record.max_hunk_count = int(count)
+        elif record.is_binary:
+            continue
+        elif _is_binary_marker(text, newline + 1, syntax):
+            record.is_binary = True
+            binary_at = newline
+        else:
+            non_content += 1
+
+    if not was_binary:
+        end = binary_at if record.is_binary else counted_to
+        record.line_count += text.count(syntax.newline, first, end) - non_content
+    return header
 
+
+def _is_binary_marker(text: Any, start: int, syntax: _DiffSyntax) -> bool:
+    """Check if the line at text[start:] is git's binary file marker.
+
+    git writes "Binary files a/x and b/x differ", with /dev/null for an
+    added or deleted side, or just "Binary files differ".
+    """
+    if not text.startswith(syntax.binary_prefix, start):
+        return False
+    end = text.find(syntax.newline, start)
+    if end == -1:
+        end = len(text)
+    if text.endswith(syntax.carriage_return, start, end):
+        end -= 1
+    return text.endswith(syntax.binary_suffix, start, end)
+
+
+def _context_options(context: int | str | None) -> list[str]:
+    """Return the git diff options for a context width; see get_diff()."""
+    if context is None:
+        return []
+    if context == "auto":
+        return [f"-U{_CONTEXT_LEVELS[0]}"]
+    return [f"-U{context}"]
+
+
+def _with_function_context(
+    text: str, cmd: list[str], max_lines: int, matcher: IgnoreMatcher
+) -> str:
+    """Replace files in text by their diff from cmd, where that one is kept."""
+    try:
+        wide, _ = _stream_filtered_diff(cmd, max_lines, matcher)
+    except (subprocess.CalledProcessError, OSError):
+        return text
+    replacements = {f.path: wide[f.start : f.end] for f in index_diff(wide)}
+    return "".join(
+        replacements.get(f.path, text[f.start : f.end]) for f in index_diff(text)
+    )
+
+
+def _join_file_spans(diff: str, files: list[FileDiff]) -> str:
+    """Concatenate the spans of the given files, ending with a newline."""
+    if not files:
+        return ""
+    result = "".join(diff[f.start : f.end] for f in files)
+    return result if result.endswith("\n") else result + "\n"
+
+
+def _stream_filtered_diff(
+    cmd: list[str],
+    max_lines: int,
+    matcher: IgnoreMatcher,
+    generated: dict[str, str] | None = None,
+) -> tuple[str, list[str]]:
+    """Run a git diff command and keep only the files that pass the filters.
+
+    The pipe is read in large blocks and tokenized as bytes; see
+    _DiffStreamFilter. The kept files are decoded once, at the end.
+
+    Returns:
+        The kept diff text and the paths dropped for exceeding max_lines
+
+    Raises:
+        subprocess.CalledProcessError: If the git command fails
+    """
+    stream_filter = _DiffStreamFilter(max_lines, matcher, generated)
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    assert process.stdout is not None
+    with process:
+        while chunk := process.stdout.read(_READ_SIZE):
+            stream_filter.feed(chunk)
+        kept = stream_filter.close()
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+
+    result = kept.decode("utf-8", errors="replace")
+    if result and not result.endswith("\n"):
+        result += "\n"
+    return result, stream_filter.dropped
+
+
+def _parse_numstat(output: str) -> list[FileStat]:
+    """Parse ``git diff --numstat -z`` output.
+
+    Each record is "added<TAB>deleted<TAB>path<NUL>", or for renames
+    "added<TAB>deleted<TAB><NUL>old<NUL>new<NUL>". Binary files report "-"
+    for both counts.
+    """
+    stats: list[FileStat] = []
+    fields = output.split("\0")
+    i = 0
+    while i < len(fields):
+        record = fields[i]
+        i += 1
+        if not record:
+            continue
+        added, deleted, path = record.split("\t", 2)
+        old_path = None
+        if not path:
+            old_path, path = fields[i], fields[i + 1]
+            i += 2
+        stats.append(
+            FileStat(
+                path=path,
+                added=None if added == "-" else int(added),
+                deleted=None if deleted == "-" else int(deleted),
+                old_path=old_path,
+            )
+        )
+    return stats
+
+
+class _DiffStreamFilter:
+    """Incrementally filter raw diff output fed in arbitrary blocks.
+
+    Each block's complete lines are tokenized in place, as bytes, with the
+    same scans as index_diff_bytes(). Only the current file's bytes are
+    retained, and only while it is still a candidate, so ignored and
+    oversized files are discarded as they arrive and peak memory is bounded
+    by the largest kept file plus one block.
+
+    Generated files are replaced by a stub as soon as their header arrives,
+    and kept files with very long lines when they end.
+    """
+
+    def __init__(
+        self,
+        max_lines: int,
+        matcher: IgnoreMatcher,
+        generated: dict[str, str] | None = None,
+    ):
+        self.max_lines = max_lines
+        self.matcher = matcher
+        self.generated = generated or {}
+        self.kept = bytearray()
+        self.dropped: list[str] = []
+        # A newline stands in for the end of the line before the first, so
+        # every line starts right after a newline in the buffer
+        self._buffer = bytearray(b"\n")
+        # Offset of the newline after which the next unscanned line starts
+        self._scanned = 0
+        # The candidate file, spanning the buffer from its start offset
+        self._current: FileDiff | None = None
+
+    def feed(self, chunk: bytes) -> None:
+        """Scan every complete line of a block of diff output."""
+        buffer = self._buffer
+        buffer += chunk
+        last = buffer.rfind(b"\n")
+        while last > self._scanned:
+            current = self._current
+            header = _scan_lines(current, buffer, self._scanned, last, _BYTES_SYNTAX)
+            if current is not None and current.effective_line_count > self.max_lines:
+                # Too large: drop it and skip the rest of the file
+                self._resolve_paths(current, last)
+                self.dropped.append(current.path)
+                self._current = None
+            if header is None:
+                self._scanned = last
+                break
+            self._start_file(header + 1)
+
+        # Forget bytes no longer needed: everything scanned, unless it
+        # belongs to the current candidate file
+        keep_from = self._current.start if self._current else self._scanned
+        if keep_from:
+            del buffer[:keep_from]
+            self._scanned -= keep_from
+            if self._current is not None:
+                self._current.start = 0
+
+    def close(self) -> bytearray:
+        """Scan a final unterminated line and return the kept bytes."""
+        if not self._buffer.endswith(b"\n"):
+            self.feed(b"\n")
+        self._flush(len(self._buffer))
+        return self.kept
+
+    def _start_file(self, start: int) -> None:
+        """Finish the current file and start one at a complete header line."""
+        self._flush(start)
+        newline = self._buffer.find(b"\n", start)
+        record = _new_file_record(self._buffer, start, newline, 0, _BYTES_SYNTAX)
+        self._scanned = newline
+        if record is None or self.matcher.is_ignored(record.path):
+            return
+        reason = generated_file_reason(record.path, self.generated)
+        if reason is not None:
+            self._stub(self._buffer[start : newline + 1], reason)
+        else:
+            self._current = record
+
+    def _flush(self, end: int) -> None:
+        """Keep the current file, which ends at this offset, if any."""
+        current = self._current
+        if current is None:
+            return
+        self._current = None
+        self._resolve_paths(current, end)
+        if current.old_path is not None and self.matcher.is_ignored(current.path):
+            return
+        patch = memoryview(self._buffer)[current.start : end]
+        if current.hunks == 0 and not current.is_binary:
+            summary = _summarize_metadata_only(
+                current, bytes(patch).decode("utf-8", errors="replace")
+            )
+            if summary is not None:
+                self.kept += summary.encode()
+                return
+        if not current.is_binary and _LONG_LINE_RE.search(patch):
+            header_end = self._buffer.find(b"\n", current.start, end) + 1
+            self._stub(self._buffer[current.start : header_end or end], "long lines")
+            return
+        self.kept += patch
+
+    def _stub(self, header: bytes | bytearray, reason: str) -> None:
+        """Keep a file as its "diff --git" line and a note of why."""
+        self.kept += header
+        if not header.endswith(b"\n"):
+            self.kept += b"\n"
+        self.kept += f"[{reason}, diff omitted]\n".encode()
+
+    def _resolve_paths(self, record: FileDiff, end: int) -> None:
+        """Correct a renamed file's paths once its header lines are buffered."""
+        if record.old_path is not None:
+            newline = self._buffer.find(b"\n", record.start, end)
+            _refine_paths(record, self._buffer, newline, end, _BYTES_SYNTAX)
+
+
+class _PackFile:
+    """Working state for one file while pack_diff() fills the budget."""
+
+    def __init__(self, path: str, header: str, hunks: list[str]):
+        self.path = path
+        self.header = header
+        self.hunks = hunks
+        self.first_line = header.split("\n", 1)[0] + "\n"
+        self.is_test = is_test_path(path)
+        self.collapsed = "\ndeleted file mode " in header or (
+            not hunks and "\nrename from " in header
+        )
+        self.header_only = False
+        self.full_hunks: set[int] = set()
+        self.body_tokens = estimate_tokens("".join(hunks))
+        self.minimal_tokens = estimate_tokens(self.render())
+
+    @classmethod
+    def from_span(cls, record: FileDiff, text: str) -> "_PackFile":
+        """Split one file's diff text into its header and hunks."""
+        return cls(record.path, *_split_hunks(text))
+
+    def hunk_upgrade_tokens(self, index: int) -> int:
+        """Extra tokens needed to show hunk index in full."""
+        return estimate_tokens(self.hunks[index]) - estimate_tokens(
+            self._reduced_hunk(self.hunks[index])
+        )
+
+    def render(self) -> str:
+        """Render the file with the hunks chosen so far."""
+        if self.header_only:
+            return self.first_line
+        if self.collapsed:
+            return "".join(
+                line
+                for line in self.header.splitlines(keepends=True)
+                if line.startswith(
+                    ("diff --git ", "deleted file mode ", "rename from ", "rename to ")
+                )
+            )
+        parts = [self.header]
+        for index, hunk in enumerate(self.hunks):
+            parts.append(hunk if index in self.full_hunks else self._reduced_hunk(hunk))
+        return "".join(parts)
+
+    @staticmethod
+    def _reduced_hunk(hunk: str) -> str:
+        """Reduce a hunk to its "@@" line and a note of what was left out."""
+        header, _, body = hunk.partition("\n")
+        omitted = body.count("\n")
+        return f"{header}\n[... {omitted} lines omitted ...]\n"
+
+
+def _split_hunks(text: str) -> tuple[str, list[str]]:
+    """Split one file's diff text into its header and hunks."""
+    starts = [m.start() + 1 for m in re.finditer(r"\n@@", text)]
+    if not starts:
+        return text, []
+    bounds = starts + [len(text)]
+    hunks = [text[bounds[k] : bounds[k + 1]] for k in range(len(starts))]
+    return text[: starts[0]], hunks
+
+
+def _format_range(start: int, count: int) -> str:
+    """Format one side of a hunk range, omitting a count of 1 like git."""
+    return str(start) if count == 1 else f"{start},{count}"
+
+
+def _line_content(line: str) -> str:
+    """Return a hunk line without its prefix, newline or "No newline" marker."""
+    return line[1:].split("\n", 1)[0]
+
+
+def _indents(lines: list[str]) -> list[tuple[str, str]]:
+    """Pair each non-blank line's leading whitespace with its squashed text."""
+    indents = []
     for line in lines:
-        if line.startswith("diff --git "):
-            # Extract file path
-            match = re.match(r"diff --git a/(.*) b/(.*)", line)
-            if match:
-                current_file = match.group(2)
-                files_in_diff[current_file] = [line]
+        text = line.split("\n", 1)[0]
+        stripped = text.lstrip()
+        if stripped:
+            indents.append((text[: len(text) - len(stripped)], "".join(text.split())))
+    return indents
+
+
+class _CondenseHunk:
+    """One hunk while condense_diff() works on it."""
+
+    def __init__(self, header: str, lines: list[str]):
+        self.header = header
+        self.lines = lines
+        self.reduced: str | None = None
+        self.moves: dict[int, tuple[int, str]] = {}
+
+    @classmethod
+    def parse(cls, hunk: str) -> "_CondenseHunk":
+        header, _, body = hunk.partition("\n")
+        lines = _LINE_RE.findall(body)
+        if body.startswith("\\") or "\n\\" in body:
+            # "No newline" markers stay attached to the line they describe
+            merged: list[str] = []
+            for line in lines:
+                if line.startswith("\\") and merged:
+                    merged[-1] += line
+                else:
+                    merged.append(line)
+            lines = merged
+        return cls(header, lines)
+
+    def trim_context(self, context_lines: int) -> list["_CondenseHunk"]:
+        """Split the hunk around its changes, keeping context_lines around each.
+
+        Returns the hunk itself when nothing needs trimming or its ranges
+        cannot be read. Notes left by condense_diff() are kept like changes.
+        """
+        match = _HUNK_RANGE_RE.match(self.header)
+        changes = [i for i, line in enumerate(self.lines) if line[0] in "+-["]
+        if match is None or not changes:
+            return [self]
+        if (
+            changes[0] <= context_lines
+            and changes[-1] + context_lines >= len(self.lines) - 1
+            and all(
+                b - a <= 2 * context_lines + 1 for a, b in zip(changes, changes[1:])
+            )
+        ):
+            return [self]
+        windows: list[list[int]] = []
+        for i in changes:
+            low = max(0, i - context_lines)
+            high = min(len(self.lines), i + context_lines + 1)
+            if windows and low <= windows[-1][1]:
+                windows[-1][1] = high
             else:
-                current_file = None
-        elif current_file is not None:
-            files_in_diff[current_file].append(line)
+                windows.append([low, high])
+
+        # Line numbers before each line; an empty side starts one line early
+        old_line = int(match[1]) + (match[2] == "0")
+        new_line = int(match[3]) + (match[4] == "0")
+        positions = []
+        for line in self.lines:
+            positions.append((old_line, new_line))
+            old_line += line[0] not in "+["
+            new_line += line[0] not in "-["
+
+        hunks = []
+        for index, (low, high) in enumerate(windows):
+            lines = self.lines[low:high]
+            old_count = sum(line[0] not in "+[" for line in lines)
+            new_count = sum(line[0] not in "-[" for line in lines)
+            old_start, new_start = positions[low]
+            # The function context only describes the original start
+            suffix = self.header[match.end() :] if index == 0 else ""
+            header = (
+                f"@@ -{_format_range(old_start - (old_count == 0), old_count)} "
+                f"+{_format_range(new_start - (new_count == 0), new_count)} @@"
+                f"{suffix}"
+            )
+            hunks.append(_CondenseHunk(header, lines))
+        return hunks
+
+    def cosmetic_change(self, indent_sensitive: bool = False) -> str | None:
+        """Describe the hunk's changes if they only touch whitespace or order.
+
+        Only import and include lines count as reordered; with
+        indent_sensitive, a change of leading indentation is never cosmetic.
+        """
+        old_lines = [line[1:] for line in self.lines if line[:1] != "+"]
+        new_lines = [line[1:] for line in self.lines if line[:1] != "-"]
+        marker = "\n" + _NO_NEWLINE_MARKER
+        old = "".join("".join(old_lines).replace(marker, "").split())
+        new = "".join("".join(new_lines).replace(marker, "").split())
+        # Reordered lines also have as many non-whitespace characters
+        if len(old) != len(new):
+            return None
+        if old == new:
+            if not indent_sensitive or _indents(old_lines) == _indents(new_lines):
+                return "whitespace-only changes"
+            return None
+        removed = [_line_content(line) for line in self.lines if line[:1] == "-"]
+        added = [_line_content(line) for line in self.lines if line[:1] == "+"]
+        strip = str.rstrip if indent_sensitive else str.strip
+        removed = [strip(line) for line in removed if line.strip()]
+        added = [strip(line) for line in added if line.strip()]
+        if sorted(removed) == sorted(added) and all(
+            _IMPORT_LINE_RE.match(line.lstrip()) for line in removed
+        ):
+            return "reordered lines"
+        return None
+
+    def runs(self, prefix: str) -> Iterator[tuple[int, int]]:
+        """Yield the (start, end) of each run of consecutive prefix lines."""
+        start = None
+        for i, line in enumerate([*self.lines, ""]):
+            if line[:1] == prefix:
+                if start is None:
+                    start = i
+            elif start is not None:
+                yield start, i
+                start = None
+
+    def reduce(self, note: str) -> bool:
+        """Replace the hunk's lines by a note, unless that is no shorter."""
+        reduced = f"{self.header}\n[{note}, {len(self.lines)} lines omitted]\n"
+        if len(reduced) >= len(self.render()):
+            return False
+        self.reduced = reduced
+        return True
+
+    def render(self) -> str:
+        """Render the hunk with its notes in place of condensed lines."""
+        if self.reduced is not None:
+            return self.reduced
+        parts = [self.header, "\n"]
+        i = 0
+        while i < len(self.lines):
+            if i in self.moves:
+                i, note = self.moves[i]
+                parts.append(f"[{note}]\n")
+                continue
+            parts.append(self.lines[i])
+            i += 1
+        text = "".join(parts)
+        return text if text.endswith("\n") else text + "\n"
+
+
+class _CondenseFile:
+    """One file while condense_diff() works on it."""
+
+    def __init__(self, path: str, header: str, hunks: list[str]):
+        self.path = path
+        self.header = header
+        self.hunks = [_CondenseHunk.parse(hunk) for hunk in hunks]
+        self.note: str | None = None
+
+    @classmethod
+    def from_span(cls, record: FileDiff, text: str) -> "_CondenseFile":
+        return cls(record.path, *_split_hunks(text))
+
+    def trim_context(self, context_lines: int) -> int:
+        """Trim every hunk's context, returning the number of lines dropped."""
+        before = sum(len(hunk.lines) for hunk in self.hunks)
+        self.hunks = [
+            trimmed
+            for hunk in self.hunks
+            for trimmed in hunk.trim_context(context_lines)
+        ]
+        return before - sum(len(hunk.lines) for hunk in self.hunks)
+
+    def reduce_cosmetic_hunks(self) -> int:
+        """Reduce hunks that only change whitespace or order to a note.
+
+        Returns:
+            The number of hunks reduced
+        """
+        indent_sensitive = bool(_INDENT_SENSITIVE_RE.search(self.path))
+        changes = [hunk.cosmetic_change(indent_sensitive) for hunk in self.hunks]
+        if self.hunks and None not in changes:
+            note = " and ".join(sorted(set(changes)))
+            if len(self._header_line() + note) < len(self.render()):
+                self.note = note
+                return len(self.hunks)
+        return sum(
+            hunk.reduce(change)
+            for hunk, change in zip(self.hunks, changes)
+            if change is not None
+        )
+
+    def render(self) -> str:
+        if self.note is not None:
+            return f"{self._header_line()}[{self.note}, diff omitted]\n"
+        return self._header_line() + "".join(hunk.render() for hunk in self.hunks)
 
-    return files_in_diff
+    def _header_line(self) -> str:
+        return self.header if self.header.endswith("\n") else self.header + "\n"
+
+
+def _move_key(hunk: _CondenseHunk, start: int, end: int) -> tuple[str, ...] | None:
+    """Key a run of lines by content without indentation, if long enough."""
+    if end - start < _MIN_MOVED_LINES:
+        return None
+    key = tuple(_line_content(line).strip() for line in hunk.lines[start:end])
+    if sum(1 for line in key if line) < _MIN_MOVED_LINES:
+        return None
+    if sum(c.isalnum() for line in key for c in line) < _MIN_MOVED_CHARS:
+        return None
+    return key
+
+
+def _collapse_moved_blocks(files: list[_CondenseFile]) -> int:
+    """Replace runs removed in one place and added in another by notes.
+
+    Only whole runs of consecutive removed or added lines are matched. A
+    run added right after the same run was removed, as when a block is
+    re-indented, is left alone: in languages like Python that changes
+    what the code does.
+
+    Returns:
+        The number of moved blocks
+    """
+    hunks = [
+        (condense_file.path, hunk)
+        for condense_file in files
+        if condense_file.note is None
+        for hunk in condense_file.hunks
+        if hunk.reduced is None
+    ]
+    removed: dict[tuple[str, ...], list[tuple[str, _CondenseHunk, int, int]]] = {}
+    for path, hunk in hunks:
+        for start, end in hunk.runs("-"):
+            key = _move_key(hunk, start, end)
+            if key is not None:
+                removed.setdefault(key, []).append((path, hunk, start, end))
+
+    moved = 0
+    for path, hunk in hunks:
+        for start, end in hunk.runs("+"):
+            key = _move_key(hunk, start, end)
+            candidates = removed.get(key, []) if key is not None else []
+            for index, (source, source_hunk, low, high) in enumerate(candidates):
+                if source_hunk is not hunk or high != start:
+                    break
+            else:
+                continue
+            del candidates[index]
+            if source == path:
+                note = f"moved {end - start} lines within {path}"
+            else:
+                note = f"moved {end - start} lines from {source} to {path}"
+            source_hunk.moves[low] = (high, note)
+            hunk.moves[start] = (end, note)
+            moved += 1
+    return moved
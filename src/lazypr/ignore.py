@@ -1,5 +1,6 @@
 """Ignore pattern functions for .lazyprignore file."""
 
+from functools import lru_cache
 from pathlib import Path
 
 import pathspec
@@ -22,52 +23,107 @@ def load_ignore_patterns() -> list[str]:
     return patterns
 
 
-def matches_pattern(pattern: str, filepath: str) -> bool:
-    """Check if filepath matches a gitignore-style pattern."""
-    # Handle negation patterns
-    if pattern.startswith("!"):
-        pattern = pattern[1:]
-        # For negation, we check if it matches - caller decides meaning
-        spec = pathspec.PathSpec.from_lines("gitwildmatch", [pattern])
-        return spec.match_file(filepath)
+class IgnoreMatcher:
+    """Compiled .lazyprignore patterns.
 
-    spec = pathspec.PathSpec.from_lines("gitwildmatch", [pattern])
-    return spec.match_file(filepath)
+    The patterns are compiled once into a single spec and follow gitignore
+    semantics: the last matching pattern wins, so a negation ("!pattern")
+    re-includes a file only when it comes after the pattern that excluded it.
+    """
 
+    def __init__(self, patterns: list[str]):
+        self.patterns = list(patterns)
+        self._spec = pathspec.GitIgnoreSpec.from_lines(self.patterns)
 
-def apply_ignore_patterns(files: list[str], patterns: list[str]) -> list[str]:
-    """Filter out files matching ignore patterns."""
-    if not patterns:
-        return files
+    def is_ignored(self, filepath: str) -> bool:
+        """Check if filepath is excluded by the patterns."""
+        return bool(self.patterns) and self._spec.match_file(filepath)
 
-    # Separate regular patterns from negation patterns
-    regular_patterns: list[str] = []
-    negation_patterns: list[str] = []
+    def filter(self, files: list[str]) -> list[str]:
+        """Return the files that are not excluded, preserving order."""
+        if not self.patterns:
+            return files
+        return [f for f in files if not self._spec.match_file(f)]
 
-    for pattern in patterns:
-        if pattern.startswith("!"):
-            negation_patterns.append(pattern[1:])
-        else:
-            regular_patterns.append(pattern)
 
-    result: list[str] = []
+@lru_cache(maxsize=None)
+def compile_ignore_patterns(patterns: tuple[str, ...]) -> IgnoreMatcher:
+    """Compile patterns into an IgnoreMatcher, reusing earlier compilations."""
+    return IgnoreMatcher(list(patterns))
 
-    for filepath in files:
-        # Check if file matches any regular pattern
-        ignored = False
-        for pattern in regular_patterns:
-            if matches_pattern(pattern, filepath):
-                ignored = True
-                break
 
-        # Check negation patterns (re-include if matches)
-        if ignored:
-            for pattern in negation_patterns:
-                if matches_pattern(pattern, filepath):
-                    ignored = False
-                    break
+def matches_pattern(pattern: str, filepath: str) -> bool:
+    """Check if filepath matches a gitignore-style pattern.
 
-        if not ignored:
-            result.append(filepath)
+    A negation pattern ("!pattern") is checked without the "!"; the caller
+    decides what a match means.
+    """
+    if pattern.startswith("!"):
+        pattern = pattern[1:]
+    return compile_ignore_patterns((pattern,)).is_ignored(filepath)
 
-    return result
+
+def apply_ignore_patterns(files: list[str], patterns: list[str]) -> list[str]:
+    """Filter out files matching ignore patterns."""
+    if not patterns:
+        return files
+    return compile_ignore_patterns(tuple(patterns)).filter(files)
+
+
+def to_git_pathspecs(patterns: list[str]) -> tuple[list[str], list[str]]:
+    """Translate ignore patterns into git exclude pathspecs.
+
+    Excluding files in git means they are never diffed at all. Git cannot
+    re-include an excluded path, so patterns that a later negation could
+    override are left for the Python-side filter, as are patterns using
+    escapes that have no pathspec equivalent.
+
+    Args:
+        patterns: Ignore patterns as returned by load_ignore_patterns
+
+    Returns:
+        A tuple of (pathspecs to pass to git, patterns still to apply in Python)
+    """
+    last_negation = max(
+        (i for i, pattern in enumerate(patterns) if pattern.startswith("!")),
+        default=-1,
+    )
+
+    pathspecs: list[str] = []
+    fallback: list[str] = list(patterns[: last_negation + 1])
+    for pattern in patterns[last_negation + 1 :]:
+        specs = _to_git_pathspec(pattern)
+        if specs is None:
+            fallback.append(pattern)
+        else:
+            pathspecs.extend(specs)
+
+    return pathspecs, fallback
+
+
+def _to_git_pathspec(pattern: str) -> list[str] | None:
+    """Translate one gitignore-style pattern to git exclude pathspecs.
+
+    Returns None when the pattern cannot be expressed as glob pathspecs.
+    """
+    if "\\" in pattern or pattern != pattern.strip():
+        return None
+
+    dir_only = pattern.endswith("/")
+    path = pattern.rstrip("/")
+    # A slash anywhere but the end anchors the pattern to the repo root
+    anchored = "/" in path
+    path = path.lstrip("/")
+    if not path:
+        return None
+
+    glob = path if anchored else f"**/{path}"
+    if glob.endswith("/**"):
+        return [f":(top,exclude,glob){glob}"]
+    # Glob pathspecs do not match leading directories, while a gitignore
+    # pattern naming a directory excludes everything in it, so "build"
+    # needs "**/build/**" as well
+    specs = [f":(top,exclude,glob){glob}/**"]
+    if not dir_only:
+        specs.insert(0, f":(top,exclude,glob){glob}")
+    return specs
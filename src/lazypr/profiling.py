@@ -0,0 +1,126 @@
+"""Phase timings and tracing for --profile."""
+
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from .config import get_logfire_enabled
+
+_profiler: ContextVar[Optional["Profiler"]] = ContextVar(
+    "lazypr_profiler", default=None
+)
+_depth: ContextVar[int] = ContextVar("lazypr_phase_depth", default=0)
+
+
+@dataclass
+class Span:
+    """One timed phase, in seconds relative to the start of the profile."""
+
+    name: str
+    start: float
+    duration: float
+    depth: int
+    thread_id: int
+
+
+class Profiler:
+    """Collects phase timings for one run.
+
+    With LAZYPR_LOGFIRE set, every phase is also sent as a logfire span, so
+    it reaches any OpenTelemetry backend logfire is configured for, and the
+    pydantic-ai model calls are instrumented too.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.spans: list[Span] = []
+        self._logfire: Any = None
+        if get_logfire_enabled():
+            import logfire
+
+            logfire.configure(
+                service_name="lazypr", send_to_logfire="if-token-present", console=False
+            )
+            logfire.instrument_pydantic_ai()
+            self._logfire = logfire
+
+    def total(self) -> float:
+        """Seconds elapsed since the profile started."""
+        return time.perf_counter() - self.started
+
+    def report(self) -> str:
+        """Format the phases as an indented breakdown in start order.
+
+        Phases run concurrently, so durations can add up to more than the
+        total; the start offset shows what overlapped.
+        """
+        lines = [f"Phase timings (total {self.total():.3f}s):"]
+        for span in sorted(self.spans, key=lambda s: (s.start, s.depth)):
+            indent = "  " * span.depth
+            lines.append(
+                f"  {span.start:7.3f}s  {span.duration:7.3f}s  {indent}{span.name}"
+            )
+        return "\n".join(lines)
+
+    def write_trace(self, path: Path) -> None:
+        """Write the phases as a Chrome trace file (chrome://tracing, Perfetto)."""
+        events = [
+            {
+                "name": span.name,
+                "ph": "X",
+                "ts": round(span.start * 1e6),
+                "dur": round(span.duration * 1e6),
+                "pid": 1,
+                "tid": span.thread_id,
+            }
+            for span in self.spans
+        ]
+        path.write_text(json.dumps({"traceEvents": events}, indent=1))
+
+    def _otel_span(self, name: str) -> Any:
+        if self._logfire is None:
+            return nullcontext()
+        return self._logfire.span(name)
+
+
+@contextmanager
+def profiling(profiler: Optional[Profiler]) -> Iterator[Optional[Profiler]]:
+    """Record phases run in this context (including tasks and to_thread calls)."""
+    token = _profiler.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _profiler.reset(token)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Time a phase of the run; does nothing unless profiling is active."""
+    profiler = _profiler.get()
+    if profiler is None:
+        yield
+        return
+
+    depth = _depth.get()
+    token = _depth.set(depth + 1)
+    start = time.perf_counter()
+    try:
+        with profiler._otel_span(name):
+            yield
+    finally:
+        end = time.perf_counter()
+        _depth.reset(token)
+        profiler.spans.append(
+            Span(
+                name=name,
+                start=start - profiler.started,
+                duration=end - start,
+                depth=depth,
+                thread_id=threading.get_ident(),
+            )
+        )
@@ -0,0 +1,13 @@
+"""Token estimation helpers."""
+
+# Rough average for English text and source code across common tokenizers
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate how many tokens text will use in a prompt.
+
+    Uses a characters-per-token heuristic, which is close enough for
+    budgeting without shipping a model-specific tokenizer.
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
@@ -0,0 +1,167 @@
+"""Token usage and cost accounting, and the local usage log."""
+
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+from typing import Optional
+
+
+@dataclass
+class TokenUsage:
+    """Tokens used by the model requests of one run.
+
+    estimated_tokens is the input size estimated before any request was
+    sent; the other counts are what the provider reported. input_tokens
+    includes the cache_read_tokens served from the provider's prompt cache
+    and the cache_write_tokens written to it. cost is in USD, or None when
+    the model's price is unknown.
+    """
+
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    estimated_tokens: int = 0
+    cost: Optional[float] = 0.0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+
+    def add(self, other: "TokenUsage") -> None:
+        """Add another run's usage to this one."""
+        self.requests += other.requests
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.estimated_tokens += other.estimated_tokens
+        self.cache_read_tokens += other.cache_read_tokens
+        self.cache_write_tokens += other.cache_write_tokens
+        if self.cost is None or other.cost is None:
+            self.cost = None
+        else:
+            self.cost += other.cost
+
+    def summary(self) -> str:
+        """Describe the usage in one line, e.g. for the end of a run."""
+        cached = (
+            f" ({self.cache_read_tokens:,} cached)" if self.cache_read_tokens else ""
+        )
+        text = (
+            f"Tokens: {self.input_tokens:,} in{cached}, {self.output_tokens:,} out "
+            f"in {self.requests} request(s) (estimated ~{self.estimated_tokens:,} in)"
+        )
+        return f"{text}, {format_cost(self.cost)}"
+
+
+@dataclass
+class UsageRecord:
+    """One run in the usage log."""
+
+    timestamp: float
+    command: str
+    model: str
+    usage: TokenUsage
+
+
+def estimate_cost(
+    model_name: str,
+    provider: Optional[str],
+    input_tokens: int,
+    output_tokens: int,
+    cache_read_tokens: int = 0,
+    cache_write_tokens: int = 0,
+) -> Optional[float]:
+    """Estimate the price of a model's usage in USD with genai-prices.
+
+    Args:
+        model_name: The model name without provider prefix (e.g. "gpt-4.1")
+        provider: The provider name, used to pick the right price list
+        input_tokens: Input tokens used, including cached ones
+        output_tokens: Output tokens used
+        cache_read_tokens: Input tokens read from the prompt cache
+        cache_write_tokens: Input tokens written to the prompt cache
+
+    Returns:
+        The price, or None if the model is not in the price list
+    """
+    from genai_prices import Usage, calc_price
+
+    usage = Usage(
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        cache_read_tokens=cache_read_tokens,
+        cache_write_tokens=cache_write_tokens,
+    )
+    for provider_id in (provider, None) if provider else (None,):
+        try:
+            price = calc_price(usage, model_name, provider_id=provider_id)
+        except LookupError:
+            continue
+        return float(price.total_price)
+    return None
+
+
+def format_cost(cost: Optional[float]) -> str:
+    """Format a cost in USD, e.g. "~$0.0123" or "cost unknown"."""
+    return "cost unknown" if cost is None else f"~${cost:.4f}"
+
+
+def get_usage_log_path() -> Path:
+    """Return the usage log path.
+
+    Uses $XDG_STATE_HOME/lazypr/usage.jsonl, falling back to
+    ~/.local/state/lazypr/usage.jsonl.
+    """
+    base = os.environ.get("XDG_STATE_HOME") or str(Path.home() / ".local" / "state")
+    return Path(base) / "lazypr" / "usage.jsonl"
+
+
+def record_usage(command: str, model: str, usage: TokenUsage) -> None:
+    """Append a run to the usage log.
+
+    Failures are ignored: the log is for reporting, never a requirement.
+    """
+    entry = {"timestamp": time.time(), "command": command, "model": model}
+    entry.update(asdict(usage))
+    path = get_usage_log_path()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # One write per line in append mode, so concurrent runs never
+        # interleave within a line
+        with open(path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+    except OSError:
+        pass
+
+
+def load_usage_records(since: Optional[float] = None) -> list[UsageRecord]:
+    """Read the usage log, skipping unreadable lines.
+
+    Args:
+        since: Only return runs at or after this Unix timestamp
+
+    Returns:
+        Records in the order they were logged
+    """
+    usage_fields = {field.name for field in fields(TokenUsage)}
+    records: list[UsageRecord] = []
+    try:
+        with open(get_usage_log_path()) as f:
+            lines = f.readlines()
+    except OSError:
+        return records
+    for line in lines:
+        try:
+            entry = json.loads(line)
+            record = UsageRecord(
+                timestamp=float(entry["timestamp"]),
+                command=str(entry["command"]),
+                model=str(entry["model"]),
+                usage=TokenUsage(
+                    **{k: v for k, v in entry.items() if k in usage_fields}
+                ),
+            )
+        except (ValueError, KeyError, TypeError):
+            continue
+        if since is None or record.timestamp >= since:
+            records.append(record)
+    return records
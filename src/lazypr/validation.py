@@ -1,8 +1,12 @@
 """Validation functions for git and gh CLI."""
 
+import asyncio
 import os
 import shutil
 import subprocess
+from dataclasses import dataclass
+
+from .profiling import phase
 
 
 # Custom exceptions
@@ -113,12 +117,174 @@ def is_branch_pushed_to_remote(branch: str) -> bool:
 def push_branch_to_remote(branch: str, remote: str = "origin") -> None:
     """Push branch to remote with upstream tracking."""
     try:
-        subprocess.run(
-            ["git", "push", "-u", remote, branch],
-            capture_output=True,
-            text=True,
-            check=True,
-        )
+        with phase("git push"):
+            subprocess.run(
+                ["git", "push", "-u", remote, branch],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
     except subprocess.CalledProcessError as e:
         error_msg = e.stderr.strip() if e.stderr else str(e)
         raise ValidationError(f"Failed to push branch: {error_msg}") from e
+
+
+# =============================================================================
+# ASYNC PRE-FLIGHT CHECKS
+# =============================================================================
+
+
+@dataclass
+class PreflightResult:
+    """State gathered by run_preflight_checks() for the rest of create()."""
+
+    current_branch: str
+    branch_pushed: bool
+
+
+async def run_preflight_checks(base: str, remote: str = "origin") -> PreflightResult:
+    """Run every pre-flight check concurrently and report all failures at once.
+
+    The checks are independent subprocesses (including the network round
+    trip of 'gh auth status'), so total wall-clock time is that of the
+    slowest check rather than their sum.
+
+    Args:
+        base: The base branch the PR will target
+        remote: The remote that must be configured (default: "origin")
+
+    Returns:
+        The current branch and whether it is fully pushed to its upstream
+
+    Raises:
+        ValidationError: Listing every failed check, one per line
+    """
+    gh_installed = has_gh_cli()
+    git_repo, gh_authenticated, remote_ok, branch, pushed, ahead = await asyncio.gather(
+        is_git_repo_async(),
+        gh_is_authenticated_async() if gh_installed else _false(),
+        has_remote_async(remote),
+        get_current_branch_async(),
+        is_branch_pushed_to_remote_async(),
+        has_commits_ahead_async(base),
+    )
+
+    errors: list[str] = []
+    if not git_repo:
+        errors.append("Not in a git repository")
+    if not gh_installed:
+        errors.append("gh CLI not installed")
+    elif not gh_authenticated:
+        errors.append("gh CLI not authenticated. Run 'gh auth login'")
+    # The remaining checks are meaningless outside a git repository
+    if git_repo:
+        if not remote_ok:
+            errors.append(f"No '{remote}' remote found")
+        if branch is None:
+            errors.append("Failed to get current branch")
+        if not ahead:
+            errors.append(f"No commits ahead of '{base}'")
+
+    if errors:
+        raise ValidationError("\n".join(errors))
+
+    return PreflightResult(current_branch=branch or "", branch_pushed=pushed)
+
+
+async def run_repository_checks(remote: str = "origin") -> None:
+    """Run the pre-flight checks that do not depend on the current branch.
+
+    Used by batch mode, which works on remote branches rather than HEAD.
+
+    Args:
+        remote: The remote that must be configured (default: "origin")
+
+    Raises:
+        ValidationError: Listing every failed check, one per line
+    """
+    gh_installed = has_gh_cli()
+    git_repo, gh_authenticated, remote_ok = await asyncio.gather(
+        is_git_repo_async(),
+        gh_is_authenticated_async() if gh_installed else _false(),
+        has_remote_async(remote),
+    )
+
+    errors: list[str] = []
+    if not git_repo:
+        errors.append("Not in a git repository")
+    if not gh_installed:
+        errors.append("gh CLI not installed")
+    elif not gh_authenticated:
+        errors.append("gh CLI not authenticated. Run 'gh auth login'")
+    if git_repo and not remote_ok:
+        errors.append(f"No '{remote}' remote found")
+
+    if errors:
+        raise ValidationError("\n".join(errors))
+
+
+async def is_git_repo_async() -> bool:
+    """Async version of is_git_repo()."""
+    returncode, _ = await _run_async(["git", "rev-parse", "--git-dir"])
+    return returncode == 0
+
+
+async def gh_is_authenticated_async() -> bool:
+    """Async version of gh_is_authenticated()."""
+    returncode, _ = await _run_async(["gh", "auth", "status"])
+    return returncode == 0
+
+
+async def has_remote_async(remote: str = "origin") -> bool:
+    """Async version of has_remote()."""
+    returncode, stdout = await _run_async(["git", "remote"])
+    return returncode == 0 and remote in stdout.strip().split("\n")
+
+
+async def get_current_branch_async() -> str | None:
+    """Async version of get_current_branch(); returns None on failure."""
+    returncode, stdout = await _run_async(["git", "branch", "--show-current"])
+    if returncode != 0:
+        return None
+    return stdout.strip()
+
+
+async def is_branch_pushed_to_remote_async(branch: str = "HEAD") -> bool:
+    """Async version of is_branch_pushed_to_remote().
+
+    Uses a single rev-list call, which fails when there is no upstream.
+    """
+    returncode, stdout = await _run_async(
+        ["git", "rev-list", f"{branch}@{{upstream}}..{branch}"]
+    )
+    return returncode == 0 and len(stdout.strip()) == 0
+
+
+async def has_commits_ahead_async(base: str) -> bool:
+    """Async version of has_commits_ahead()."""
+    returncode, stdout = await _run_async(["git", "rev-list", f"{base}..HEAD"])
+    return returncode == 0 and len(stdout.strip()) > 0
+
+
+async def _run_async(cmd: list[str]) -> tuple[int, str]:
+    """Run a command without blocking the event loop.
+
+    Returns:
+        The exit code and stdout; a missing executable counts as a failure
+    """
+    with phase(" ".join(cmd[:2])):
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        except FileNotFoundError:
+            return 127, ""
+        stdout, _ = await process.communicate()
+    return process.returncode or 0, stdout.decode(errors="replace")
+
+
+async def _false() -> bool:
+    """Awaitable placeholder for checks that are skipped."""
+    return False
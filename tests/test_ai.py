@@ -1,13 +1,36 @@
 """Tests for AI generation (with mocked LLM calls)."""
 
+import asyncio
+import json
+
 import pytest
 from unittest.mock import patch, MagicMock, AsyncMock
+from pydantic_ai import Agent
+from pydantic_ai.messages import (
+    ModelResponse,
+    SystemPromptPart,
+    ToolCallPart,
+    UserPromptPart,
+)
+from pydantic_ai.models.function import DeltaToolCall, FunctionModel
+from pydantic_ai.usage import RequestUsage
 
 from lazypr.ai import (
+    close_http_client,
+    create_pr_agent,
     generate_pr_content,
+    get_http_client,
+    get_cached_pr_content,
+    summarize_diff,
+    summarize_files,
+    update_pr_content,
+    warm_up_model,
     PRContent,
     AIError,
 )
+from lazypr.cache import BranchState
+from lazypr.diff import file_diff_hashes
+from lazypr.usage import TokenUsage
 
 
 @pytest.mark.skip(
@@ -52,6 +75,67 @@ class TestCreatePrAgent:
                 create_pr_agent()
 
 
+class TestAgentFactory:
+    """Tests for memoized agents and the shared HTTP client."""
+
+    @pytest.fixture(autouse=True)
+    def openai_env(self, monkeypatch):
+        monkeypatch.setenv("LAZYPR_MODEL", "openai:gpt-4o")
+        monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+        yield
+        asyncio.run(close_http_client())
+
+    def test_reuses_agent_for_same_model_and_settings(self):
+        """Should return the same agent instead of rebuilding it."""
+        assert create_pr_agent() is create_pr_agent()
+        assert create_pr_agent("openai:gpt-4o") is create_pr_agent()
+
+    def test_builds_new_agent_for_different_settings(self):
+        """Should key agents on model settings as well as the model name."""
+        default = create_pr_agent()
+        warmer = create_pr_agent(settings={"temperature": 0.7})
+
+        assert warmer is not default
+        assert warmer is create_pr_agent(settings={"temperature": 0.7})
+
+    def test_accepts_unhashable_settings(self):
+        """Should key agents on settings holding dicts and lists."""
+        settings = {"extra_headers": {"X-Team": "a"}, "stop_sequences": ["END"]}
+
+        agent = create_pr_agent(settings=settings)
+
+        assert agent is create_pr_agent(
+            settings={"stop_sequences": ["END"], "extra_headers": {"X-Team": "a"}}
+        )
+        assert agent is not create_pr_agent(
+            settings={"extra_headers": {"X-Team": "b"}, "stop_sequences": ["END"]}
+        )
+
+    def test_providers_share_http_client(self):
+        """Should build providers around the shared HTTP client."""
+        agent = create_pr_agent()
+        other = create_pr_agent("openai:gpt-4o-mini")
+
+        assert agent.model.client._client is get_http_client()
+        assert other.model.client._client is get_http_client()
+
+    def test_close_resets_client_and_agents(self):
+        """Should close the shared client and rebuild agents afterwards."""
+        agent = create_pr_agent()
+        client = get_http_client()
+
+        asyncio.run(close_http_client())
+
+        assert client.is_closed
+        assert create_pr_agent() is not agent
+        assert get_http_client() is not client
+
+    def test_rejects_unknown_provider(self):
+        """Should raise AIError for a provider pydantic-ai does not know."""
+        with pytest.raises(AIError, match="Unknown model provider 'bogus'"):
+            create_pr_agent("bogus:model")
+
+
 class TestGeneratePrContent:
     """Tests for generate_pr_content() function."""
 
@@ -100,13 +184,489 @@ class TestGeneratePrContent:
             assert "respond entirely in" in prompt
 
     @pytest.mark.asyncio
-    async def test_prompt_forbids_conventional_commits_in_title(self):
-        """Prompt must explicitly instruct AI not to use conventional commits format in title."""
+    async def test_lists_omitted_files_in_prompt(self):
+        """Should tell the model about files left out of the diff."""
         mock_agent = MagicMock()
         mock_agent.run = AsyncMock()
 
         with patch("lazypr.ai.create_pr_agent", return_value=mock_agent):
-            await generate_pr_content("some diff")
-            call_args = mock_agent.run.call_args
-            prompt = call_args[0][0] if call_args[0] else call_args[1].get("prompt", "")
-            assert "conventional commit" in prompt.lower()
+            await generate_pr_content(
+                "some diff", omitted_files=["package-lock.json (+4000 -3800)"]
+            )
+            prompt = mock_agent.run.call_args[0][0]
+            assert "- package-lock.json (+4000 -3800)" in prompt
+
+    @pytest.mark.asyncio
+    async def test_uses_given_agent(self):
+        """Should use a pre-built agent instead of creating one."""
+        mock_agent = MagicMock()
+        mock_agent.run = AsyncMock()
+
+        with patch("lazypr.ai.create_pr_agent") as mock_create:
+            await generate_pr_content("some diff", agent=mock_agent)
+            mock_create.assert_not_called()
+            mock_agent.run.assert_called_once()
+
+
+class TestStreamPrContent:
+    """Tests for streaming PR content with on_partial."""
+
+    def _streaming_agent(self, content: dict) -> Agent:
+        """Build an agent whose model streams content as tool call deltas."""
+        args = json.dumps(content)
+
+        async def stream(messages, info):
+            name = info.output_tools[0].name
+            for i in range(0, len(args), 16):
+                await asyncio.sleep(0.06)
+                delta = DeltaToolCall(
+                    name=None if i else name, json_args=args[i : i + 16]
+                )
+                yield {0: delta}
+
+        return Agent(FunctionModel(stream_function=stream), output_type=PRContent)
+
+    @pytest.mark.asyncio
+    async def test_reports_partials_and_returns_validated_content(self):
+        """Should call on_partial as output grows and return the full PRContent."""
+        content = {
+            "title": "Stream PR output",
+            "description": "Render the description while the model writes it.",
+        }
+        agent = self._streaming_agent(content)
+        partials: list[PRContent] = []
+
+        result = await generate_pr_content(
+            "some diff", agent=agent, on_partial=partials.append
+        )
+
+        assert result == PRContent(**content)
+        assert len(partials) > 1
+        descriptions = [p.description for p in partials]
+        assert descriptions[0] != descriptions[-1]
+        assert all(content["description"].startswith(d) for d in descriptions)
+
+    @pytest.mark.asyncio
+    async def test_does_not_stream_without_callback(self):
+        """Should use a plain run when no on_partial is given."""
+        mock_agent = MagicMock()
+        mock_agent.run = AsyncMock()
+
+        await generate_pr_content("some diff", agent=mock_agent)
+
+        mock_agent.run.assert_called_once()
+        mock_agent.run_stream.assert_not_called()
+
+
+class TestUsageAccounting:
+    """Tests for token usage and LAZYPR_MAX_INPUT_TOKENS."""
+
+    def _agent(self, prompts: list[str]) -> Agent:
+        """Build an agent that records its prompts and reports fixed usage."""
+
+        def respond(messages, info):
+            prompts.append(messages[-1].parts[-1].content)
+            args = {"title": "T", "description": "D"}
+            return ModelResponse(
+                parts=[ToolCallPart(info.output_tools[0].name, args)],
+                usage=RequestUsage(input_tokens=1200, output_tokens=80),
+            )
+
+        return Agent(FunctionModel(respond), output_type=PRContent)
+
+    @pytest.mark.asyncio
+    async def test_adds_estimate_and_reported_usage(self):
+        """Should add the pre-call estimate and the provider's token counts."""
+        usage = TokenUsage(requests=1, input_tokens=10, output_tokens=1, cost=0.5)
+
+        await generate_pr_content("some diff", agent=self._agent([]), usage=usage)
+
+        assert (usage.requests, usage.input_tokens, usage.output_tokens) == (
+            2,
+            1210,
+            81,
+        )
+        assert usage.estimated_tokens > 0
+        # The test model has no price
+        assert usage.cost is None
+
+    @pytest.mark.asyncio
+    async def test_packs_diff_over_input_limit(self, monkeypatch):
+        """Should reduce hunks to headers before sending an oversized prompt."""
+        monkeypatch.setenv("LAZYPR_MAX_INPUT_TOKENS", "1500")
+        diff = (
+            "diff --git a/a.py b/a.py\n--- a/a.py\n+++ b/a.py\n"
+            "@@ -1,1 +1,500 @@\n" + "+line of code\n" * 500
+        )
+        prompts: list[str] = []
+        usage = TokenUsage()
+
+        await generate_pr_content(diff, agent=self._agent(prompts), usage=usage)
+
+        assert "[... 500 lines omitted ...]" in prompts[0]
+        assert usage.estimated_tokens <= 1500
+
+    @pytest.mark.asyncio
+    async def test_aborts_when_prompt_cannot_fit(self, monkeypatch):
+        """Should raise AIError without calling the model."""
+        monkeypatch.setenv("LAZYPR_MAX_INPUT_TOKENS", "100")
+        prompts: list[str] = []
+
+        with pytest.raises(AIError, match="LAZYPR_MAX_INPUT_TOKENS"):
+            await generate_pr_content(
+                _file_diff("a.py", 10), agent=self._agent(prompts)
+            )
+
+        assert prompts == []
+
+
+class TestPromptCaching:
+    """Tests for the static prompt prefix and provider prompt caching."""
+
+    @pytest.fixture(autouse=True)
+    def openai_env(self, monkeypatch):
+        monkeypatch.setenv("LAZYPR_MODEL", "openai:gpt-4o")
+        monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+        yield
+        asyncio.run(close_http_client())
+
+    async def _run(self, language: str = "en", cache_read_tokens: int = 0):
+        """Generate with the real PR agent and return its request and usage."""
+        requests = []
+
+        def respond(messages, info):
+            requests.append(messages[-1])
+            args = {"title": "T", "description": "D"}
+            return ModelResponse(
+                parts=[ToolCallPart(info.output_tools[0].name, args)],
+                usage=RequestUsage(
+                    input_tokens=1200, cache_read_tokens=cache_read_tokens
+                ),
+            )
+
+        usage = TokenUsage()
+        agent = create_pr_agent()
+        with agent.override(model=FunctionModel(respond)):
+            await generate_pr_content(
+                "some diff", language=language, agent=agent, usage=usage
+            )
+        (request,) = requests
+        system = [p.content for p in request.parts if isinstance(p, SystemPromptPart)]
+        user = [p.content for p in request.parts if isinstance(p, UserPromptPart)]
+        return "".join(system), "".join(user), usage
+
+    @pytest.mark.asyncio
+    async def test_static_instructions_are_in_system_prompt(self):
+        """Should send the same system prompt whatever the language."""
+        english_system, english_user, _ = await self._run("en")
+        portuguese_system, portuguese_user, _ = await self._run("pt")
+
+        assert english_system == portuguese_system
+        assert "conventional commit" in english_system.lower()
+        assert "English" not in english_system
+        assert "Brazilian Portuguese" in portuguese_user
+        assert "some diff" in english_user
+
+    @pytest.mark.asyncio
+    async def test_reports_cache_hits(self):
+        """Should add the tokens the provider served from its cache."""
+        _, _, usage = await self._run(cache_read_tokens=1000)
+
+        assert usage.cache_read_tokens == 1000
+        assert "(1,000 cached)" in usage.summary()
+
+    def test_caches_prompt_prefix_by_default(self):
+        """Should ask providers to cache the static prefix but not the diff."""
+        assert create_pr_agent().model_settings["cache"] == {"messages": False}
+
+    def test_prompt_cache_setting(self, monkeypatch):
+        """Should follow LAZYPR_PROMPT_CACHE unless settings choose themselves."""
+        monkeypatch.setenv("LAZYPR_PROMPT_CACHE", "off")
+        assert "cache" not in create_pr_agent().model_settings
+
+        monkeypatch.setenv("LAZYPR_PROMPT_CACHE", "all")
+        assert create_pr_agent().model_settings["cache"] is True
+        agent = create_pr_agent(settings={"temperature": 0.3, "cache": False})
+        assert agent.model_settings["cache"] is False
+
+
+def _file_diff(name: str, lines: int) -> str:
+    """Build a one-file diff with the given number of added lines."""
+    return f"diff --git a/{name} b/{name}\n" + "+some added line\n" * lines
+
+
+class TestSummarizeDiff:
+    """Tests for map-reduce summarization of large diffs."""
+
+    def _summary_agent(self, delay: float = 0.0):
+        state = {"active": 0, "peak": 0, "prompts": []}
+
+        async def run(prompt, usage=None):
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            state["prompts"].append(prompt)
+            await asyncio.sleep(delay)
+            state["active"] -= 1
+            return MagicMock(output=f"summary {len(state['prompts'])}")
+
+        agent = MagicMock()
+        agent.run = run
+        return agent, state
+
+    @pytest.mark.asyncio
+    async def test_summarizes_each_chunk(self):
+        """Should summarize each group of files once."""
+        diff = "".join(_file_diff(f"f{i}.py", 120) for i in range(4))
+        agent, state = self._summary_agent()
+
+        with patch("lazypr.ai.create_summary_agent", return_value=agent):
+            summaries = await summarize_diff(diff, model=None, max_tokens=500)
+
+        assert len(summaries) == 4
+        assert all("```diff" in prompt for prompt in state["prompts"])
+
+    @pytest.mark.asyncio
+    async def test_limits_concurrency(self):
+        """Should never run more than max_concurrency requests at once."""
+        diff = "".join(_file_diff(f"f{i}.py", 120) for i in range(8))
+        agent, state = self._summary_agent(delay=0.01)
+
+        with patch("lazypr.ai.create_summary_agent", return_value=agent):
+            await summarize_diff(diff, model=None, max_tokens=500, max_concurrency=3)
+
+        assert state["peak"] == 3
+
+    @pytest.mark.asyncio
+    async def test_reduces_summaries_that_do_not_fit(self):
+        """Should merge summaries again when together they exceed the limit."""
+        diff = "".join(_file_diff(f"f{i}.py", 120) for i in range(4))
+        agent = MagicMock()
+        agent.run = AsyncMock(return_value=MagicMock(output="x" * 1200))
+
+        with patch("lazypr.ai.create_summary_agent", return_value=agent):
+            summaries = await summarize_diff(diff, model=None, max_tokens=500)
+
+        assert len(summaries) == 1
+        assert agent.run.call_count > 4
+
+    @pytest.mark.asyncio
+    async def test_generate_uses_map_reduce_over_budget(self, monkeypatch):
+        """Should send summaries instead of the diff when it exceeds the budget."""
+        monkeypatch.setenv("LAZYPR_CONTEXT_TOKENS", "100")
+        diff = _file_diff("big.py", 200)
+        mock_agent = MagicMock()
+        mock_agent.run = AsyncMock()
+
+        with patch(
+            "lazypr.ai.summarize_diff", AsyncMock(return_value=["summary A"])
+        ) as mock_summarize:
+            await generate_pr_content(diff, agent=mock_agent)
+
+        mock_summarize.assert_called_once()
+        prompt = mock_agent.run.call_args[0][0]
+        assert "summary A" in prompt
+        assert diff not in prompt
+
+
+class TestUpdatePrContent:
+    """Tests for incremental regeneration with update_pr_content()."""
+
+    def _agent(self):
+        agent = MagicMock()
+        agent.run = AsyncMock(
+            return_value=MagicMock(output=PRContent(title="New", description="D2"))
+        )
+        return agent
+
+    @pytest.mark.asyncio
+    async def test_generates_from_whole_diff_without_state(self):
+        """Should generate from the diff and hash every file."""
+        diff = _file_diff("a.py", 3) + _file_diff("b.py", 3)
+        agent = self._agent()
+
+        content, state = await update_pr_content(diff, None, agent=agent)
+
+        assert content.title == "New"
+        assert diff in agent.run.call_args[0][0]
+        assert set(state.file_hashes) == {"a.py", "b.py"}
+
+    @pytest.mark.asyncio
+    async def test_summarizes_only_changed_files(self):
+        """Should send summaries of changed files and the previous content."""
+        old = _file_diff("a.py", 3) + _file_diff("b.py", 3)
+        new = _file_diff("a.py", 3) + _file_diff("b.py", 4)
+        state = BranchState(
+            "Old", "Old description", file_diff_hashes(old), {"a.py": "Adds a."}
+        )
+        agent = self._agent()
+
+        with patch(
+            "lazypr.ai.summarize_files",
+            AsyncMock(return_value={"b.py": "Adds another line."}),
+        ) as mock_summarize:
+            content, new_state = await update_pr_content(new, state, agent=agent)
+
+        changed_diff = mock_summarize.call_args[0][0]
+        assert "b.py" in changed_diff and "a.py" not in changed_diff
+        prompt = agent.run.call_args[0][0]
+        assert "Old description" in prompt
+        assert "- b.py: Adds another line." in prompt
+        assert "- a.py: Adds a." in prompt
+        assert new_state.summaries == {
+            "a.py": "Adds a.",
+            "b.py": "Adds another line.",
+        }
+        assert new_state.title == content.title == "New"
+
+    @pytest.mark.asyncio
+    async def test_lists_files_no_longer_changed(self):
+        """Should tell the model about files dropped from the branch."""
+        old = _file_diff("a.py", 3) + _file_diff("b.py", 3)
+        new = _file_diff("a.py", 3)
+        state = BranchState("Old", "Old description", file_diff_hashes(old))
+        agent = self._agent()
+
+        with patch("lazypr.ai.summarize_files") as mock_summarize:
+            await update_pr_content(new, state, agent=agent)
+
+        mock_summarize.assert_not_called()
+        assert "no longer changes:\n- b.py" in agent.run.call_args[0][0]
+
+    @pytest.mark.asyncio
+    async def test_unchanged_diff_skips_model(self):
+        """Should return the previous content without any request."""
+        diff = _file_diff("a.py", 3)
+        state = BranchState("Old", "Old description", file_diff_hashes(diff))
+        agent = self._agent()
+
+        content, _ = await update_pr_content(diff, state, agent=agent)
+
+        assert content == PRContent(title="Old", description="Old description")
+        agent.run.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_packs_changed_files_over_input_limit(self, monkeypatch):
+        """Should pack the changed files' diff to fit LAZYPR_MAX_INPUT_TOKENS."""
+        monkeypatch.setenv("LAZYPR_MAX_INPUT_TOKENS", "1500")
+        old = _file_diff("a.py", 3)
+        new = (
+            "diff --git a/a.py b/a.py\n--- a/a.py\n+++ b/a.py\n"
+            "@@ -1,1 +1,500 @@\n" + "+line of code\n" * 500
+        )
+        state = BranchState("Old", "Old description", file_diff_hashes(old))
+        agent = self._agent()
+
+        with patch(
+            "lazypr.ai.summarize_files", AsyncMock(return_value={"a.py": "Grows."})
+        ) as mock_summarize:
+            await update_pr_content(new, state, agent=agent)
+
+        assert "[... 500 lines omitted ...]" in mock_summarize.call_args[0][0]
+        agent.run.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_aborts_when_update_cannot_fit(self, monkeypatch):
+        """Should raise AIError without calling the model."""
+        monkeypatch.setenv("LAZYPR_MAX_INPUT_TOKENS", "100")
+        old = _file_diff("a.py", 3)
+        state = BranchState("Old", "Old description", file_diff_hashes(old))
+        agent = self._agent()
+
+        with patch("lazypr.ai.summarize_files") as mock_summarize:
+            with pytest.raises(AIError, match="LAZYPR_MAX_INPUT_TOKENS"):
+                await update_pr_content(_file_diff("a.py", 4), state, agent=agent)
+
+        mock_summarize.assert_not_called()
+        agent.run.assert_not_called()
+
+
+class TestSummarizeFiles:
+    """Tests for per-file summaries."""
+
+    @pytest.mark.asyncio
+    async def test_returns_summary_per_file(self):
+        """Should map each file of the diff to its summary."""
+
+        def respond(messages, info):
+            args = {"response": {"a.py": "Adds a.", "b.py": "Adds b."}}
+            return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, args)])
+
+        diff = _file_diff("a.py", 3) + _file_diff("b.py", 3)
+
+        summaries = await summarize_files(diff, FunctionModel(respond))
+
+        assert summaries == {"a.py": "Adds a.", "b.py": "Adds b."}
+
+
+class TestPrContentCache:
+    """Tests for the cache behind generate_pr_content()."""
+
+    @pytest.fixture(autouse=True)
+    def cache_home(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+        monkeypatch.setenv("LAZYPR_MODEL", "test:model")
+
+    def _agent(self) -> MagicMock:
+        mock_result = MagicMock()
+        mock_result.output = PRContent(title="Cached title", description="Body")
+        mock_agent = MagicMock()
+        mock_agent.run = AsyncMock(return_value=mock_result)
+        return mock_agent
+
+    @pytest.mark.asyncio
+    async def test_second_run_is_served_from_cache(self):
+        """Should not call the model again for the same inputs."""
+        mock_agent = self._agent()
+        first = await generate_pr_content("diff", agent=mock_agent, use_cache=True)
+        second = await generate_pr_content("diff", agent=mock_agent, use_cache=True)
+
+        assert first == second
+        mock_agent.run.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_key_includes_language_and_model(self, monkeypatch):
+        """Should miss the cache when the language or model changes."""
+        await generate_pr_content("diff", agent=self._agent(), use_cache=True)
+
+        assert get_cached_pr_content("diff") is not None
+        assert get_cached_pr_content("diff", language="pt") is None
+        monkeypatch.setenv("LAZYPR_MODEL", "test:other")
+        assert get_cached_pr_content("diff") is None
+
+    @pytest.mark.asyncio
+    async def test_cache_disabled_by_default(self):
+        """Should neither read nor write the cache unless asked to."""
+        mock_agent = self._agent()
+        await generate_pr_content("diff", agent=mock_agent)
+        await generate_pr_content("diff", agent=mock_agent)
+
+        assert mock_agent.run.call_count == 2
+        assert get_cached_pr_content("diff") is None
+
+
+class TestWarmUpModel:
+    """Tests for warm_up_model() function."""
+
+    def _model(self, head: AsyncMock) -> MagicMock:
+        model = MagicMock()
+        model.base_url = "https://api.example.com/v1/"
+        model.client._client.head = head
+        return model
+
+    @pytest.mark.asyncio
+    async def test_sends_head_request_through_model_client(self):
+        """Should open a connection to the provider's base URL."""
+        head = AsyncMock()
+        await warm_up_model(self._model(head))
+        head.assert_called_once_with("https://api.example.com/v1/", timeout=5.0)
+
+    @pytest.mark.asyncio
+    async def test_ignores_connection_errors(self):
+        """Should never fail the run when warm-up fails."""
+        head = AsyncMock(side_effect=OSError("network unreachable"))
+        await warm_up_model(self._model(head))
+
+    @pytest.mark.asyncio
+    async def test_skips_models_without_http_client(self):
+        """Should do nothing for models without a base URL or client."""
+        await warm_up_model(object())
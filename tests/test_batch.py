@@ -0,0 +1,298 @@
+"""Tests for batch mode."""
+
+import asyncio
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from unittest.mock import patch, MagicMock
+
+from lazypr.ai import PRContent
+from lazypr.batch import (
+    RateLimiter,
+    fetch_branches,
+    resolve_branches,
+    run_batch,
+)
+from lazypr.diff import DiffError, FileStat, FilteredDiff
+
+REMOTE_BRANCHES = (
+    "  origin/HEAD -> origin/main\n"
+    "  origin/main\n"
+    "  origin/release/1.0\n"
+    "  origin/release/1.1\n"
+    "  origin/feature-x\n"
+    "  upstream/release/2.0\n"
+)
+
+
+class TestResolveBranches:
+    """Tests for resolve_branches() function."""
+
+    def test_matches_glob_over_remote_branches(self):
+        """Should add remote branches matching the glob, prefix optional."""
+        with patch("lazypr.batch.subprocess.run") as mock_run:
+            mock_run.return_value = MagicMock(stdout=REMOTE_BRANCHES)
+            assert resolve_branches([], "release/*") == ["release/1.0", "release/1.1"]
+            assert resolve_branches([], "origin/release/*") == [
+                "release/1.0",
+                "release/1.1",
+            ]
+
+    def test_keeps_explicit_branches_first_without_duplicates(self):
+        """Should list explicit branches first and drop duplicates."""
+        with patch("lazypr.batch.subprocess.run") as mock_run:
+            mock_run.return_value = MagicMock(stdout=REMOTE_BRANCHES)
+            branches = resolve_branches(["release/1.1", "feature-x"], "release/*")
+
+        assert branches == ["release/1.1", "feature-x", "release/1.0"]
+
+    def test_rejects_branches_missing_on_remote(self):
+        """Should fail before any work when an explicit branch does not exist."""
+        with patch("lazypr.batch.subprocess.run") as mock_run:
+            mock_run.return_value = MagicMock(stdout=REMOTE_BRANCHES)
+            with pytest.raises(DiffError, match="not found on 'origin': typo"):
+                resolve_branches(["feature-x", "typo"], None)
+
+
+class TestFetchBranches:
+    """Tests for fetch_branches() function."""
+
+    def test_fetches_base_and_branches_in_one_command(self):
+        """Should run a single git fetch with a refspec per branch."""
+        with patch("lazypr.batch.subprocess.run") as mock_run:
+            fetch_branches("main", ["a", "b", "main"])
+
+        mock_run.assert_called_once()
+        assert mock_run.call_args.args[0] == [
+            "git",
+            "fetch",
+            "origin",
+            "+refs/heads/main:refs/remotes/origin/main",
+            "+refs/heads/a:refs/remotes/origin/a",
+            "+refs/heads/b:refs/remotes/origin/b",
+        ]
+
+    def test_fetches_whole_remote_without_branches(self):
+        """Should fetch every branch when the list is not known yet."""
+        with patch("lazypr.batch.subprocess.run") as mock_run:
+            fetch_branches("main", None)
+
+        assert mock_run.call_args.args[0] == ["git", "fetch", "--prune", "origin"]
+
+    def test_raises_error_when_fetch_fails(self):
+        """Should raise DiffError with git's message."""
+        with patch("lazypr.batch.subprocess.run") as mock_run:
+            mock_run.side_effect = subprocess.CalledProcessError(
+                128, "git", stderr="couldn't find remote ref typo"
+            )
+            with pytest.raises(DiffError, match="couldn't find remote ref typo"):
+                fetch_branches("main", ["typo"])
+
+
+class TestRateLimiter:
+    """Tests for RateLimiter."""
+
+    @pytest.mark.asyncio
+    async def test_spaces_requests(self):
+        """Should start at most rate_per_minute requests per minute."""
+        limiter = RateLimiter(rate_per_minute=600)  # one every 0.1s
+
+        start = time.perf_counter()
+        await asyncio.gather(*(limiter.acquire() for _ in range(4)))
+
+        assert time.perf_counter() - start >= 0.29
+
+    @pytest.mark.asyncio
+    async def test_unlimited_when_rate_is_zero(self):
+        """Should never wait without a rate limit."""
+        limiter = RateLimiter(rate_per_minute=0)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(limiter.acquire() for _ in range(100)))
+
+        assert time.perf_counter() - start < 0.05
+
+
+class _RateLimited(Exception):
+    """Stand-in for a provider's HTTP 429 error."""
+
+    status_code = 429
+    headers = {"retry-after": "0"}
+
+
+class TestRunBatch:
+    """Tests for run_batch() function."""
+
+    def _diff_for(self, diffs: dict[str, FilteredDiff]):
+        def get_diff(
+            base, max_lines, patterns, remote, head, fetch, context, function_context
+        ):
+            assert fetch is False
+            return diffs[head.removeprefix(f"{remote}/")]
+
+        return get_diff
+
+    async def _run(self, branches, diffs, generate, **kwargs):
+        with (
+            patch(
+                "lazypr.batch.get_filtered_diff_remote",
+                side_effect=self._diff_for(diffs),
+            ),
+            patch("lazypr.ai.prepare_pr_agent"),
+            patch("lazypr.ai.generate_pr_content", side_effect=generate),
+            ThreadPoolExecutor() as executor,
+        ):
+            return await run_batch(
+                "main", branches, executor=executor, use_cache=False, **kwargs
+            )
+
+    @pytest.mark.asyncio
+    async def test_bounds_concurrency_and_scales_with_it(self):
+        """Should run at most max_concurrency generations at once."""
+        branches = [f"branch-{i}" for i in range(8)]
+        diffs = {b: FilteredDiff(text=f"diff {b}") for b in branches}
+        state = {"active": 0, "peak": 0}
+
+        async def generate(diff, language, omitted_files, **kwargs):
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            await asyncio.sleep(0.1)
+            state["active"] -= 1
+            return PRContent(title=f"PR for {diff}", description="Body")
+
+        open_pr = MagicMock(side_effect=lambda *a, **k: f"https://pr/{k['head']}")
+        start = time.perf_counter()
+        results = await self._run(branches, diffs, generate, open_pr=open_pr)
+        elapsed = time.perf_counter() - start
+
+        assert state["peak"] == 4
+        # Eight 0.1s generations, four at a time
+        assert elapsed < 0.6
+        assert [r.status for r in results] == ["created"] * 8
+        assert results[0].url == "https://pr/branch-0"
+        assert open_pr.call_args_list[0].kwargs == {"web": False, "head": "branch-0"}
+
+    @pytest.mark.asyncio
+    async def test_reports_each_branch_outcome(self):
+        """Should skip empty diffs and record failures without stopping."""
+        diffs = {
+            "good": FilteredDiff(
+                text="diff good", omitted=[FileStat("big.lock", 5000, 0)]
+            ),
+            "empty": FilteredDiff(text=""),
+            "broken": FilteredDiff(text="diff broken"),
+        }
+
+        async def generate(diff, language, omitted_files, **kwargs):
+            if diff == "diff broken":
+                raise RuntimeError("model unavailable")
+            assert omitted_files == ["big.lock (+5000 -0)"]
+            return PRContent(title="Good", description="Body")
+
+        open_pr = MagicMock(return_value="https://pr/good")
+        results = await self._run(
+            ["good", "empty", "broken"], diffs, generate, open_pr=open_pr
+        )
+
+        assert [(r.branch, r.status) for r in results] == [
+            ("good", "created"),
+            ("empty", "skipped"),
+            ("broken", "failed"),
+        ]
+        assert results[2].error == "model unavailable"
+        open_pr.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_dry_run_does_not_open_prs(self):
+        """Should generate content without calling open_pr."""
+
+        async def generate(diff, language, omitted_files, **kwargs):
+            return PRContent(title="T", description="D")
+
+        open_pr = MagicMock()
+        results = await self._run(
+            ["a"],
+            {"a": FilteredDiff(text="d")},
+            generate,
+            open_pr=open_pr,
+            dry_run=True,
+        )
+
+        assert results[0].status == "generated"
+        open_pr.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_retries_rate_limited_requests(self):
+        """Should retry a generation the provider rejected with HTTP 429."""
+        calls = []
+
+        async def generate(diff, language, omitted_files, **kwargs):
+            calls.append(diff)
+            if len(calls) == 1:
+                raise _RateLimited()
+            return PRContent(title="T", description="D")
+
+        results = await self._run(
+            ["a"],
+            {"a": FilteredDiff(text="d")},
+            generate,
+            open_pr=MagicMock(return_value="url"),
+        )
+
+        assert len(calls) == 2
+        assert results[0].status == "created"
+
+    @pytest.mark.asyncio
+    async def test_diffs_in_threads_by_default(self):
+        """Should diff in worker threads of this process, never forking."""
+        pids = []
+
+        def get_diff(base, max_lines, patterns, remote, head, *args):
+            pids.append(os.getpid())
+            return FilteredDiff(text=f"diff {head}")
+
+        async def generate(diff, language, omitted_files, **kwargs):
+            return PRContent(title="T", description="D")
+
+        with (
+            patch("lazypr.batch.get_filtered_diff_remote", side_effect=get_diff),
+            patch("lazypr.ai.prepare_pr_agent"),
+            patch("lazypr.ai.generate_pr_content", side_effect=generate),
+        ):
+            results = await run_batch(
+                "main", ["a", "b"], MagicMock(), dry_run=True, use_cache=False
+            )
+
+        assert [r.status for r in results] == ["generated", "generated"]
+        assert pids == [os.getpid()] * 2
+
+    @pytest.mark.asyncio
+    async def test_packs_diff_into_token_budget(self, monkeypatch):
+        """Should pack each branch's diff like create does."""
+        monkeypatch.setenv("LAZYPR_TOKEN_BUDGET", "60")
+        body = "".join(f"+added line {i}\n" for i in range(200))
+        diff = (
+            "diff --git a/a.py b/a.py\n"
+            "--- a/a.py\n"
+            "+++ b/a.py\n"
+            "@@ -0,0 +1,200 @@\n" + body
+        )
+        prompts = []
+
+        async def generate(diff, language, omitted_files, **kwargs):
+            prompts.append(diff)
+            return PRContent(title="T", description="D")
+
+        await self._run(
+            ["a"],
+            {"a": FilteredDiff(text=diff)},
+            generate,
+            open_pr=MagicMock(),
+            dry_run=True,
+        )
+
+        assert "[... 200 lines omitted ...]" in prompts[0]
+        assert "added line" not in prompts[0]
@@ -0,0 +1,157 @@
+"""Tests for the on-disk PR content cache."""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+from unittest.mock import patch
+
+from lazypr.cache import (
+    BranchState,
+    branch_state_key,
+    get_cache_dir,
+    list_cache_entries,
+    load_branch_state,
+    load_cached,
+    make_cache_key,
+    prune_cache,
+    store_branch_state,
+    store_cached,
+)
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    """Point the cache at a temporary directory."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    return tmp_path
+
+
+class TestGetCacheDir:
+    """Tests for get_cache_dir() function."""
+
+    def test_uses_xdg_cache_home(self, cache_home):
+        """Should place the cache under $XDG_CACHE_HOME."""
+        assert get_cache_dir() == cache_home / "lazypr"
+
+    def test_falls_back_to_home_cache(self, monkeypatch, tmp_path):
+        """Should use ~/.cache when XDG_CACHE_HOME is unset."""
+        monkeypatch.delenv("XDG_CACHE_HOME")
+        with patch("lazypr.cache.Path.home", return_value=tmp_path):
+            assert get_cache_dir() == tmp_path / ".cache" / "lazypr"
+
+
+class TestMakeCacheKey:
+    """Tests for make_cache_key() function."""
+
+    def test_is_stable(self):
+        """Should return the same key for the same parts."""
+        assert make_cache_key("a", "b") == make_cache_key("a", "b")
+
+    def test_part_boundaries_matter(self):
+        """Should not collide when the same text is split differently."""
+        assert make_cache_key("ab", "c") != make_cache_key("a", "bc")
+
+
+class TestLoadAndStore:
+    """Tests for load_cached() and store_cached() functions."""
+
+    def test_round_trip(self):
+        """Should load what was stored."""
+        store_cached("key1", {"title": "T", "description": "D"})
+        assert load_cached("key1") == {"title": "T", "description": "D"}
+
+    def test_missing_key_returns_none(self):
+        """Should return None for unknown keys."""
+        assert load_cached("missing") is None
+
+    def test_corrupt_entry_returns_none(self):
+        """Should treat unreadable entries as misses."""
+        store_cached("key1", {"title": "T"})
+        (get_cache_dir() / "pr" / "key1.json").write_text("{not json")
+        assert load_cached("key1") is None
+
+
+class TestBranchState:
+    """Tests for load_branch_state() and store_branch_state() functions."""
+
+    def test_round_trip(self):
+        """Should load the stored state with its hashes and summaries."""
+        state = BranchState("T", "D", {"a.py": "abc"}, {"a.py": "Adds a."})
+        key = branch_state_key("feature", "main", repo="/repo")
+        store_branch_state(key, state)
+        assert load_branch_state(key) == state
+
+    def test_missing_state_returns_none(self):
+        """Should return None for a branch never generated."""
+        assert load_branch_state(branch_state_key("new", "main")) is None
+
+    def test_key_depends_on_base_and_repo(self):
+        """Should keep states of other bases and repositories apart."""
+        key = branch_state_key("feature", "main", repo="/repo")
+        assert key != branch_state_key("feature", "develop", repo="/repo")
+        assert key != branch_state_key("feature", "main", repo="/other")
+
+    @pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+    def test_key_is_same_from_subdirectories(self, tmp_path, monkeypatch):
+        """Should key on the repository root, not the working directory."""
+        subprocess.run(["git", "init", "-q"], cwd=tmp_path, check=True)
+        (tmp_path / "src" / "pkg").mkdir(parents=True)
+
+        monkeypatch.chdir(tmp_path)
+        key = branch_state_key("feature", "main")
+        monkeypatch.chdir(tmp_path / "src" / "pkg")
+
+        assert branch_state_key("feature", "main") == key
+
+
+class TestPruneCache:
+    """Tests for prune_cache() and list_cache_entries() functions."""
+
+    def _store_with_age(self, key: str, age: int) -> None:
+        store_cached(key, {"title": "x" * 100})
+        path = get_cache_dir() / "pr" / f"{key}.json"
+        os.utime(path, (1_000_000 - age, 1_000_000 - age))
+
+    def test_lists_most_recently_used_first(self):
+        """Should order entries by last use."""
+        self._store_with_age("old", 100)
+        self._store_with_age("new", 1)
+        assert [e.key for e in list_cache_entries()] == ["new", "old"]
+
+    def test_evicts_least_recently_used(self):
+        """Should remove the oldest entries until under the limit."""
+        self._store_with_age("old", 100)
+        self._store_with_age("mid", 50)
+        self._store_with_age("new", 1)
+        entry_size = list_cache_entries()[0].size
+
+        removed = prune_cache(max_bytes=entry_size * 2)
+
+        assert removed == 1
+        assert [e.key for e in list_cache_entries()] == ["new", "mid"]
+
+    def test_loading_refreshes_entry(self):
+        """Should treat a cache hit as a use for LRU purposes."""
+        self._store_with_age("old", 100)
+        self._store_with_age("new", 1)
+        load_cached("old")
+        entry_size = list_cache_entries()[0].size
+
+        prune_cache(max_bytes=entry_size)
+
+        assert [e.key for e in list_cache_entries()] == ["old"]
+
+    def test_zero_limit_clears_cache(self):
+        """Should remove everything with a zero limit."""
+        store_cached("a", {"title": "a"})
+        store_cached("b", {"title": "b"})
+        assert prune_cache(max_bytes=0) == 2
+        assert list_cache_entries() == []
+
+    def test_store_enforces_configured_limit(self, monkeypatch):
+        """Should evict on store using LAZYPR_CACHE_MAX_BYTES."""
+        monkeypatch.setenv("LAZYPR_CACHE_MAX_BYTES", "0")
+        store_cached("a", {"title": "a"})
+        assert list_cache_entries() == []
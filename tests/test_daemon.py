@@ -0,0 +1,183 @@
+"""Tests for the optional lazypr daemon."""
+
+import asyncio
+
+import pytest
+from unittest.mock import patch
+
+from lazypr import daemon
+from lazypr.ai import PRContent
+from lazypr.daemon import DaemonContent, DaemonError
+from lazypr.usage import TokenUsage
+
+
+@pytest.fixture
+def socket_path(tmp_path, monkeypatch):
+    """Point the daemon socket and PR cache at a temporary directory."""
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.setenv("LAZYPR_MODEL", "test:model")
+    return daemon.get_socket_path()
+
+
+async def _fake_generate(diff, language, omitted_files, **kwargs):
+    """Stand-in for generate_pr_content that streams two partials."""
+    on_partial = kwargs["on_partial"]
+    on_partial(PRContent(title="Add", description=""))
+    on_partial(PRContent(title="Add daemon", description="Keeps"))
+    kwargs["usage"].add(TokenUsage(requests=1, input_tokens=900, cost=0.25))
+    return PRContent(title="Add daemon", description=f"{language}: {diff}")
+
+
+async def _start_daemon(path):
+    """Run the daemon in the background and wait until it accepts connections."""
+    ready = asyncio.Event()
+    task = asyncio.create_task(daemon.serve(path, ready=ready.set))
+    await asyncio.wait_for(ready.wait(), timeout=5)
+    return task
+
+
+async def _stop_daemon(task):
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+class TestDaemon:
+    """Tests for serving PR generation over the daemon socket."""
+
+    @pytest.mark.asyncio
+    async def test_streams_partials_and_returns_content(self, socket_path):
+        """Should forward partial and final content from the warm agent."""
+        with (
+            patch("lazypr.ai.prepare_pr_agent") as mock_prepare,
+            patch("lazypr.ai.generate_pr_content", side_effect=_fake_generate),
+        ):
+            task = await _start_daemon(socket_path)
+            try:
+                partials = []
+                usage = TokenUsage()
+                for diff in ("first diff", "second diff"):
+                    connection = await daemon.connect()
+                    result = await daemon.request_pr_content(
+                        connection,
+                        diff,
+                        "pt",
+                        on_partial=partials.append,
+                        usage=usage,
+                    )
+                    assert result == DaemonContent("Add daemon", f"pt: {diff}")
+            finally:
+                await _stop_daemon(task)
+
+        # The agent is prepared once and reused for every request
+        mock_prepare.assert_called_once()
+        assert usage == TokenUsage(requests=2, input_tokens=1800, cost=0.5)
+        assert partials[:2] == [
+            DaemonContent("Add", ""),
+            DaemonContent("Add daemon", "Keeps"),
+        ]
+        assert not socket_path.exists()
+
+    @pytest.mark.asyncio
+    async def test_handles_diffs_over_stream_limit(self, socket_path):
+        """Should carry diffs larger than asyncio's 64 KiB default line limit."""
+        diff = "+" + "x" * 99 + "\n"
+        diff *= 5000
+        with (
+            patch("lazypr.ai.prepare_pr_agent"),
+            patch("lazypr.ai.generate_pr_content", side_effect=_fake_generate),
+        ):
+            task = await _start_daemon(socket_path)
+            try:
+                connection = await daemon.connect()
+                result = await daemon.request_pr_content(connection, diff)
+            finally:
+                await _stop_daemon(task)
+
+        assert result == DaemonContent("Add daemon", f"en: {diff}")
+
+    @pytest.mark.asyncio
+    async def test_connect_returns_none_without_daemon(self, socket_path):
+        """Should report no daemon when nothing listens on the socket."""
+        assert await daemon.connect() is None
+
+    @pytest.mark.asyncio
+    async def test_declines_requests_for_other_models(self, socket_path, monkeypatch):
+        """Should return None so the client falls back to running locally."""
+        with (
+            patch("lazypr.ai.prepare_pr_agent"),
+            patch("lazypr.ai.generate_pr_content") as mock_generate,
+        ):
+            task = await _start_daemon(socket_path)
+            try:
+                monkeypatch.setenv("LAZYPR_MODEL", "other:model")
+                connection = await daemon.connect()
+                assert await daemon.request_pr_content(connection, "diff") is None
+            finally:
+                await _stop_daemon(task)
+
+        mock_generate.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_reports_generation_errors(self, socket_path):
+        """Should raise DaemonError with the daemon's error message."""
+        with (
+            patch("lazypr.ai.prepare_pr_agent"),
+            patch(
+                "lazypr.ai.generate_pr_content",
+                side_effect=RuntimeError("model unavailable"),
+            ),
+        ):
+            task = await _start_daemon(socket_path)
+            try:
+                connection = await daemon.connect()
+                with pytest.raises(DaemonError, match="model unavailable"):
+                    await daemon.request_pr_content(connection, "diff")
+            finally:
+                await _stop_daemon(task)
+
+    @pytest.mark.asyncio
+    async def test_refuses_to_start_twice(self, socket_path):
+        """Should not take over the socket of a running daemon."""
+        with patch("lazypr.ai.prepare_pr_agent"):
+            task = await _start_daemon(socket_path)
+            try:
+                with pytest.raises(DaemonError, match="already running"):
+                    await daemon.serve(socket_path)
+            finally:
+                await _stop_daemon(task)
+
+    @pytest.mark.asyncio
+    async def test_closes_probe_connection(self, socket_path):
+        """Should close the connection used to detect a running daemon."""
+        probes = []
+
+        async def connect(path=None):
+            connection = await daemon_connect(path)
+            probes.append(connection)
+            return connection
+
+        daemon_connect = daemon.connect
+        with patch("lazypr.ai.prepare_pr_agent"):
+            task = await _start_daemon(socket_path)
+            try:
+                with patch("lazypr.daemon.connect", side_effect=connect):
+                    with pytest.raises(DaemonError, match="already running"):
+                        await daemon.serve(socket_path)
+                ((_, writer),) = probes
+                assert writer.is_closing()
+            finally:
+                # A leaked probe would keep the daemon from shutting down
+                for _, probe_writer in probes:
+                    probe_writer.close()
+                await _stop_daemon(task)
+
+    @pytest.mark.asyncio
+    async def test_replaces_stale_socket(self, socket_path):
+        """Should remove a socket file left behind by a dead daemon."""
+        socket_path.parent.mkdir(mode=0o700, parents=True)
+        socket_path.write_text("")
+        with patch("lazypr.ai.prepare_pr_agent"):
+            task = await _start_daemon(socket_path)
+            await _stop_daemon(task)
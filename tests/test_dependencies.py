@@ -1,3 +1,5 @@
+import subprocess
+import sys
 import warnings
 
 
@@ -11,3 +13,47 @@ def test_requests_no_charset_warning():
     with warnings.catch_warnings():
         warnings.simplefilter("error")
         import requests  # noqa: F401
+
+
+# Cumulative import time budget for `import lazypr`, in microseconds. Loading
+# pydantic-ai alone costs several times this, so eager imports trip it.
+IMPORT_TIME_BUDGET_US = 400_000
+
+# Modules that must only be imported once the CLI actually needs them
+DEFERRED_MODULES = ("lazypr.ai", "pydantic_ai", "pydantic", "httpx", "rich")
+
+
+def _import_times(module: str) -> dict[str, int]:
+    """Import a module in a fresh interpreter and return -X importtime results."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_heavy_modules_are_not_imported_at_startup():
+    """Regression test: importing lazypr must not load the AI stack or rich."""
+    times = _import_times("lazypr")
+    loaded = [
+        name
+        for name in times
+        if any(name == m or name.startswith(m + ".") for m in DEFERRED_MODULES)
+    ]
+    assert loaded == []
+
+
+def test_import_time_within_budget():
+    """Regression test: `import lazypr` must stay within its import time budget."""
+    # Take the best of a few runs to smooth out a noisy machine
+    best = min(_import_times("lazypr")["lazypr"] for _ in range(3))
+    assert best < IMPORT_TIME_BUDGET_US
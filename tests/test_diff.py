@@ -1,18 +1,49 @@
 """Tests for diff filtering functionality."""
 
+import io
+import os
 import subprocess
+import time
+import tracemalloc
 import pytest
 from unittest.mock import patch, MagicMock, call
 
 from lazypr.diff import (
     get_diff,
     get_diff_remote,
+    get_filtered_diff_remote,
     parse_diff_lines,
     filter_large_files,
     rebuild_diff_with_files,
+    file_diff_hashes,
+    index_diff,
+    index_diff_bytes,
+    split_diff,
+    pack_diff,
+    prepare_prompt_diff,
+    condense_diff,
+    fit_diff_context,
+    is_test_path,
+    get_diff_numstat,
+    get_generated_paths,
+    generated_file_reason,
+    FileStat,
+    FilteredDiff,
     DiffError,
 )
 
+# Options get_filtered_diff_remote() passes to every patch command
+PATCH_OPTIONS = ["--no-color", "--no-ext-diff", "--src-prefix=a/", "--dst-prefix=b/"]
+
+
+def _fetch_results(fetch_head: str = "/nonexistent/FETCH_HEAD") -> list[MagicMock]:
+    """Build the rev-parse, ls-remote and fetch results for a stale base branch."""
+    return [
+        MagicMock(returncode=0, stdout=f"{fetch_head}\n{'a' * 40}\n"),
+        MagicMock(returncode=0, stdout=f"{'b' * 40}\trefs/heads/main\n"),
+        MagicMock(returncode=0, stdout=""),
+    ]
+
 
 class TestGetDiff:
     """Tests for get_diff() function."""
@@ -99,6 +130,21 @@ index 123..456 100644
         assert "image.png" not in result
         assert "text.txt" in result
 
+    def test_handles_git_binary_markers(self):
+        """Should recognize the markers git actually prints for binary files."""
+        diff = (
+            "diff --git a/logo.png b/logo.png\n"
+            "index 123..456 100644\n"
+            "Binary files a/logo.png and b/logo.png differ\n"
+            "diff --git a/new.png b/new.png\n"
+            "new file mode 100644\n"
+            "index 0000000..456\r\n"
+            "Binary files /dev/null and b/new.png differ\r\n"
+            "diff --git a/text.txt b/text.txt\n"
+            "+Binary files are fun, they differ\n"
+        )
+        assert parse_diff_lines(diff) == {"text.txt": 2}
+
 
 class TestFilterLargeFiles:
     """Tests for filter_large_files() function."""
@@ -163,15 +209,14 @@ index 123..456 100644
 +    print("new")
 """
         branch_list = MagicMock(returncode=0, stdout="  origin/main\n")
-        fetch_result = MagicMock(returncode=0, stdout="")
         diff_result = MagicMock(returncode=0, stdout=diff_output)
         with patch(
             "lazypr.diff.subprocess.run",
-            side_effect=[branch_list, fetch_result, diff_result],
+            side_effect=[branch_list, *_fetch_results(), diff_result],
         ) as mock_run:
             result = get_diff_remote("main")
             # Third call must be the diff
-            diff_call = mock_run.call_args_list[2]
+            diff_call = mock_run.call_args_list[-1]
             assert diff_call == call(
                 ["git", "diff", "origin/main...HEAD"],
                 capture_output=True,
@@ -183,14 +228,13 @@ index 123..456 100644
     def test_uses_custom_remote(self):
         """Should allow custom remote name."""
         branch_list = MagicMock(returncode=0, stdout="  upstream/main\n")
-        fetch_result = MagicMock(returncode=0, stdout="")
         diff_result = MagicMock(returncode=0, stdout="diff output")
         with patch(
             "lazypr.diff.subprocess.run",
-            side_effect=[branch_list, fetch_result, diff_result],
+            side_effect=[branch_list, *_fetch_results(), diff_result],
         ) as mock_run:
             result = get_diff_remote("main", remote="upstream")
-            diff_call = mock_run.call_args_list[2]
+            diff_call = mock_run.call_args_list[-1]
             assert diff_call == call(
                 ["git", "diff", "upstream/main...HEAD"],
                 capture_output=True,
@@ -199,6 +243,22 @@ index 123..456 100644
             )
             assert result == "diff output"
 
+    def test_passes_context_width(self):
+        """Should ask git for the given number of context lines."""
+        branch_list = MagicMock(returncode=0, stdout="  origin/main\n")
+        diff_result = MagicMock(returncode=0, stdout="diff output")
+        with patch(
+            "lazypr.diff.subprocess.run",
+            side_effect=[branch_list, *_fetch_results(), diff_result],
+        ) as mock_run:
+            get_diff_remote("main", context=10)
+        assert mock_run.call_args_list[-1][0][0] == [
+            "git",
+            "diff",
+            "-U10",
+            "origin/main...HEAD",
+        ]
+
     def test_raises_error_when_remote_branch_missing(self):
         """Should raise DiffError when no remote branch exists for base."""
         branch_list = MagicMock(returncode=0, stdout="  origin/other\n")
@@ -211,25 +271,31 @@ index 123..456 100644
             assert "nonexistent-branch" in str(exc_info.value)
 
     def test_fetches_remote_before_diffing(self):
-        """Should fetch from remote before running diff to get up-to-date tracking ref."""
+        """Should fetch the base branch alone when the remote has moved on."""
         diff_output = "diff --git a/file.py b/file.py\n"
         branch_list = MagicMock(returncode=0, stdout="  origin/main\n")
-        fetch_result = MagicMock(returncode=0, stdout="")
         diff_result = MagicMock(returncode=0, stdout=diff_output)
         with patch(
             "lazypr.diff.subprocess.run",
-            side_effect=[branch_list, fetch_result, diff_result],
+            side_effect=[branch_list, *_fetch_results(), diff_result],
         ) as mock_run:
             result = get_diff_remote("main")
-            # Second call must be the fetch
-            fetch_call = mock_run.call_args_list[1]
-            assert fetch_call == call(
-                ["git", "fetch", "origin", "main"],
-                capture_output=True,
-                text=True,
-                check=True,
-            )
-            assert result == diff_output
+        commands = [c[0][0] for c in mock_run.call_args_list]
+        assert commands[2] == [
+            "git",
+            "ls-remote",
+            "--heads",
+            "origin",
+            "refs/heads/main",
+        ]
+        assert commands[3] == [
+            "git",
+            "fetch",
+            "--no-tags",
+            "origin",
+            "+refs/heads/main:refs/remotes/origin/main",
+        ]
+        assert result == diff_output
 
     def test_fetch_failure_is_ignored(self):
         """Should proceed with cached tracking ref when fetch fails (e.g. offline)."""
@@ -240,6 +306,7 @@ index 123..456 100644
             "lazypr.diff.subprocess.run",
             side_effect=[
                 branch_list,
+                *_fetch_results()[:2],
                 subprocess.CalledProcessError(1, "git fetch"),
                 diff_result,
             ],
@@ -247,6 +314,72 @@ index 123..456 100644
             result = get_diff_remote("main")
             assert result == diff_output
 
+    def test_skips_fetch_when_remote_unchanged(self):
+        """Should not fetch when ls-remote shows the tracking ref is current."""
+        branch_list = MagicMock(returncode=0, stdout="  origin/main\n")
+        rev_parse, _, _ = _fetch_results()
+        ls_remote = MagicMock(returncode=0, stdout=f"{'a' * 40}\trefs/heads/main\n")
+        diff_result = MagicMock(returncode=0, stdout="diff output")
+        with patch(
+            "lazypr.diff.subprocess.run",
+            side_effect=[branch_list, rev_parse, ls_remote, diff_result],
+        ) as mock_run:
+            assert get_diff_remote("main") == "diff output"
+        assert mock_run.call_count == 4
+
+    def test_skips_network_after_recent_fetch(self, tmp_path):
+        """Should trust a tracking ref the last fetch, within the TTL, updated."""
+        fetch_head = tmp_path / "FETCH_HEAD"
+        fetch_head.write_text(f"{'a' * 40}\t\tbranch 'main' of github.com:o/r\n")
+        branch_list = MagicMock(returncode=0, stdout="  origin/main\n")
+        rev_parse = _fetch_results(str(fetch_head))[0]
+        diff_result = MagicMock(returncode=0, stdout="diff output")
+        with patch(
+            "lazypr.diff.subprocess.run",
+            side_effect=[branch_list, rev_parse, diff_result],
+        ):
+            assert get_diff_remote("main") == "diff output"
+
+    def test_checks_remote_once_fetch_is_old(self, tmp_path):
+        """Should ask the remote again after LAZYPR_FETCH_TTL seconds."""
+        fetch_head = tmp_path / "FETCH_HEAD"
+        fetch_head.write_text(f"{'a' * 40}\t\tbranch 'main' of github.com:o/r\n")
+        os.utime(fetch_head, (time.time() - 3600, time.time() - 3600))
+        branch_list = MagicMock(returncode=0, stdout="  origin/main\n")
+        diff_result = MagicMock(returncode=0, stdout="diff output")
+        with patch(
+            "lazypr.diff.subprocess.run",
+            side_effect=[branch_list, *_fetch_results(str(fetch_head)), diff_result],
+        ) as mock_run:
+            get_diff_remote("main")
+        assert mock_run.call_args_list[3][0][0][:2] == ["git", "fetch"]
+
+    def test_unreachable_remote_skips_fetch(self):
+        """Should not try to fetch when ls-remote cannot reach the remote."""
+        branch_list = MagicMock(returncode=0, stdout="  origin/main\n")
+        diff_result = MagicMock(returncode=0, stdout="diff output")
+        with patch(
+            "lazypr.diff.subprocess.run",
+            side_effect=[
+                branch_list,
+                _fetch_results()[0],
+                subprocess.CalledProcessError(128, "git ls-remote"),
+                diff_result,
+            ],
+        ) as mock_run:
+            assert get_diff_remote("main") == "diff output"
+        assert mock_run.call_count == 4
+
+    def test_offline_never_fetches(self):
+        """Should diff against the existing tracking ref without the network."""
+        branch_list = MagicMock(returncode=0, stdout="  origin/main\n")
+        diff_result = MagicMock(returncode=0, stdout="diff output")
+        with patch(
+            "lazypr.diff.subprocess.run", side_effect=[branch_list, diff_result]
+        ) as mock_run:
+            assert get_diff_remote("main", fetch=False) == "diff output"
+        assert mock_run.call_args[0][0] == ["git", "diff", "origin/main...HEAD"]
+
     def test_local_fallback_does_not_fetch(self):
         """Should not attempt a fetch when falling back to local branch ref."""
         diff_output = "diff --git a/file.py b/file.py\n"
@@ -262,6 +395,457 @@ index 123..456 100644
             assert result == diff_output
 
 
+def _popen_mock(output: str, returncode: int = 0) -> MagicMock:
+    """Build a Popen mock whose stdout is a pipe of the output as bytes."""
+    process = MagicMock()
+    process.stdout = io.BytesIO(output.encode())
+    process.returncode = returncode
+    process.__enter__.return_value = process
+    return process
+
+
+def _attribute_results(output: str) -> list[MagicMock]:
+    """Build the rev-parse and check-attr results get_generated_paths() reads."""
+    return [
+        MagicMock(returncode=0, stdout="/repo\n"),
+        MagicMock(returncode=0, stdout=output),
+    ]
+
+
+class TestGetFilteredDiffRemote:
+    """Tests for get_filtered_diff_remote() function."""
+
+    DIFF = """diff --git a/small.py b/small.py
+index 123..456 100644
+--- a/small.py
++++ b/small.py
+@@ -1 +1 @@
+-old
++new
+
+diff --git a/large.py b/large.py
+index 789..abc 100644
+--- a/large.py
++++ b/large.py
+@@ -1,1000 +1,1000 @@
+-old
++new
+
+diff --git a/debug.log b/debug.log
+index 789..abc 100644
+--- a/debug.log
++++ b/debug.log
+@@ -1 +1 @@
+-old
++new
+"""
+
+    SMALL_NUMSTAT = b"1\t1\tsmall.py\x001\t1\tlarge.py\x001\t1\tdebug.log\x00"
+
+    def _run(
+        self,
+        output: str,
+        numstat: bytes = SMALL_NUMSTAT,
+        attributes: str = "",
+        **kwargs,
+    ) -> tuple[FilteredDiff, MagicMock, MagicMock]:
+        branch_list = MagicMock(returncode=0, stdout="  origin/main\n")
+        numstat_result = MagicMock(returncode=0, stdout=numstat)
+        with (
+            patch(
+                "lazypr.diff.subprocess.run",
+                side_effect=[
+                    branch_list,
+                    *_fetch_results(),
+                    numstat_result,
+                    *_attribute_results(attributes),
+                ],
+            ) as mock_run,
+            patch(
+                "lazypr.diff.subprocess.Popen", return_value=_popen_mock(output)
+            ) as mock_popen,
+        ):
+            result = get_filtered_diff_remote("main", **kwargs)
+        return result, mock_run, mock_popen
+
+    def test_streams_diff_from_remote_branch(self):
+        """Should run git diff against the remote ref through a pipe."""
+        result, _, mock_popen = self._run(self.DIFF, max_lines=5000)
+        assert mock_popen.call_args[0][0] == [
+            "git",
+            "diff",
+            *PATCH_OPTIONS,
+            "origin/main...HEAD",
+        ]
+        assert result.text == self.DIFF
+        assert result.omitted == []
+
+    def test_caps_excluded_paths_for_many_ignored_files(self):
+        """Should exclude only the largest files by name and filter the rest."""
+        vendored = [f"vendor/lib{i}.js" for i in range(3000)]
+        numstat = b"1\t1\tsmall.py\x00" + b"".join(
+            f"{i % 7 + 1}\t0\t{path}\x00".encode() for i, path in enumerate(vendored)
+        )
+        output = self.DIFF.split("diff --git a/large.py")[0] + "".join(
+            f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n"
+            "@@ -0,0 +1 @@\n+vendored\n"
+            for path in vendored[:3]
+        )
+
+        result, _, mock_popen = self._run(
+            output,
+            numstat=numstat,
+            max_lines=5000,
+            patterns=["vendor/", "!vendor/keep.js"],
+        )
+
+        excluded = [
+            arg for arg in mock_popen.call_args[0][0] if arg.startswith(":(top,")
+        ]
+        assert 0 < len(excluded) < len(vendored)
+        assert ":(top,exclude,literal)vendor/lib6.js" in excluded
+        assert "vendor/" not in result.text
+        assert "small.py" in result.text
+        assert result.omitted == []
+
+    def test_git_launch_failure_raises_diff_error(self):
+        """Should report a git diff that cannot be started as a DiffError."""
+        branch_list = MagicMock(returncode=0, stdout="  origin/main\n")
+        with (
+            patch(
+                "lazypr.diff.subprocess.run",
+                side_effect=[
+                    branch_list,
+                    *_fetch_results(),
+                    MagicMock(returncode=0, stdout=self.SMALL_NUMSTAT),
+                    *_attribute_results(""),
+                ],
+            ),
+            patch(
+                "lazypr.diff.subprocess.Popen",
+                side_effect=OSError(7, "Argument list too long"),
+            ),
+        ):
+            with pytest.raises(DiffError, match="Argument list too long"):
+                get_filtered_diff_remote("main", 5000)
+
+    def test_sizes_files_with_numstat_first(self):
+        """Should ask git for numstat before requesting patch text."""
+        _, mock_run, _ = self._run(self.DIFF, max_lines=5000)
+        assert mock_run.call_args_list[4] == call(
+            ["git", "diff", "--numstat", "-z", "origin/main...HEAD"],
+            capture_output=True,
+            check=True,
+        )
+
+    def test_excludes_oversized_files_before_diffing(self):
+        """Should never request patch text for files numstat shows as too large."""
+        numstat = b"1\t1\tsmall.py\x00900\t900\tlarge.py\x00"
+        result, _, mock_popen = self._run(
+            self.DIFF, numstat=numstat, max_lines=10, patterns=[]
+        )
+        assert mock_popen.call_args[0][0] == [
+            "git",
+            "diff",
+            *PATCH_OPTIONS,
+            "origin/main...HEAD",
+            "--",
+            ":(top,exclude,literal)large.py",
+        ]
+        assert [stat.path for stat in result.omitted] == ["large.py"]
+        assert result.omitted[0].summary() == "large.py (+900 -900)"
+
+    def test_drops_files_exceeding_max_lines_while_streaming(self):
+        """Should drop files whose effective line count exceeds max_lines."""
+        result, _, _ = self._run(self.DIFF, max_lines=10)
+        assert "small.py" in result.text
+        assert "large.py" not in result.text
+        assert "debug.log" in result.text
+        assert [stat.path for stat in result.omitted] == ["large.py"]
+
+    def test_excludes_ignored_files_in_git(self):
+        """Should pass expressible ignore patterns to git as exclude pathspecs."""
+        _, mock_run, mock_popen = self._run(
+            self.DIFF, max_lines=5000, patterns=["*.log"]
+        )
+        pathspecs = [":(top,exclude,glob)**/*.log", ":(top,exclude,glob)**/*.log/**"]
+        assert mock_run.call_args_list[4][0][0][-3:] == ["--", *pathspecs]
+        assert mock_popen.call_args[0][0] == [
+            "git",
+            "diff",
+            *PATCH_OPTIONS,
+            "origin/main...HEAD",
+            "--",
+            *pathspecs,
+        ]
+
+    def test_excludes_ignored_files_git_cannot_express(self):
+        """Should exclude files matched by Python-side patterns before diffing."""
+        result, _, mock_popen = self._run(
+            self.DIFF, max_lines=5000, patterns=["*.log", "!keep.log"]
+        )
+        assert mock_popen.call_args[0][0] == [
+            "git",
+            "diff",
+            *PATCH_OPTIONS,
+            "origin/main...HEAD",
+            "--",
+            ":(top,exclude,literal)debug.log",
+        ]
+        assert "debug.log" not in result.text
+        assert result.omitted == []
+
+    def test_matches_buffered_filtering(self):
+        """Should produce the same text as filtering the buffered diff."""
+        result, _, _ = self._run(self.DIFF, max_lines=10)
+        assert result.text == filter_large_files(self.DIFF, 10)
+
+    def test_reads_pipe_in_blocks(self):
+        """Should give the same result however the output is split into reads."""
+        expected, _, _ = self._run(self.DIFF, max_lines=10)
+        for size in (1, 7, 64):
+            with patch("lazypr.diff._READ_SIZE", size):
+                result, _, _ = self._run(self.DIFF, max_lines=10)
+            assert result == expected
+
+    def test_collapses_rename_and_mode_only_files(self):
+        """Should replace metadata-only patches with one summary line each."""
+        diff = (
+            "diff --git a/old name.py b/new name.py\n"
+            "similarity index 100%\n"
+            "rename from old name.py\n"
+            "rename to new name.py\n"
+            "diff --git a/run.sh b/run.sh\n"
+            "old mode 100644\n"
+            "new mode 100755\n"
+        ) + self.DIFF
+        result, _, _ = self._run(diff, max_lines=10)
+        assert result.text.startswith(
+            "diff --git a/old name.py b/new name.py\n"
+            "rename old name.py => new name.py (100%)\n"
+            "diff --git a/run.sh b/run.sh\n"
+            "mode change 100644 => 100755\n"
+            "diff --git a/small.py b/small.py\n"
+        )
+
+    def test_reports_dropped_renamed_file_by_new_path(self):
+        """Should report an oversized rename under the path numstat uses."""
+        diff = (
+            "diff --git a/a b/c.py b/a b/d.py\n"
+            "similarity index 50%\n"
+            "rename from a b/c.py\n"
+            "rename to a b/d.py\n"
+            "@@ -1,1000 +1,1000 @@\n"
+            "-old\n"
+        )
+        numstat = b"1\t1\t\x00a b/c.py\x00a b/d.py\x00"
+        result, _, _ = self._run(diff, numstat=numstat, max_lines=10)
+        assert result.text == ""
+        assert [stat.path for stat in result.omitted] == ["a b/d.py"]
+
+    def test_stubs_generated_files(self):
+        """Should replace lockfiles and attribute-marked files with stubs."""
+        diff = (
+            "diff --git a/web/package-lock.json b/web/package-lock.json\n"
+            "@@ -1 +1 @@\n"
+            '-"version": "1.0.0"\n'
+            '+"version": "1.0.1"\n'
+            "diff --git a/api/schema.py b/api/schema.py\n"
+            "@@ -1 +1 @@\n"
+            "-old\n"
+            "+new\n"
+        ) + self.DIFF
+        result, mock_run, _ = self._run(
+            diff,
+            attributes="api/schema.py\0linguist-generated\0set\0"
+            "api/schema.py\0diff\0unspecified\0",
+            max_lines=10,
+        )
+        assert result.text.startswith(
+            "diff --git a/web/package-lock.json b/web/package-lock.json\n"
+            "[lockfile, diff omitted]\n"
+            "diff --git a/api/schema.py b/api/schema.py\n"
+            "[generated file, diff omitted]\n"
+            "diff --git a/small.py b/small.py\n"
+        )
+        check_attr = mock_run.call_args_list[6]
+        assert check_attr.kwargs["cwd"] == "/repo"
+        assert check_attr.kwargs["input"] == "small.py\0large.py\0debug.log\0"
+
+    def test_stubs_files_with_long_lines(self):
+        """Should replace minified content by a stub once the file ends."""
+        diff = (
+            "diff --git a/static/app.js b/static/app.js\n"
+            "@@ -1 +1 @@\n"
+            f"+{'x=1;' * 300}\n"
+        ) + self.DIFF
+        result, _, _ = self._run(diff, max_lines=10)
+        assert result.text.startswith(
+            "diff --git a/static/app.js b/static/app.js\n"
+            "[long lines, diff omitted]\n"
+            "diff --git a/small.py b/small.py\n"
+        )
+
+    def test_keeps_small_edit_next_to_long_context_line(self):
+        """Should only stub a file whose changed lines are very long."""
+        diff = (
+            "diff --git a/README.md b/README.md\n"
+            "@@ -1,2 +1,2 @@\n"
+            f" {'An unwrapped paragraph of prose. ' * 40}\n"
+            "-Old line\n"
+            "+New line\n"
+        ) + self.DIFF
+        result, _, _ = self._run(diff, max_lines=10)
+        assert result.text.startswith(diff.split("diff --git a/small.py")[0])
+
+    def test_tries_next_candidate_when_diff_fails(self):
+        """Should fall back to the next candidate ref when git diff fails."""
+        branch_list = MagicMock(returncode=0, stdout="  origin/main\n")
+        numstat_result = MagicMock(returncode=0, stdout=self.SMALL_NUMSTAT)
+        with (
+            patch(
+                "lazypr.diff.subprocess.run",
+                side_effect=[
+                    branch_list,
+                    *_fetch_results(),
+                    subprocess.CalledProcessError(128, "git"),
+                    numstat_result,
+                    *_attribute_results(""),
+                ],
+            ),
+            patch(
+                "lazypr.diff.subprocess.Popen", return_value=_popen_mock(self.DIFF)
+            ) as mock_popen,
+        ):
+            result = get_filtered_diff_remote("main", max_lines=5000)
+        assert mock_popen.call_args[0][0] == [
+            "git",
+            "diff",
+            *PATCH_OPTIONS,
+            "main...HEAD",
+        ]
+        assert result.text == self.DIFF
+
+    def test_passes_context_width(self):
+        """Should pass -U, using the widest fitting width for "auto"."""
+        _, _, mock_popen = self._run(self.DIFF, max_lines=5000, context=1)
+        assert mock_popen.call_args[0][0][-2] == "-U1"
+
+        _, _, mock_popen = self._run(self.DIFF, max_lines=5000, context="auto")
+        assert mock_popen.call_args[0][0][-2] == "-U10"
+
+    def test_function_context_for_small_files(self):
+        """Should replace small files by their --function-context diff."""
+        numstat = b"1\t1\tsmall.py\x00300\t300\tlarge.py\x00"
+        whole_function = (
+            "diff --git a/small.py b/small.py\n"
+            "--- a/small.py\n"
+            "+++ b/small.py\n"
+            "@@ -1,3 +1,3 @@\n"
+            " def f():\n"
+            "-old\n"
+            "+new\n"
+        )
+        branch_list = MagicMock(returncode=0, stdout="  origin/main\n")
+        numstat_result = MagicMock(returncode=0, stdout=numstat)
+        with (
+            patch(
+                "lazypr.diff.subprocess.run",
+                side_effect=[
+                    branch_list,
+                    *_fetch_results(),
+                    numstat_result,
+                    *_attribute_results(""),
+                ],
+            ),
+            patch(
+                "lazypr.diff.subprocess.Popen",
+                side_effect=[_popen_mock(self.DIFF), _popen_mock(whole_function)],
+            ) as mock_popen,
+        ):
+            result = get_filtered_diff_remote(
+                "main", max_lines=5000, patterns=[], function_context=True
+            )
+
+        cmd = mock_popen.call_args[0][0]
+        assert "--function-context" in cmd
+        assert cmd[cmd.index("--") + 1 :] == [":(top,literal)small.py"]
+        assert result.text.startswith(whole_function + "diff --git a/large.py")
+
+    def test_raises_error_when_no_ref_works(self):
+        """Should raise DiffError when every candidate ref fails."""
+        branch_list = MagicMock(returncode=0, stdout="")
+        with (
+            patch(
+                "lazypr.diff.subprocess.run",
+                side_effect=[branch_list, subprocess.CalledProcessError(128, "git")],
+            ),
+            patch("lazypr.diff.subprocess.Popen") as mock_popen,
+        ):
+            with pytest.raises(DiffError):
+                get_filtered_diff_remote("main", max_lines=5000)
+        mock_popen.assert_not_called()
+
+
+class TestGeneratedFiles:
+    """Tests for get_generated_paths() and generated_file_reason()."""
+
+    def test_reads_gitattributes(self):
+        """Should report linguist-generated and -diff files."""
+        output = (
+            "gen.py\0linguist-generated\0true\0gen.py\0diff\0unspecified\0"
+            "a.bin\0linguist-generated\0unspecified\0a.bin\0diff\0unset\0"
+            "app.py\0linguist-generated\0unset\0app.py\0diff\0unspecified\0"
+        )
+        with patch(
+            "lazypr.diff.subprocess.run", side_effect=_attribute_results(output)
+        ):
+            result = get_generated_paths(["gen.py", "a.bin", "app.py"])
+
+        assert result == {"gen.py": "generated file", "a.bin": "binary file"}
+
+    def test_ignores_git_errors(self):
+        """Should treat every file as ordinary when git cannot answer."""
+        with patch(
+            "lazypr.diff.subprocess.run",
+            side_effect=subprocess.CalledProcessError(128, "git"),
+        ):
+            assert get_generated_paths(["app.py"]) == {}
+
+    def test_reason_from_path(self):
+        """Should recognize lockfiles and minified assets by name."""
+        assert generated_file_reason("frontend/yarn.lock") == "lockfile"
+        assert generated_file_reason("Cargo.lock") == "lockfile"
+        assert generated_file_reason("static/vendor.min.js") == "minified file"
+        assert generated_file_reason("static/app.css.map") == "minified file"
+        assert generated_file_reason("src/admin.py") is None
+        assert generated_file_reason("docs/lockfile.md") is None
+
+
+class TestGetDiffNumstat:
+    """Tests for get_diff_numstat() function."""
+
+    def test_parses_numstat_records(self):
+        """Should parse plain, binary and renamed files."""
+        output = (
+            b"3\t1\tsrc/app.py\x00"
+            b"-\t-\tlogo.png\x00"
+            b"0\t0\t\x00old name.py\x00new name.py\x00"
+        )
+        with patch(
+            "lazypr.diff.subprocess.run",
+            return_value=MagicMock(returncode=0, stdout=output),
+        ):
+            stats = get_diff_numstat("origin/main")
+
+        assert stats == [
+            FileStat(path="src/app.py", added=3, deleted=1),
+            FileStat(path="logo.png", added=None, deleted=None),
+            FileStat(path="new name.py", added=0, deleted=0, old_path="old name.py"),
+        ]
+        assert stats[1].summary() == "logo.png (binary)"
+
+
 class TestRebuildDiffWithFiles:
     """Tests for rebuild_diff_with_files() function."""
 
@@ -305,3 +889,616 @@ index 123..456 100644
         """Should return empty string for empty diff input."""
         result = rebuild_diff_with_files("", ["file.py"])
         assert result == ""
+
+
+class TestIndexDiff:
+    """Tests for index_diff() function."""
+
+    def test_records_path_counts_and_spans(self):
+        """Should record one entry per file with counts and a span into the text."""
+        diff = """diff --git a/file1.py b/file1.py
+index 123..456 100644
+--- a/file1.py
++++ b/file1.py
+@@ -1,2 +1,40 @@
+ line1
+-line2
++line2_modified
+
+diff --git a/image.png b/image.png
+Binary files differ
+"""
+        files = index_diff(diff)
+        assert [f.path for f in files] == ["file1.py", "image.png"]
+        assert files[0].line_count == 8
+        assert files[0].max_hunk_count == 40
+        assert files[0].effective_line_count == 40
+        assert files[1].is_binary is True
+        assert diff[files[0].start : files[0].end].startswith("diff --git a/file1.py")
+        assert diff[files[1].start : files[1].end] == (
+            "diff --git a/image.png b/image.png\nBinary files differ\n"
+        )
+
+    def test_ignores_text_before_first_header(self):
+        """Should not index anything before the first diff header."""
+        files = index_diff("warning: something\ndiff --git a/a.py b/a.py\n+x\n")
+        assert len(files) == 1
+        assert files[0].start == len("warning: something\n")
+
+    def test_paths_with_spaces_and_b_slash(self):
+        """Should split the header where both paths match, not at a " b/"."""
+        diff = (
+            "diff --git a/docs/a b/c.md b/docs/a b/c.md\n+x\n"
+            "diff --git a/my file.py b/my file.py\n+y\n"
+        )
+        assert [f.path for f in index_diff(diff)] == ["docs/a b/c.md", "my file.py"]
+
+    def test_quoted_paths(self):
+        """Should decode C-quoted paths, including octal UTF-8 bytes."""
+        diff = (
+            'diff --git "a/caf\\303\\251.py" "b/caf\\303\\251.py"\n+x\n'
+            'diff --git a/plain.py "b/tab\\there.py"\n'
+            "rename from plain.py\n"
+            'rename to "tab\\there.py"\n'
+        )
+        first, second = index_diff(diff)
+        assert first.path == "café.py"
+        assert (second.old_path, second.path) == ("plain.py", "tab\there.py")
+
+    def test_rename_paths_come_from_rename_lines(self):
+        """Should resolve an ambiguous rename header from its rename lines."""
+        diff = (
+            "diff --git a/x b/y b/x b/z\n"
+            "similarity index 90%\n"
+            "rename from x b/y\n"
+            "rename to x b/z\n"
+            "--- a/x b/y\n"
+            "+++ b/x b/z\n"
+            "@@ -1 +1 @@\n"
+            "-a\n"
+            "+b\n"
+        )
+        (record,) = index_diff(diff)
+        assert (record.old_path, record.path) == ("x b/y", "x b/z")
+        assert record.line_count == 6
+
+
+class TestIndexDiffBytes:
+    """Tests for index_diff_bytes() function."""
+
+    def test_matches_index_diff(self):
+        """Should find the same files and counts as index_diff()."""
+        diff = (
+            _synthetic_diff(50)
+            + "diff --git a/img.png b/img.png\nBinary files differ\n"
+        )
+
+        expected = index_diff(diff)
+        files = index_diff_bytes(diff.encode())
+
+        assert files == expected
+
+    def test_spans_are_byte_offsets(self):
+        """Should slice the raw output, including multi-byte characters."""
+        data = (
+            "diff --git a/a.py b/a.py\r\n+café\r\n"
+            "\\ No newline at end of file\r\n"
+            "diff --git a/b.py b/b.py\r\n+x\r\n"
+        ).encode()
+
+        first, second = index_diff_bytes(data)
+
+        assert (first.path, first.line_count) == ("a.py", 3)
+        assert bytes(memoryview(data)[second.start : second.end]) == (
+            b"diff --git a/b.py b/b.py\r\n+x\r\n"
+        )
+
+
+class TestFileDiffHashes:
+    """Tests for file_diff_hashes() function."""
+
+    @staticmethod
+    def _diff(index: str, start: int, b_line: str) -> str:
+        return (
+            "diff --git a/a.py b/a.py\n"
+            f"index {index} 100644\n"
+            "--- a/a.py\n"
+            "+++ b/a.py\n"
+            f"@@ -{start},2 +{start},3 @@ def main():\n"
+            " context\n"
+            "+added\n"
+            "diff --git a/b.py b/b.py\n"
+            "--- a/b.py\n"
+            "+++ b/b.py\n"
+            "@@ -1 +1 @@\n"
+            "-old\n"
+            f"+{b_line}\n"
+        )
+
+    def test_ignores_index_line_and_ranges(self):
+        """Should hash the same changes the same after the base moved on."""
+        before = file_diff_hashes(self._diff("1111111..2222222", 10, "new"))
+        after = file_diff_hashes(self._diff("3333333..4444444", 42, "new"))
+
+        assert before == after
+        assert set(before) == {"a.py", "b.py"}
+
+    def test_changes_only_for_changed_file(self):
+        """Should give a new hash only to the file whose changes differ."""
+        before = file_diff_hashes(self._diff("1111111..2222222", 10, "new"))
+        after = file_diff_hashes(self._diff("1111111..2222222", 10, "newer"))
+
+        assert before["a.py"] == after["a.py"]
+        assert before["b.py"] != after["b.py"]
+
+
+class TestSplitDiff:
+    """Tests for split_diff() function."""
+
+    def test_groups_whole_files_within_budget(self):
+        """Should pack consecutive whole files into chunks under the limit."""
+        diff = _synthetic_diff(10)
+        file_tokens = len(diff) // 10 // 4 + 1
+
+        chunks = split_diff(diff, max_tokens=file_tokens * 3)
+
+        assert len(chunks) == 4
+        assert "".join(chunks) == diff
+        assert all(chunk.startswith("diff --git ") for chunk in chunks)
+
+    def test_truncates_file_larger_than_budget(self):
+        """Should cut a single oversized file down to the limit."""
+        diff = "diff --git a/big.py b/big.py\n" + "+line\n" * 1000
+
+        chunks = split_diff(diff, max_tokens=100)
+
+        assert len(chunks) == 1
+        assert len(chunks[0]) < 500
+        assert chunks[0].endswith("[... truncated ...]\n")
+
+
+def _file_diff(path: str, hunk_sizes: list[int]) -> str:
+    """Build one file's diff with a hunk of each given size."""
+    parts = [
+        f"diff --git a/{path} b/{path}\n"
+        "index 123..456 100644\n"
+        f"--- a/{path}\n"
+        f"+++ b/{path}\n"
+    ]
+    for n, size in enumerate(hunk_sizes):
+        parts.append(f"@@ -{n * 100},1 +{n * 100},{size} @@ def f{n}():\n")
+        parts.append("+added line of code\n" * size)
+    return "".join(parts)
+
+
+class TestPackDiff:
+    """Tests for pack_diff() function."""
+
+    def test_keeps_diff_unchanged_within_budget(self):
+        """Should return the diff as-is when everything fits."""
+        diff = _file_diff("src/a.py", [3, 5])
+
+        packed = pack_diff(diff, max_tokens=10_000)
+
+        assert packed.text == diff
+        assert packed.full_hunks == 2
+        assert packed.reduced_hunks == 0
+
+    def test_reduces_large_hunks_to_headers(self):
+        """Should keep small hunks and reduce large ones to their @@ line."""
+        diff = _file_diff("src/a.py", [200, 3])
+
+        packed = pack_diff(diff, max_tokens=200)
+
+        assert (
+            "@@ -0,1 +0,200 @@ def f0():\n[... 200 lines omitted ...]\n" in packed.text
+        )
+        assert "@@ -100,1 +100,3 @@ def f1():\n" + "+added line of code\n" * 3 in (
+            packed.text
+        )
+        assert packed.full_hunks == 1
+        assert packed.reduced_hunks == 1
+        assert packed.tokens <= 200
+
+    def test_prefers_source_over_tests(self):
+        """Should spend the budget on source hunks before test hunks."""
+        diff = _file_diff("tests/test_a.py", [20]) + _file_diff("src/a.py", [20])
+        budget = pack_diff(diff, max_tokens=0).tokens + 150
+
+        packed = pack_diff(diff, max_tokens=budget)
+
+        src_part = packed.text.split("diff --git a/src/a.py")[1]
+        assert "omitted" not in src_part
+        assert "[... 20 lines omitted ...]" in packed.text.split("diff --git a/src")[0]
+
+    def test_collapses_deleted_and_renamed_files(self):
+        """Should reduce deleted files and pure renames to their header lines."""
+        diff = (
+            "diff --git a/old.py b/old.py\n"
+            "deleted file mode 100644\n"
+            "index 123..000\n"
+            "--- a/old.py\n"
+            "+++ /dev/null\n"
+            "@@ -1,2 +0,0 @@\n"
+            "-a\n"
+            "-b\n"
+            "diff --git a/x.py b/y.py\n"
+            "similarity index 100%\n"
+            "rename from x.py\n"
+            "rename to y.py\n"
+        )
+
+        packed = pack_diff(diff, max_tokens=10_000)
+
+        assert packed.text == (
+            "diff --git a/old.py b/old.py\n"
+            "deleted file mode 100644\n"
+            "diff --git a/x.py b/y.py\n"
+            "rename from x.py\n"
+            "rename to y.py\n"
+        )
+
+    def test_keeps_every_file_header_over_tiny_budget(self):
+        """Should still name every file when even the headers do not fit."""
+        diff = "".join(_file_diff(f"src/m{i}.py", [10, 10]) for i in range(20))
+
+        packed = pack_diff(diff, max_tokens=50)
+
+        assert packed.text.count("diff --git ") == 20
+        assert packed.reduced_files > 0
+
+
+class TestCondenseDiff:
+    """Tests for condense_diff() function."""
+
+    def test_leaves_plain_diff_alone(self):
+        """Should return the diff unchanged when there is nothing to condense."""
+        diff = (
+            "diff --git a/a.py b/a.py\n"
+            "--- a/a.py\n"
+            "+++ b/a.py\n"
+            "@@ -1,3 +1,3 @@\n"
+            " a\n"
+            "-b\n"
+            "+c\n"
+        )
+
+        result = condense_diff(diff)
+
+        assert result.text == diff
+        assert result.saved_tokens == 0
+
+    def test_trims_context_and_splits_hunks(self):
+        """Should keep context_lines around changes and renumber the hunks."""
+        context = [f" line{i}\n" for i in range(1, 21)]
+        diff = (
+            "diff --git a/a.py b/a.py\n"
+            "--- a/a.py\n"
+            "+++ b/a.py\n"
+            "@@ -1,22 +1,22 @@ def main():\n"
+            + "".join(context[:5])
+            + "-old\n+new\n"
+            + "".join(context[5:15])
+            + "-old2\n+new2\n"
+            + "".join(context[15:])
+        )
+
+        result = condense_diff(diff, context_lines=1)
+
+        assert result.text.endswith(
+            "@@ -5,3 +5,3 @@ def main():\n line5\n-old\n+new\n line6\n"
+            "@@ -16,3 +16,3 @@\n line15\n-old2\n+new2\n line16\n"
+        )
+        assert result.trimmed_lines == 16
+        assert result.saved_tokens > 0
+
+    def test_reduces_whitespace_only_file(self):
+        """Should reduce a reformatted file to its header and a note."""
+        diff = (
+            "diff --git a/a.py b/a.py\n"
+            "--- a/a.py\n"
+            "+++ b/a.py\n"
+            "@@ -1,2 +1,4 @@\n"
+            "-def f( x ):\n"
+            "+def f(x):\n"
+            "+\n"
+            "     return x\n"
+            "+\n"
+        )
+
+        result = condense_diff(diff)
+
+        assert result.text == (
+            "diff --git a/a.py b/a.py\n"
+            "--- a/a.py\n"
+            "+++ b/a.py\n"
+            "[whitespace-only changes, diff omitted]\n"
+        )
+        assert result.cosmetic_hunks == 1
+
+    def test_reduces_reordered_hunk(self):
+        """Should reduce a hunk that only reorders lines, keeping the others."""
+        diff = (
+            "diff --git a/a.py b/a.py\n"
+            "--- a/a.py\n"
+            "+++ b/a.py\n"
+            "@@ -1,4 +1,4 @@\n"
+            "-from collections import OrderedDict, defaultdict\n"
+            "-import subprocess\n"
+            " import sys\n"
+            "+import subprocess\n"
+            "+from collections import OrderedDict, defaultdict\n"
+            "@@ -10 +10 @@ def main():\n"
+            "-    return 1\n"
+            "+    return 2\n"
+        )
+
+        result = condense_diff(diff)
+
+        assert "@@ -1,4 +1,4 @@\n[reordered lines, 5 lines omitted]\n" in result.text
+        assert "+    return 2\n" in result.text
+
+    def test_keeps_dedent_in_indentation_sensitive_file(self):
+        """Should not call moving a Python statement out of a block cosmetic."""
+        diff = (
+            "diff --git a/a.py b/a.py\n"
+            "--- a/a.py\n"
+            "+++ b/a.py\n"
+            "@@ -1,4 +1,4 @@\n"
+            " def f(x):\n"
+            "     if x:\n"
+            "         log(x)\n"
+            "-        return 1\n"
+            "+    return 1\n"
+        )
+
+        result = condense_diff(diff)
+
+        assert result.text == diff
+        assert result.cosmetic_hunks == 0
+
+    def test_reduces_reindent_in_braced_language(self):
+        """Should treat re-indentation as cosmetic where braces carry blocks."""
+        diff = (
+            "diff --git a/a.c b/a.c\n"
+            "--- a/a.c\n"
+            "+++ b/a.c\n"
+            "@@ -1,3 +1,3 @@\n"
+            " int f(int x) {\n"
+            "-  return x + compute_offset(x);\n"
+            "+    return x + compute_offset(x);\n"
+            " }\n"
+        )
+
+        result = condense_diff(diff)
+
+        assert "[whitespace-only changes, diff omitted]" in result.text
+
+    def test_keeps_reordered_statements(self):
+        """Should only call reordered imports cosmetic, not statements."""
+        diff = (
+            "diff --git a/a.go b/a.go\n"
+            "--- a/a.go\n"
+            "+++ b/a.go\n"
+            "@@ -1,4 +1,4 @@ func transfer() {\n"
+            "-\tsrc.withdraw(amount)\n"
+            "-\taudit.record(amount)\n"
+            "+\taudit.record(amount)\n"
+            "+\tsrc.withdraw(amount)\n"
+            " \tdst.deposit(amount)\n"
+        )
+
+        result = condense_diff(diff)
+
+        assert result.text == diff
+        assert result.cosmetic_hunks == 0
+
+    def test_collapses_moved_block(self):
+        """Should replace a block moved between files by a note on both sides."""
+        block = [
+            "def helper(value):\n",
+            "    total = value * 2\n",
+            "    return total + offset(value)\n",
+        ]
+        diff = (
+            "diff --git a/a.py b/a.py\n"
+            "--- a/a.py\n"
+            "+++ b/a.py\n"
+            "@@ -1,4 +1 @@\n"
+            " x = 1\n"
+            + "".join("-" + line for line in block)
+            + "diff --git a/b.py b/b.py\n"
+            "--- a/b.py\n"
+            "+++ b/b.py\n"
+            "@@ -1 +1,4 @@\n"
+            " y = 2\n"
+            # Indented differently, e.g. moved into a class
+            + "".join("+    " + line for line in block)
+        )
+
+        result = condense_diff(diff)
+
+        assert result.moved_blocks == 1
+        assert result.text.count("[moved 3 lines from a.py to b.py]\n") == 2
+        assert "helper" not in result.text
+
+    def test_keeps_reindented_block(self):
+        """Should not treat a block re-indented in place as moved."""
+        diff = (
+            "diff --git a/a.py b/a.py\n"
+            "--- a/a.py\n"
+            "+++ b/a.py\n"
+            "@@ -1,4 +1,5 @@\n"
+            "+if enabled:\n"
+            "-first_statement()\n"
+            "-second_statement()\n"
+            "-third_statement()\n"
+            "+    first_statement()\n"
+            "+    second_statement()\n"
+            "+    third_statement()\n"
+        )
+
+        result = condense_diff(diff)
+
+        assert result.text == diff
+
+
+class TestPreparePromptDiff:
+    """Tests for prepare_prompt_diff() function."""
+
+    DIFF = (
+        "diff --git a/a.py b/a.py\n"
+        "--- a/a.py\n"
+        "+++ b/a.py\n"
+        "@@ -1,2 +1,2 @@\n"
+        "-def f( x ):\n"
+        "-    return   x\n"
+        "+def f(x):\n"
+        "+    return x\n"
+    )
+
+    def test_condenses_by_default(self, monkeypatch):
+        """Should condense the diff and skip the budget steps without a budget."""
+        monkeypatch.delenv("LAZYPR_TOKEN_BUDGET", raising=False)
+
+        result = prepare_prompt_diff(self.DIFF)
+
+        assert result.text.endswith("[whitespace-only changes, diff omitted]\n")
+        assert result.condensed is not None
+        assert result.fitted is None and result.packed is None
+
+    def test_packs_into_token_budget(self, monkeypatch):
+        """Should pack the diff when LAZYPR_TOKEN_BUDGET is set."""
+        monkeypatch.setenv("LAZYPR_CONDENSE", "0")
+        monkeypatch.setenv("LAZYPR_TOKEN_BUDGET", "1")
+
+        result = prepare_prompt_diff(self.DIFF, context="auto")
+
+        assert result.condensed is None
+        assert result.fitted is not None
+        assert result.packed is not None
+        assert result.text == result.packed.text
+        assert "return x" not in result.text
+
+
+class TestFitDiffContext:
+    """Tests for fit_diff_context() function."""
+
+    @staticmethod
+    def _file(name: str, context: int) -> str:
+        lines = [f" {name} context {i}\n" for i in range(context)]
+        return (
+            f"diff --git a/{name} b/{name}\n"
+            f"--- a/{name}\n"
+            f"+++ b/{name}\n"
+            f"@@ -1,{2 * context + 1} +1,{2 * context + 1} @@\n"
+            + "".join(lines)
+            + "-old\n+new\n"
+            + "".join(lines)
+        )
+
+    def test_keeps_context_within_budget(self):
+        """Should leave a diff that fits untouched."""
+        diff = self._file("a.py", 10)
+
+        result = fit_diff_context(diff, max_tokens=10_000)
+
+        assert result.text == diff
+        assert result.trimmed_lines == 0
+
+    def test_narrows_largest_file_first(self):
+        """Should trim the file taking the most tokens until the diff fits."""
+        small, large = self._file("a.py", 3), self._file("b.py", 10)
+        budget = (len(small) + len(large)) // 4 - 30
+
+        result = fit_diff_context(small + large, max_tokens=budget)
+
+        assert result.text.startswith(small)
+        assert "@@ -6,11 +6,11 @@\n b.py context 5\n" in result.text
+        assert result.trimmed_lines == 10
+        assert result.saved_tokens > 0
+
+    def test_stops_at_changed_lines(self):
+        """Should keep at least the changes when nothing fits."""
+        result = fit_diff_context(self._file("a.py", 10), max_tokens=1)
+
+        assert result.text.endswith("@@ -11 +11 @@\n-old\n+new\n")
+
+
+class TestIsTestPath:
+    """Tests for is_test_path() function."""
+
+    @pytest.mark.parametrize(
+        "path",
+        [
+            "tests/test_diff.py",
+            "pkg/test/Foo.java",
+            "test_x.py",
+            "server/handler_test.go",
+            "web/app.spec.ts",
+            "web/__tests__/app.js",
+        ],
+    )
+    def test_detects_test_files(self, path):
+        """Should recognize common test file layouts."""
+        assert is_test_path(path) is True
+
+    @pytest.mark.parametrize("path", ["src/lazypr/diff.py", "contest/main.py"])
+    def test_ignores_source_files(self, path):
+        """Should not treat source files as tests."""
+        assert is_test_path(path) is False
+
+
+def _synthetic_diff(num_files: int) -> str:
+    """Build a diff with num_files small files."""
+    chunk = (
+        "diff --git a/src/module_{i}.py b/src/module_{i}.py\n"
+        "index 123..456 100644\n"
+        "--- a/src/module_{i}.py\n"
+        "+++ b/src/module_{i}.py\n"
+        "@@ -1,3 +1,3 @@\n"
+        " context\n"
+        "-old line\n"
+        "+new line\n"
+    )
+    return "".join(chunk.format(i=i) for i in range(num_files))
+
+
+class TestDiffEnginePerformance:
+    """Benchmarks guarding the single-pass diff engine."""
+
+    def _best_time(self, func, *args) -> float:
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            func(*args)
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def test_filter_large_files_scales_linearly(self):
+        """Quadrupling the diff should take roughly four times as long, not 16."""
+        small = _synthetic_diff(5_000)
+        large = _synthetic_diff(20_000)
+
+        small_time = self._best_time(filter_large_files, small, 5)
+        large_time = self._best_time(filter_large_files, large, 5)
+
+        assert large_time < small_time * 8
+
+    def test_filter_large_files_keeps_one_copy_of_input(self):
+        """Peak memory should stay near a single copy of the diff text."""
+        diff = _synthetic_diff(20_000)
+        # Drop every other file so the output is actually rebuilt
+        diff = diff.replace(
+            "@@ -1,3 +1,3 @@\n context", "@@ -1,3 +1,3000 @@\n c", 10_000
+        )
+
+        tracemalloc.start()
+        try:
+            filter_large_files(diff, 100)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        # Per-file records plus the output, but never a list of every line
+        assert peak < len(diff) * 3
@@ -1,11 +1,19 @@
 """Tests for .lazyprignore pattern matching."""
 
+import shutil
+import subprocess
+import time
+
+import pathspec
 import pytest
 from unittest.mock import patch, mock_open
 
 from lazypr.ignore import (
     load_ignore_patterns,
     apply_ignore_patterns,
+    compile_ignore_patterns,
+    to_git_pathspecs,
+    IgnoreMatcher,
 )
 from lazypr.ignore import matches_pattern
 
@@ -100,3 +108,136 @@ class TestApplyIgnorePatterns:
 
         result = apply_ignore_patterns(files, patterns)
         assert result == ["app.py", "__pycache__/cache.pyc"]
+
+    def test_negation_reincludes_file(self):
+        """Should keep files re-included by a later negation pattern."""
+        files = ["debug.log", "important.log", "app.py"]
+        patterns = ["*.log", "!important.log"]
+
+        result = apply_ignore_patterns(files, patterns)
+        assert result == ["important.log", "app.py"]
+
+    def test_last_matching_pattern_wins(self):
+        """Should let a later pattern override an earlier negation."""
+        files = ["important.log", "app.py"]
+        patterns = ["!important.log", "*.log"]
+
+        result = apply_ignore_patterns(files, patterns)
+        assert result == ["app.py"]
+
+
+class TestIgnoreMatcher:
+    """Tests for the compiled IgnoreMatcher."""
+
+    def test_is_ignored(self):
+        """Should report whether a single path is excluded."""
+        matcher = IgnoreMatcher(["*.log", "!keep.log"])
+        assert matcher.is_ignored("logs/debug.log") is True
+        assert matcher.is_ignored("keep.log") is False
+        assert matcher.is_ignored("app.py") is False
+
+    def test_empty_matcher_ignores_nothing(self):
+        """Should not ignore anything without patterns."""
+        assert IgnoreMatcher([]).is_ignored("anything.py") is False
+
+    def test_compiles_patterns_once(self):
+        """Should compile the pattern list once however many files are matched."""
+        compile_ignore_patterns.cache_clear()
+        files = [f"src/file{i}.py" for i in range(100)]
+        with patch(
+            "lazypr.ignore.pathspec.GitIgnoreSpec.from_lines",
+            wraps=pathspec.GitIgnoreSpec.from_lines,
+        ) as mock_from_lines:
+            apply_ignore_patterns(files, ["*.log", "build/"])
+            apply_ignore_patterns(files, ["*.log", "build/"])
+        assert mock_from_lines.call_count == 1
+
+    def test_filtering_benchmark(self):
+        """60 patterns over 5,000 files should filter well under a second."""
+        compile_ignore_patterns.cache_clear()
+        patterns = [f"*.ext{i}" for i in range(30)]
+        patterns += [f"generated{i}/" for i in range(29)] + ["!keep.ext1"]
+        files = [f"src/pkg{i % 50}/file{i}.py" for i in range(5_000)]
+
+        start = time.perf_counter()
+        result = apply_ignore_patterns(files, patterns)
+        elapsed = time.perf_counter() - start
+
+        assert result == files
+        assert elapsed < 1.0
+
+
+class TestToGitPathspecs:
+    """Tests for to_git_pathspecs() function."""
+
+    @pytest.mark.parametrize(
+        "pattern,expected",
+        [
+            ("*.log", ["**/*.log", "**/*.log/**"]),
+            ("package-lock.json", ["**/package-lock.json", "**/package-lock.json/**"]),
+            ("build", ["**/build", "**/build/**"]),
+            ("__pycache__/", ["**/__pycache__/**"]),
+            ("/build", ["build", "build/**"]),
+            ("temp/**", ["temp/**"]),
+            ("src/gen/*.pb.go", ["src/gen/*.pb.go", "src/gen/*.pb.go/**"]),
+        ],
+    )
+    def test_translates_patterns(self, pattern, expected):
+        """Should translate gitignore-style patterns to exclude pathspecs."""
+        specs = [f":(top,exclude,glob){glob}" for glob in expected]
+        assert to_git_pathspecs([pattern]) == (specs, [])
+
+    def test_keeps_patterns_before_negation_as_fallback(self):
+        """Should leave patterns a later negation could override to Python."""
+        pathspecs, fallback = to_git_pathspecs(["*.log", "!important.log", "*.tmp"])
+        assert pathspecs == [
+            ":(top,exclude,glob)**/*.tmp",
+            ":(top,exclude,glob)**/*.tmp/**",
+        ]
+        assert fallback == ["*.log", "!important.log"]
+
+    def test_keeps_escaped_patterns_as_fallback(self):
+        """Should not translate patterns with escapes."""
+        assert to_git_pathspecs(["\\#notes.txt"]) == ([], ["\\#notes.txt"])
+
+    def test_empty_patterns(self):
+        """Should return nothing for an empty pattern list."""
+        assert to_git_pathspecs([]) == ([], [])
+
+    @pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+    def test_git_excludes_same_files_as_python(self, tmp_path):
+        """Should make git exclude what apply_ignore_patterns() drops."""
+        files = [
+            "build/x.py",
+            "node_modules/pkg/index.js",
+            "sub/build/y.py",
+            "cache/__pycache__/m.pyc",
+            "logs/debug.log",
+            "src/build.py",
+            "src/app.py",
+        ]
+        patterns = ["build", "node_modules", "__pycache__/", "*.log"]
+
+        def git(*args):
+            return subprocess.run(
+                ["git", "-c", "user.name=t", "-c", "user.email=t@t", *args],
+                cwd=tmp_path,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+
+        git("init", "-q")
+        git("commit", "-q", "--allow-empty", "-m", "base")
+        for name in files:
+            (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+            (tmp_path / name).write_text("x\n")
+        git("add", "-A")
+        git("commit", "-q", "-m", "add files")
+
+        pathspecs, fallback = to_git_pathspecs(patterns)
+        diffed = git("diff", "--name-only", "HEAD~1", "HEAD", "--", *pathspecs)
+
+        assert fallback == []
+        assert diffed.split() == sorted(apply_ignore_patterns(files, patterns))
+        assert diffed.split() == ["src/app.py", "src/build.py"]
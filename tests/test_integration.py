@@ -1,11 +1,39 @@
 """Integration tests for the complete workflow."""
 
+import asyncio
+import json
+import shutil
 import subprocess
+import time
+from contextlib import ExitStack, contextmanager
 import pytest
 import typer
 from unittest.mock import patch, MagicMock
+from typer.testing import CliRunner
 
-from lazypr import create, create_pr, ValidationError
+from lazypr import (
+    app,
+    create,
+    create_pr,
+    edit_pr,
+    update,
+    ValidationError,
+    _get_prompt_diff,
+)
+from lazypr.ai import PRContent
+from lazypr.batch import BatchResult
+from lazypr.cache import BranchState, store_cached
+from lazypr.daemon import DaemonContent, DaemonError
+from lazypr.diff import FilteredDiff
+from lazypr.usage import TokenUsage, load_usage_records, record_usage
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    """Keep the PR content cache, daemon socket and usage log out of home."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    monkeypatch.setenv("XDG_STATE_HOME", str(tmp_path))
 
 
 class TestMainWorkflow:
@@ -19,19 +47,26 @@ class TestMainWorkflow:
         mock_pr_content.description = "Test description"
 
         with (
-            patch("lazypr.is_git_repo", return_value=True),
-            patch("lazypr.has_gh_cli", return_value=True),
-            patch("lazypr.gh_is_authenticated", return_value=True),
-            patch("lazypr.has_remote", return_value=True),
-            patch("lazypr.get_current_branch", return_value="feature-branch"),
-            patch("lazypr.is_branch_pushed_to_remote", return_value=True),
-            patch("lazypr.has_commits_ahead", return_value=True),
-            patch("lazypr.get_diff_remote", return_value="diff content"),
-            patch("lazypr.parse_diff_lines", return_value={"file.py": 5}),
-            patch("lazypr.filter_large_files", return_value="filtered diff"),
+            patch("lazypr.validation.is_git_repo_async", return_value=True),
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=True),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch(
+                "lazypr.validation.get_current_branch_async",
+                return_value="feature-branch",
+            ),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async",
+                return_value=True,
+            ),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=True),
+            patch(
+                "lazypr.get_filtered_diff_remote",
+                return_value=FilteredDiff(text="filtered diff"),
+            ),
             patch("lazypr.load_ignore_patterns", return_value=[]),
-            patch("lazypr.apply_ignore_patterns", return_value=["file.py"]),
-            patch("lazypr.generate_pr_content", return_value=mock_pr_content),
+            patch("lazypr.ai.generate_pr_content", return_value=mock_pr_content),
+            patch("lazypr.ai.prepare_pr_agent"),
             patch("lazypr.create_pr") as mock_create_pr,
         ):
 
@@ -43,7 +78,17 @@ class TestMainWorkflow:
     @pytest.mark.asyncio
     async def test_fails_when_not_in_git_repo(self):
         """Should exit with error when not in git repo."""
-        with patch("lazypr.is_git_repo", return_value=False):
+        with (
+            patch("lazypr.validation.is_git_repo_async", return_value=False),
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=True),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch("lazypr.validation.get_current_branch_async", return_value="feature"),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async", return_value=True
+            ),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=True),
+        ):
             with pytest.raises(ValidationError, match="git repository"):
                 await create(base="main")
 
@@ -51,8 +96,15 @@ class TestMainWorkflow:
     async def test_fails_when_gh_cli_missing(self):
         """Should exit with error when gh CLI not installed."""
         with (
-            patch("lazypr.is_git_repo", return_value=True),
-            patch("lazypr.has_gh_cli", return_value=False),
+            patch("lazypr.validation.is_git_repo_async", return_value=True),
+            patch("lazypr.validation.has_gh_cli", return_value=False),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=True),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch("lazypr.validation.get_current_branch_async", return_value="feature"),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async", return_value=True
+            ),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=True),
         ):
             with pytest.raises(ValidationError, match="gh CLI"):
                 await create(base="main")
@@ -61,9 +113,15 @@ class TestMainWorkflow:
     async def test_fails_when_gh_not_authenticated(self):
         """Should exit with error when gh not authenticated."""
         with (
-            patch("lazypr.is_git_repo", return_value=True),
-            patch("lazypr.has_gh_cli", return_value=True),
-            patch("lazypr.gh_is_authenticated", return_value=False),
+            patch("lazypr.validation.is_git_repo_async", return_value=True),
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=False),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch("lazypr.validation.get_current_branch_async", return_value="feature"),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async", return_value=True
+            ),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=True),
         ):
             with pytest.raises(ValidationError, match="authenticated"):
                 await create(base="main")
@@ -72,13 +130,16 @@ class TestMainWorkflow:
     async def test_fails_when_no_commits_ahead(self):
         """Should exit with error when no commits ahead of base."""
         with (
-            patch("lazypr.is_git_repo", return_value=True),
-            patch("lazypr.has_gh_cli", return_value=True),
-            patch("lazypr.gh_is_authenticated", return_value=True),
-            patch("lazypr.has_remote", return_value=True),
-            patch("lazypr.get_current_branch", return_value="feature"),
-            patch("lazypr.is_branch_pushed_to_remote", return_value=True),
-            patch("lazypr.has_commits_ahead", return_value=False),
+            patch("lazypr.validation.is_git_repo_async", return_value=True),
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=True),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch("lazypr.validation.get_current_branch_async", return_value="feature"),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async",
+                return_value=True,
+            ),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=False),
         ):
             with pytest.raises(ValidationError, match="commits ahead"):
                 await create(base="main")
@@ -91,28 +152,33 @@ class TestMainWorkflow:
         mock_pr_content.description = "Test description"
 
         with (
-            patch("lazypr.is_git_repo", return_value=True),
-            patch("lazypr.has_gh_cli", return_value=True),
-            patch("lazypr.gh_is_authenticated", return_value=True),
-            patch("lazypr.has_remote", return_value=True),
-            patch("lazypr.get_current_branch", return_value="feature-branch"),
+            patch("lazypr.validation.is_git_repo_async", return_value=True),
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=True),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch(
+                "lazypr.validation.get_current_branch_async",
+                return_value="feature-branch",
+            ),
             patch(
-                "lazypr.is_branch_pushed_to_remote", return_value=False
+                "lazypr.validation.is_branch_pushed_to_remote_async",
+                return_value=False,
             ) as mock_check,
             patch("lazypr.push_branch_to_remote") as mock_push,
-            patch("lazypr.has_commits_ahead", return_value=True),
-            patch("lazypr.get_diff_remote", return_value="diff content"),
-            patch("lazypr.parse_diff_lines", return_value={"file.py": 5}),
-            patch("lazypr.filter_large_files", return_value="filtered diff"),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=True),
+            patch(
+                "lazypr.get_filtered_diff_remote",
+                return_value=FilteredDiff(text="filtered diff"),
+            ),
             patch("lazypr.load_ignore_patterns", return_value=[]),
-            patch("lazypr.apply_ignore_patterns", return_value=["file.py"]),
-            patch("lazypr.generate_pr_content", return_value=mock_pr_content),
+            patch("lazypr.ai.generate_pr_content", return_value=mock_pr_content),
+            patch("lazypr.ai.prepare_pr_agent"),
             patch("lazypr.create_pr") as mock_create_pr,
             patch("typer.confirm", return_value=True) as mock_confirm,
         ):
 
             await create(base="main")
-            mock_check.assert_called_once_with("feature-branch")
+            mock_check.assert_called_once_with()
             mock_confirm.assert_called_once()
             mock_push.assert_called_once_with("feature-branch", "origin")
             mock_create_pr.assert_called_once()
@@ -125,20 +191,27 @@ class TestMainWorkflow:
         mock_pr_content.description = "Test description"
 
         with (
-            patch("lazypr.is_git_repo", return_value=True),
-            patch("lazypr.has_gh_cli", return_value=True),
-            patch("lazypr.gh_is_authenticated", return_value=True),
-            patch("lazypr.has_remote", return_value=True),
-            patch("lazypr.get_current_branch", return_value="feature-branch"),
-            patch("lazypr.is_branch_pushed_to_remote", return_value=False),
+            patch("lazypr.validation.is_git_repo_async", return_value=True),
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=True),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch(
+                "lazypr.validation.get_current_branch_async",
+                return_value="feature-branch",
+            ),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async",
+                return_value=False,
+            ),
             patch("lazypr.push_branch_to_remote") as mock_push,
-            patch("lazypr.has_commits_ahead", return_value=True),
-            patch("lazypr.get_diff_remote", return_value="diff content"),
-            patch("lazypr.parse_diff_lines", return_value={"file.py": 5}),
-            patch("lazypr.filter_large_files", return_value="filtered diff"),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=True),
+            patch(
+                "lazypr.get_filtered_diff_remote",
+                return_value=FilteredDiff(text="filtered diff"),
+            ),
             patch("lazypr.load_ignore_patterns", return_value=[]),
-            patch("lazypr.apply_ignore_patterns", return_value=["file.py"]),
-            patch("lazypr.generate_pr_content", return_value=mock_pr_content),
+            patch("lazypr.ai.generate_pr_content", return_value=mock_pr_content),
+            patch("lazypr.ai.prepare_pr_agent"),
             patch("lazypr.create_pr") as mock_create_pr,
             patch("typer.confirm", return_value=False) as mock_confirm,
         ):
@@ -149,6 +222,49 @@ class TestMainWorkflow:
             mock_push.assert_not_called()
             mock_create_pr.assert_not_called()
 
+    @pytest.mark.asyncio
+    async def test_prepares_agent_while_getting_diff(self):
+        """Should overlap agent warm-up with fetch and diff generation."""
+        mock_pr_content = MagicMock()
+        mock_pr_content.title = "Test PR"
+        mock_pr_content.description = "Test description"
+        agent = MagicMock()
+
+        def slow_diff(*args, **kwargs):
+            time.sleep(0.3)
+            return FilteredDiff(text="filtered diff")
+
+        async def slow_prepare():
+            await asyncio.sleep(0.3)
+            return agent
+
+        with (
+            patch("lazypr.validation.is_git_repo_async", return_value=True),
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=True),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch("lazypr.validation.get_current_branch_async", return_value="f"),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async",
+                return_value=True,
+            ),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=True),
+            patch("lazypr.get_filtered_diff_remote", side_effect=slow_diff),
+            patch("lazypr.load_ignore_patterns", return_value=[]),
+            patch("lazypr.ai.prepare_pr_agent", side_effect=slow_prepare),
+            patch(
+                "lazypr.ai.generate_pr_content", return_value=mock_pr_content
+            ) as mock_generate,
+            patch("lazypr.create_pr"),
+        ):
+            start = time.perf_counter()
+            await create(base="main")
+            elapsed = time.perf_counter() - start
+
+        # Run one after the other, the two steps would take 0.6s
+        assert elapsed < 0.5
+        assert mock_generate.call_args.kwargs["agent"] is agent
+
 
 class TestYesFlag:
     """Tests for the -y flag behavior."""
@@ -161,20 +277,27 @@ class TestYesFlag:
         mock_pr_content.description = "Test description"
 
         with (
-            patch("lazypr.is_git_repo", return_value=True),
-            patch("lazypr.has_gh_cli", return_value=True),
-            patch("lazypr.gh_is_authenticated", return_value=True),
-            patch("lazypr.has_remote", return_value=True),
-            patch("lazypr.get_current_branch", return_value="feature-branch"),
-            patch("lazypr.is_branch_pushed_to_remote", return_value=False),
+            patch("lazypr.validation.is_git_repo_async", return_value=True),
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=True),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch(
+                "lazypr.validation.get_current_branch_async",
+                return_value="feature-branch",
+            ),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async",
+                return_value=False,
+            ),
             patch("lazypr.push_branch_to_remote") as mock_push,
-            patch("lazypr.has_commits_ahead", return_value=True),
-            patch("lazypr.get_diff_remote", return_value="diff content"),
-            patch("lazypr.parse_diff_lines", return_value={"file.py": 5}),
-            patch("lazypr.filter_large_files", return_value="filtered diff"),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=True),
+            patch(
+                "lazypr.get_filtered_diff_remote",
+                return_value=FilteredDiff(text="filtered diff"),
+            ),
             patch("lazypr.load_ignore_patterns", return_value=[]),
-            patch("lazypr.apply_ignore_patterns", return_value=["file.py"]),
-            patch("lazypr.generate_pr_content", return_value=mock_pr_content),
+            patch("lazypr.ai.generate_pr_content", return_value=mock_pr_content),
+            patch("lazypr.ai.prepare_pr_agent"),
             patch("lazypr.create_pr") as mock_create_pr,
             patch("typer.confirm") as mock_confirm,
         ):
@@ -193,19 +316,26 @@ class TestYesFlag:
         mock_pr_content.description = "Test description"
 
         with (
-            patch("lazypr.is_git_repo", return_value=True),
-            patch("lazypr.has_gh_cli", return_value=True),
-            patch("lazypr.gh_is_authenticated", return_value=True),
-            patch("lazypr.has_remote", return_value=True),
-            patch("lazypr.get_current_branch", return_value="feature-branch"),
-            patch("lazypr.is_branch_pushed_to_remote", return_value=True),
-            patch("lazypr.has_commits_ahead", return_value=True),
-            patch("lazypr.get_diff_remote", return_value="diff content"),
-            patch("lazypr.parse_diff_lines", return_value={"file.py": 5}),
-            patch("lazypr.filter_large_files", return_value="filtered diff"),
+            patch("lazypr.validation.is_git_repo_async", return_value=True),
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=True),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch(
+                "lazypr.validation.get_current_branch_async",
+                return_value="feature-branch",
+            ),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async",
+                return_value=True,
+            ),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=True),
+            patch(
+                "lazypr.get_filtered_diff_remote",
+                return_value=FilteredDiff(text="filtered diff"),
+            ),
             patch("lazypr.load_ignore_patterns", return_value=[]),
-            patch("lazypr.apply_ignore_patterns", return_value=["file.py"]),
-            patch("lazypr.generate_pr_content", return_value=mock_pr_content),
+            patch("lazypr.ai.generate_pr_content", return_value=mock_pr_content),
+            patch("lazypr.ai.prepare_pr_agent"),
             patch("lazypr.create_pr") as mock_create_pr,
         ):
             await create(base="main", yes=True)
@@ -225,19 +355,26 @@ class TestDryRunFlag:
         mock_pr_content.description = "Test description"
 
         with (
-            patch("lazypr.is_git_repo", return_value=True),
-            patch("lazypr.has_gh_cli", return_value=True),
-            patch("lazypr.gh_is_authenticated", return_value=True),
-            patch("lazypr.has_remote", return_value=True),
-            patch("lazypr.get_current_branch", return_value="feature-branch"),
-            patch("lazypr.is_branch_pushed_to_remote", return_value=True),
-            patch("lazypr.has_commits_ahead", return_value=True),
-            patch("lazypr.get_diff_remote", return_value="diff content"),
-            patch("lazypr.parse_diff_lines", return_value={"file.py": 5}),
-            patch("lazypr.filter_large_files", return_value="filtered diff"),
+            patch("lazypr.validation.is_git_repo_async", return_value=True),
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=True),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch(
+                "lazypr.validation.get_current_branch_async",
+                return_value="feature-branch",
+            ),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async",
+                return_value=True,
+            ),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=True),
+            patch(
+                "lazypr.get_filtered_diff_remote",
+                return_value=FilteredDiff(text="filtered diff"),
+            ),
             patch("lazypr.load_ignore_patterns", return_value=[]),
-            patch("lazypr.apply_ignore_patterns", return_value=["file.py"]),
-            patch("lazypr.generate_pr_content", return_value=mock_pr_content),
+            patch("lazypr.ai.generate_pr_content", return_value=mock_pr_content),
+            patch("lazypr.ai.prepare_pr_agent"),
             patch("lazypr.create_pr") as mock_create_pr,
         ):
             await create(base="main", dry_run=True)
@@ -251,20 +388,27 @@ class TestDryRunFlag:
         mock_pr_content.description = "Test description"
 
         with (
-            patch("lazypr.is_git_repo", return_value=True),
-            patch("lazypr.has_gh_cli", return_value=True),
-            patch("lazypr.gh_is_authenticated", return_value=True),
-            patch("lazypr.has_remote", return_value=True),
-            patch("lazypr.get_current_branch", return_value="feature-branch"),
-            patch("lazypr.is_branch_pushed_to_remote", return_value=False),
+            patch("lazypr.validation.is_git_repo_async", return_value=True),
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=True),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch(
+                "lazypr.validation.get_current_branch_async",
+                return_value="feature-branch",
+            ),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async",
+                return_value=False,
+            ),
             patch("lazypr.push_branch_to_remote") as mock_push,
-            patch("lazypr.has_commits_ahead", return_value=True),
-            patch("lazypr.get_diff_remote", return_value="diff content"),
-            patch("lazypr.parse_diff_lines", return_value={"file.py": 5}),
-            patch("lazypr.filter_large_files", return_value="filtered diff"),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=True),
+            patch(
+                "lazypr.get_filtered_diff_remote",
+                return_value=FilteredDiff(text="filtered diff"),
+            ),
             patch("lazypr.load_ignore_patterns", return_value=[]),
-            patch("lazypr.apply_ignore_patterns", return_value=["file.py"]),
-            patch("lazypr.generate_pr_content", return_value=mock_pr_content),
+            patch("lazypr.ai.generate_pr_content", return_value=mock_pr_content),
+            patch("lazypr.ai.prepare_pr_agent"),
             patch("lazypr.create_pr") as mock_create_pr,
             patch("typer.confirm") as mock_confirm,
         ):
@@ -281,25 +425,712 @@ class TestDryRunFlag:
         mock_pr_content.description = "Test description"
 
         with (
-            patch("lazypr.is_git_repo", return_value=True),
-            patch("lazypr.has_gh_cli", return_value=True),
-            patch("lazypr.gh_is_authenticated", return_value=True),
-            patch("lazypr.has_remote", return_value=True),
-            patch("lazypr.get_current_branch", return_value="feature-branch"),
-            patch("lazypr.is_branch_pushed_to_remote", return_value=True),
-            patch("lazypr.has_commits_ahead", return_value=True),
-            patch("lazypr.get_diff_remote", return_value="diff content"),
-            patch("lazypr.parse_diff_lines", return_value={"file.py": 5}),
-            patch("lazypr.filter_large_files", return_value="filtered diff"),
+            patch("lazypr.validation.is_git_repo_async", return_value=True),
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=True),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch(
+                "lazypr.validation.get_current_branch_async",
+                return_value="feature-branch",
+            ),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async",
+                return_value=True,
+            ),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=True),
+            patch(
+                "lazypr.get_filtered_diff_remote",
+                return_value=FilteredDiff(text="filtered diff"),
+            ),
             patch("lazypr.load_ignore_patterns", return_value=[]),
-            patch("lazypr.apply_ignore_patterns", return_value=["file.py"]),
-            patch("lazypr.generate_pr_content", return_value=mock_pr_content),
+            patch("lazypr.ai.generate_pr_content", return_value=mock_pr_content),
+            patch("lazypr.ai.prepare_pr_agent"),
             patch("lazypr.create_pr") as mock_create_pr,
         ):
             await create(base="main", yes=True, dry_run=True)
             mock_create_pr.assert_not_called()
 
 
+class TestUpdateCommand:
+    """Tests for the update command."""
+
+    @contextmanager
+    def _patched(self, pushed: bool = True):
+        """Pass the preflight checks and return the update and edit mocks."""
+        content = PRContent(title="Updated PR", description="Updated description")
+        with ExitStack() as stack:
+            for target, value in [
+                ("lazypr.validation.is_git_repo_async", True),
+                ("lazypr.validation.has_gh_cli", True),
+                ("lazypr.validation.gh_is_authenticated_async", True),
+                ("lazypr.validation.has_remote_async", True),
+                ("lazypr.validation.get_current_branch_async", "feature-branch"),
+                ("lazypr.validation.is_branch_pushed_to_remote_async", pushed),
+                ("lazypr.validation.has_commits_ahead_async", True),
+                ("lazypr.get_filtered_diff_remote", FilteredDiff(text="diff")),
+                ("lazypr.load_ignore_patterns", []),
+            ]:
+                stack.enter_context(patch(target, return_value=value))
+            stack.enter_context(patch("lazypr.ai.prepare_pr_agent"))
+            mock_update = stack.enter_context(
+                patch(
+                    "lazypr.ai.update_pr_content",
+                    return_value=(content, BranchState(content.title, "D")),
+                )
+            )
+            mock_edit = stack.enter_context(
+                patch("lazypr.edit_pr", return_value="https://github.com/o/r/pull/1")
+            )
+            yield mock_update, mock_edit
+
+    @pytest.mark.asyncio
+    async def test_edits_pr_with_updated_content(self):
+        """Should replace the PR's title and description."""
+        with self._patched() as (mock_update, mock_edit):
+            await update(base="main")
+
+        assert mock_update.call_args[0][1] is None
+        mock_edit.assert_called_once_with("Updated PR", "Updated description")
+
+    @pytest.mark.asyncio
+    async def test_dry_run_does_not_edit(self):
+        """Should print the content without touching the PR."""
+        with self._patched(pushed=False) as (_, mock_edit):
+            await update(base="main", dry_run=True)
+
+        mock_edit.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_requires_pushed_branch(self):
+        """Should refuse to describe commits the PR does not have yet."""
+        with self._patched(pushed=False) as (mock_update, _):
+            with pytest.raises(ValidationError, match="unpushed"):
+                await update(base="main")
+
+        mock_update.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_uses_state_from_previous_run(self):
+        """Should pass the state stored by the last update, unless --full."""
+        with self._patched() as (mock_update, _):
+            await update(base="main")
+            await update(base="main")
+            assert mock_update.call_args[0][1].title == "Updated PR"
+
+            await update(base="main", full=True)
+            assert mock_update.call_args[0][1] is None
+
+    @pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+    @pytest.mark.asyncio
+    async def test_finds_state_from_another_directory(self, tmp_path, monkeypatch):
+        """Should use the state stored from the repository root in a subdirectory."""
+        subprocess.run(["git", "init", "-q"], cwd=tmp_path, check=True)
+        (tmp_path / "docs").mkdir()
+        with self._patched() as (mock_update, _):
+            monkeypatch.chdir(tmp_path)
+            await update(base="main")
+            monkeypatch.chdir(tmp_path / "docs")
+            await update(base="main")
+
+        assert mock_update.call_args[0][1].title == "Updated PR"
+
+    def test_edit_pr_runs_gh_pr_edit(self):
+        """Should pass the new title and body to gh pr edit."""
+        with patch("lazypr.subprocess.run") as mock_run:
+            mock_run.return_value = MagicMock(stdout="https://x/pull/1\n")
+            assert edit_pr("T", "D") == "https://x/pull/1"
+
+        cmd = mock_run.call_args[0][0]
+        assert cmd == ["gh", "pr", "edit", "--title", "T", "--body", "D"]
+
+    def test_edit_pr_failure_raises(self):
+        """Should raise ValidationError with gh's message."""
+        error = subprocess.CalledProcessError(1, "gh", stderr="no pull requests found")
+        with patch("lazypr.subprocess.run", side_effect=error):
+            with pytest.raises(ValidationError, match="no pull requests found"):
+                edit_pr("T", "D")
+
+
+class TestCondenseDiff:
+    """Tests for condensing the diff before prompting."""
+
+    DIFF = (
+        "diff --git a/a.py b/a.py\n"
+        "--- a/a.py\n"
+        "+++ b/a.py\n"
+        "@@ -1,2 +1,2 @@\n"
+        "-def f( x ):\n"
+        "-    return   x\n"
+        "+def f(x):\n"
+        "+    return x\n"
+    )
+
+    async def _prompt_diff(self) -> str:
+        """Run create and return the diff passed to the model."""
+        content = PRContent(title="T", description="D")
+        with (
+            patch("lazypr.validation.is_git_repo_async", return_value=True),
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=True),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch("lazypr.validation.get_current_branch_async", return_value="f"),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async",
+                return_value=True,
+            ),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=True),
+            patch(
+                "lazypr.get_filtered_diff_remote",
+                return_value=FilteredDiff(text=self.DIFF),
+            ),
+            patch("lazypr.load_ignore_patterns", return_value=[]),
+            patch(
+                "lazypr.ai.generate_pr_content", return_value=content
+            ) as mock_generate,
+            patch("lazypr.ai.prepare_pr_agent"),
+        ):
+            await create(base="main", dry_run=True, use_cache=False)
+        return mock_generate.call_args[0][0]
+
+    @pytest.mark.asyncio
+    async def test_condenses_before_prompting(self, capsys):
+        """Should send the condensed diff and report the tokens saved."""
+        diff = await self._prompt_diff()
+
+        assert "[whitespace-only changes, diff omitted]" in diff
+        assert "Condensed diff, saving ~" in capsys.readouterr().out
+
+    @pytest.mark.asyncio
+    async def test_can_be_disabled(self, monkeypatch):
+        """Should send the diff as is with LAZYPR_CONDENSE=0."""
+        monkeypatch.setenv("LAZYPR_CONDENSE", "0")
+
+        assert await self._prompt_diff() == self.DIFF
+
+
+class TestDefaultCommand:
+    """Tests for running create without naming it."""
+
+    def test_runs_create_without_command(self):
+        """Should keep ``lazypr --base main`` working as create."""
+        with patch("lazypr.create") as mock_create:
+            result = CliRunner().invoke(app, ["--base", "main", "--dry-run"])
+
+        assert result.exit_code == 0, result.output
+        assert mock_create.call_args.args[0] == "main"
+        assert mock_create.call_args.kwargs["dry_run"] is True
+
+    def test_runs_named_commands(self):
+        """Should still dispatch to the other commands and show group help."""
+        with patch("lazypr.update") as mock_update:
+            result = CliRunner().invoke(app, ["update", "--base", "main"])
+
+        assert result.exit_code == 0, result.output
+        mock_update.assert_called_once()
+
+        result = CliRunner().invoke(app, ["--help"])
+        assert result.exit_code == 0
+        assert "batch" in result.output
+
+
+class TestContextOption:
+    """Tests for the --context and --function-context options."""
+
+    def test_passes_options_to_create(self):
+        """Should parse --context and hand both options to create."""
+        with patch("lazypr.create") as mock_create:
+            result = CliRunner().invoke(
+                app,
+                ["create", "--base", "main", "--context", "AUTO", "--function-context"],
+            )
+
+        assert result.exit_code == 0, result.output
+        assert mock_create.call_args.kwargs["context"] == "auto"
+        assert mock_create.call_args.kwargs["function_context"] is True
+
+    def test_rejects_invalid_context(self):
+        """Should refuse values that are neither a line count nor auto."""
+        with patch("lazypr.update") as mock_update:
+            result = CliRunner().invoke(
+                app, ["update", "--base", "main", "--context", "-1"]
+            )
+
+        assert result.exit_code == 2
+        mock_update.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_defaults_to_config(self, monkeypatch):
+        """Should use LAZYPR_CONTEXT_LINES unless the option is given."""
+        monkeypatch.setenv("LAZYPR_CONTEXT_LINES", "5")
+        with (
+            patch(
+                "lazypr.get_filtered_diff_remote",
+                return_value=FilteredDiff(text="diff --git a/a b/a\n+x\n"),
+            ) as mock_diff,
+            patch("lazypr.load_ignore_patterns", return_value=[]),
+        ):
+            await _get_prompt_diff("main")
+            assert mock_diff.call_args.kwargs["context"] == 5
+
+            await _get_prompt_diff("main", context=0)
+            assert mock_diff.call_args.kwargs["context"] == 0
+
+    @pytest.mark.asyncio
+    async def test_offline_never_fetches(self):
+        """Should diff against the base branch as last fetched when offline."""
+        with (
+            patch(
+                "lazypr.get_filtered_diff_remote",
+                return_value=FilteredDiff(text="diff --git a/a b/a\n+x\n"),
+            ) as mock_diff,
+            patch("lazypr.load_ignore_patterns", return_value=[]),
+        ):
+            await _get_prompt_diff("main")
+            assert mock_diff.call_args.kwargs["fetch"] is True
+
+            await _get_prompt_diff("main", offline=True)
+            assert mock_diff.call_args.kwargs["fetch"] is False
+
+    @pytest.mark.asyncio
+    async def test_auto_fits_context_to_budget(self, monkeypatch):
+        """Should narrow the diff's context to the token budget."""
+        monkeypatch.setenv("LAZYPR_TOKEN_BUDGET", "30")
+        context = "".join(f" context line {i}\n" for i in range(10))
+        diff = (
+            "diff --git a/a.py b/a.py\n"
+            "@@ -1,21 +1,21 @@\n" + context + "-old\n+new\n" + context
+        )
+        with (
+            patch(
+                "lazypr.get_filtered_diff_remote",
+                return_value=FilteredDiff(text=diff),
+            ),
+            patch("lazypr.load_ignore_patterns", return_value=[]),
+        ):
+            prompt_diff, _ = await _get_prompt_diff("main", context="auto")
+
+        assert "context line 5" not in prompt_diff
+        assert "-old\n+new\n" in prompt_diff
+
+
+class TestCache:
+    """Tests for the PR content cache in the CLI workflow."""
+
+    @pytest.mark.asyncio
+    async def test_cached_content_skips_model(self):
+        """Should reuse cached content without waiting for the agent."""
+        with (
+            patch("lazypr.validation.is_git_repo_async", return_value=True),
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=True),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch("lazypr.validation.get_current_branch_async", return_value="f"),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async",
+                return_value=True,
+            ),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=True),
+            patch(
+                "lazypr.get_filtered_diff_remote",
+                return_value=FilteredDiff(text="filtered diff"),
+            ),
+            patch("lazypr.load_ignore_patterns", return_value=[]),
+            patch(
+                "lazypr.ai.get_cached_pr_content",
+                return_value=PRContent(title="Cached", description="Body"),
+            ),
+            patch("lazypr.ai.prepare_pr_agent"),
+            patch("lazypr.ai.generate_pr_content") as mock_generate,
+            patch("lazypr.create_pr") as mock_create_pr,
+        ):
+            await create(base="main")
+            mock_generate.assert_not_called()
+            mock_create_pr.assert_called_once_with("Cached", "Body", "main", web=True)
+
+    @pytest.mark.asyncio
+    async def test_no_cache_skips_lookup(self):
+        """Should not consult the cache when use_cache is False."""
+        mock_pr_content = MagicMock()
+        mock_pr_content.title = "Test PR"
+        mock_pr_content.description = "Test description"
+
+        with (
+            patch("lazypr.validation.is_git_repo_async", return_value=True),
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=True),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch("lazypr.validation.get_current_branch_async", return_value="f"),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async",
+                return_value=True,
+            ),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=True),
+            patch(
+                "lazypr.get_filtered_diff_remote",
+                return_value=FilteredDiff(text="filtered diff"),
+            ),
+            patch("lazypr.load_ignore_patterns", return_value=[]),
+            patch("lazypr.ai.get_cached_pr_content") as mock_lookup,
+            patch("lazypr.ai.prepare_pr_agent"),
+            patch(
+                "lazypr.ai.generate_pr_content", return_value=mock_pr_content
+            ) as mock_generate,
+            patch("lazypr.create_pr"),
+        ):
+            await create(base="main", dry_run=True, use_cache=False)
+            mock_lookup.assert_not_called()
+            assert mock_generate.call_args.kwargs["use_cache"] is False
+
+    def test_cache_command_lists_and_clears_entries(self):
+        """Should show cache entries and clear them with --clear."""
+        store_cached("abc123", {"title": "T", "description": "D"})
+        runner = CliRunner()
+
+        result = runner.invoke(app, ["cache"])
+        assert result.exit_code == 0
+        assert "Entries: 1" in result.output
+
+        result = runner.invoke(app, ["cache", "--clear"])
+        assert result.exit_code == 0
+        assert "Removed 1 cache entries." in result.output
+        assert "Entries: 0" in result.output
+
+
+class TestTokenBudget:
+    """Tests for packing the diff into LAZYPR_TOKEN_BUDGET."""
+
+    @pytest.mark.asyncio
+    async def test_packs_diff_when_budget_set(self, monkeypatch):
+        """Should send the packed diff to the model instead of the full one."""
+        monkeypatch.setenv("LAZYPR_TOKEN_BUDGET", "100")
+        diff = (
+            "diff --git a/a.py b/a.py\n"
+            "--- a/a.py\n"
+            "+++ b/a.py\n"
+            "@@ -1,1 +1,500 @@\n" + "+line of code\n" * 500
+        )
+        mock_pr_content = MagicMock()
+        mock_pr_content.title = "Test PR"
+        mock_pr_content.description = "Test description"
+
+        with (
+            patch("lazypr.validation.is_git_repo_async", return_value=True),
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=True),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch("lazypr.validation.get_current_branch_async", return_value="f"),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async",
+                return_value=True,
+            ),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=True),
+            patch(
+                "lazypr.get_filtered_diff_remote",
+                return_value=FilteredDiff(text=diff),
+            ) as mock_diff,
+            patch("lazypr.load_ignore_patterns", return_value=[]),
+            patch("lazypr.ai.prepare_pr_agent"),
+            patch(
+                "lazypr.ai.generate_pr_content", return_value=mock_pr_content
+            ) as mock_generate,
+        ):
+            await create(base="main", dry_run=True, use_cache=False)
+
+        # The per-file cutoff is relaxed so the packer can degrade the file
+        assert mock_diff.call_args.args[1] == 20000
+        sent = mock_generate.call_args.args[0]
+        assert sent.startswith("diff --git a/a.py b/a.py\n")
+        assert "[... 500 lines omitted ...]" in sent
+
+
+class TestDaemonClient:
+    """Tests for handing generation to a running daemon."""
+
+    @contextmanager
+    def _workflow(self):
+        """Patch everything up to generation, with a daemon that accepts."""
+        patches = (
+            patch("lazypr.validation.is_git_repo_async", return_value=True),
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=True),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch("lazypr.validation.get_current_branch_async", return_value="f"),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async",
+                return_value=True,
+            ),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=True),
+            patch(
+                "lazypr.get_filtered_diff_remote",
+                return_value=FilteredDiff(text="filtered diff"),
+            ),
+            patch("lazypr.load_ignore_patterns", return_value=[]),
+            patch("lazypr.daemon.connect", return_value=(MagicMock(), MagicMock())),
+        )
+        with ExitStack() as stack:
+            for p in patches:
+                stack.enter_context(p)
+            yield
+
+    @pytest.mark.asyncio
+    async def test_uses_daemon_when_running(self):
+        """Should not prepare a local agent when the daemon generates content."""
+        content = DaemonContent(title="From daemon", description="Body")
+        with (
+            self._workflow(),
+            patch(
+                "lazypr.daemon.request_pr_content", return_value=content
+            ) as mock_request,
+            patch("lazypr.ai.prepare_pr_agent") as mock_prepare,
+            patch("lazypr.create_pr") as mock_create_pr,
+        ):
+            await create(base="main", yes=True)
+
+        assert mock_request.call_args.args[1] == "filtered diff"
+        mock_prepare.assert_not_called()
+        mock_create_pr.assert_called_once_with("From daemon", "Body", "main", web=False)
+
+    @pytest.mark.asyncio
+    async def test_falls_back_when_daemon_declines(self):
+        """Should generate locally when the daemon cannot serve the request."""
+        mock_pr_content = MagicMock()
+        mock_pr_content.title = "Local"
+        mock_pr_content.description = "Body"
+        with (
+            self._workflow(),
+            patch("lazypr.daemon.request_pr_content", return_value=None),
+            patch("lazypr.ai.prepare_pr_agent") as mock_prepare,
+            patch("lazypr.ai.generate_pr_content", return_value=mock_pr_content),
+            patch("lazypr.create_pr") as mock_create_pr,
+        ):
+            await create(base="main", yes=True, use_cache=False)
+
+        mock_prepare.assert_called_once()
+        mock_create_pr.assert_called_once_with("Local", "Body", "main", web=False)
+
+    @pytest.mark.asyncio
+    async def test_falls_back_when_daemon_fails(self, capsys):
+        """Should generate locally instead of crashing on a daemon error."""
+        mock_pr_content = MagicMock()
+        mock_pr_content.title = "Local"
+        mock_pr_content.description = "Body"
+        with (
+            self._workflow(),
+            patch(
+                "lazypr.daemon.request_pr_content",
+                side_effect=DaemonError("Lost connection to lazypr daemon"),
+            ),
+            patch("lazypr.ai.prepare_pr_agent") as mock_prepare,
+            patch("lazypr.ai.generate_pr_content", return_value=mock_pr_content),
+            patch("lazypr.create_pr") as mock_create_pr,
+        ):
+            await create(base="main", yes=True, use_cache=False)
+
+        mock_prepare.assert_called_once()
+        mock_create_pr.assert_called_once_with("Local", "Body", "main", web=False)
+        assert "daemon failed" in capsys.readouterr().out
+
+
+class TestProfileFlag:
+    """Tests for the --profile and --trace options."""
+
+    def test_prints_phase_timings_and_writes_trace(self, tmp_path):
+        """Should report each phase of the run and save them as a trace."""
+        mock_pr_content = MagicMock()
+        mock_pr_content.title = "Test PR"
+        mock_pr_content.description = "Test description"
+        trace = tmp_path / "trace.json"
+
+        with (
+            patch("lazypr.validation.is_git_repo_async", return_value=True),
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=True),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch("lazypr.validation.get_current_branch_async", return_value="f"),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async",
+                return_value=True,
+            ),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=True),
+            patch(
+                "lazypr.get_filtered_diff_remote",
+                return_value=FilteredDiff(text="filtered diff"),
+            ),
+            patch("lazypr.load_ignore_patterns", return_value=[]),
+            patch("lazypr.ai.prepare_pr_agent"),
+            patch("lazypr.ai.generate_pr_content", return_value=mock_pr_content),
+        ):
+            result = CliRunner().invoke(
+                app,
+                [
+                    "create",
+                    "--base",
+                    "main",
+                    "--dry-run",
+                    "--no-cache",
+                    "--profile",
+                    "--trace",
+                    str(trace),
+                ],
+            )
+
+        assert result.exit_code == 0, result.output
+        assert "Phase timings (total" in result.output
+        for name in ("preflight checks", "diff", "wait for agent", "generate"):
+            assert f"  {name}\n" in result.output
+        events = json.loads(trace.read_text())["traceEvents"]
+        assert {"preflight checks", "diff", "generate"} <= {e["name"] for e in events}
+
+    def test_no_report_without_flag(self):
+        """Should not print timings unless asked to."""
+        with patch("lazypr.create") as mock_create:
+            result = CliRunner().invoke(app, ["create", "--base", "main"])
+
+        assert result.exit_code == 0, result.output
+        mock_create.assert_called_once()
+        assert "Phase timings" not in result.output
+
+
+class TestUsage:
+    """Tests for token usage reporting."""
+
+    @pytest.mark.asyncio
+    async def test_reports_and_logs_usage(self, monkeypatch):
+        """Should print the run's tokens and append them to the usage log."""
+        monkeypatch.setenv("LAZYPR_MODEL", "openai:gpt-4.1")
+
+        async def generate(diff, language, omitted_files, **kwargs):
+            kwargs["usage"].add(
+                TokenUsage(
+                    requests=1,
+                    input_tokens=1000,
+                    output_tokens=100,
+                    estimated_tokens=950,
+                    cost=0.0028,
+                )
+            )
+            return PRContent(title="T", description="D")
+
+        with (
+            patch("lazypr.validation.is_git_repo_async", return_value=True),
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch("lazypr.validation.gh_is_authenticated_async", return_value=True),
+            patch("lazypr.validation.has_remote_async", return_value=True),
+            patch("lazypr.validation.get_current_branch_async", return_value="f"),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async",
+                return_value=True,
+            ),
+            patch("lazypr.validation.has_commits_ahead_async", return_value=True),
+            patch(
+                "lazypr.get_filtered_diff_remote",
+                return_value=FilteredDiff(text="filtered diff"),
+            ),
+            patch("lazypr.load_ignore_patterns", return_value=[]),
+            patch("lazypr.ai.prepare_pr_agent"),
+            patch("lazypr.ai.generate_pr_content", side_effect=generate),
+            patch("typer.echo") as mock_echo,
+        ):
+            await create(base="main", dry_run=True, use_cache=False)
+
+        echoed = [call.args[0] for call in mock_echo.call_args_list]
+        assert any(line.startswith("Tokens: 1,000 in, 100 out") for line in echoed)
+        (record,) = load_usage_records()
+        assert (record.command, record.model) == ("create", "openai:gpt-4.1")
+        assert record.usage.cost == 0.0028
+
+    def test_usage_command_summarizes_by_model(self):
+        """Should total the logged runs per model."""
+        record_usage("create", "openai:gpt-4.1", TokenUsage(1, 1000, 100, cost=0.01))
+        record_usage("batch", "openai:gpt-4.1", TokenUsage(3, 3000, 300, cost=0.03))
+        record_usage("create", "ollama:llama3", TokenUsage(1, 500, 50, cost=None))
+
+        result = CliRunner().invoke(app, ["usage"])
+
+        assert result.exit_code == 0, result.output
+        assert (
+            "  openai:gpt-4.1: 2 run(s), 4 request(s), 4,000 in, 400 out, ~$0.0400"
+            in result.output
+        )
+        assert (
+            "  ollama:llama3: 1 run(s), 1 request(s), 500 in, 50 out, cost unknown\n"
+            in result.output
+        )
+        assert "(1 run(s) with unknown price)" in result.output
+        assert "Total: 3 run(s), 5 request(s)" in result.output
+        assert "$0.0000" not in result.output
+
+
+class TestBatchCommand:
+    """Tests for the batch command."""
+
+    def test_prints_summary_table(self):
+        """Should fetch once, run the batch and show one row per branch."""
+        results = [
+            BatchResult("feat/a", "created", "Add A", url="https://pr/1"),
+            BatchResult("feat/b", "skipped", error="No changes left after filtering"),
+        ]
+        with (
+            patch("lazypr.run_repository_checks") as mock_checks,
+            patch("lazypr.batch.fetch_branches") as mock_fetch,
+            patch(
+                "lazypr.batch.resolve_branches",
+                return_value=["main", "feat/a", "feat/b"],
+            ),
+            patch("lazypr.batch.run_batch", return_value=results) as mock_batch,
+            patch("lazypr.load_ignore_patterns", return_value=[]),
+        ):
+            result = CliRunner().invoke(
+                app,
+                ["batch", "--base", "main", "--glob", "feat/*", "--concurrency", "8"],
+            )
+
+        assert result.exit_code == 0, result.output
+        mock_checks.assert_called_once_with("origin")
+        mock_fetch.assert_called_once_with("main", None, "origin")
+        assert mock_batch.call_args.args[1] == ["feat/a", "feat/b"]
+        assert mock_batch.call_args.kwargs["max_concurrency"] == 8
+        assert "https://pr/1" in result.output
+        assert "skipped" in result.output
+
+    def test_exits_with_error_when_a_branch_fails(self):
+        """Should exit non-zero if any branch failed."""
+        with (
+            patch("lazypr.run_repository_checks"),
+            patch("lazypr.batch.fetch_branches") as mock_fetch,
+            patch("lazypr.batch.resolve_branches", return_value=["feat/a"]),
+            patch(
+                "lazypr.batch.run_batch",
+                return_value=[BatchResult("feat/a", "failed", error="boom")],
+            ),
+            patch("lazypr.load_ignore_patterns", return_value=[]),
+        ):
+            result = CliRunner().invoke(app, ["batch", "--base", "main", "feat/a"])
+
+        assert result.exit_code == 1
+        mock_fetch.assert_called_once_with("main", ["feat/a"], "origin")
+
+    def test_offline_skips_fetch(self):
+        """Should use the remote branches as last fetched with --offline."""
+        with (
+            patch("lazypr.run_repository_checks"),
+            patch("lazypr.batch.fetch_branches") as mock_fetch,
+            patch("lazypr.batch.resolve_branches", return_value=["feat/a"]),
+            patch(
+                "lazypr.batch.run_batch",
+                return_value=[BatchResult("feat/a", "created", "Add A")],
+            ),
+            patch("lazypr.load_ignore_patterns", return_value=[]),
+        ):
+            result = CliRunner().invoke(
+                app, ["batch", "--base", "main", "--offline", "feat/a"]
+            )
+
+        assert result.exit_code == 0, result.output
+        mock_fetch.assert_not_called()
+        assert "Fetching branches" not in result.output
+
+
 class TestConfigTokenIntegration:
     """Tests for config token integration with PR creation."""
 
@@ -0,0 +1,98 @@
+"""Tests for phase timings and tracing."""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from lazypr.profiling import Profiler, phase, profiling
+
+
+class TestPhase:
+    """Tests for phase() context manager."""
+
+    def test_does_nothing_without_profiler(self):
+        """Should run the block without recording anything."""
+        with profiling(None):
+            with phase("idle"):
+                result = 1 + 1
+
+        assert result == 2
+
+    def test_records_nested_phases(self):
+        """Should record each phase with its depth and duration."""
+        with profiling(Profiler()) as profiler:
+            with phase("outer"):
+                with phase("inner"):
+                    time.sleep(0.01)
+
+        spans = {span.name: span for span in profiler.spans}
+        assert spans["outer"].depth == 0
+        assert spans["inner"].depth == 1
+        assert spans["inner"].duration >= 0.01
+        assert spans["outer"].duration >= spans["inner"].duration
+
+    def test_records_phase_that_raises(self):
+        """Should time a phase that fails and let the error through."""
+        with profiling(Profiler()) as profiler:
+            with pytest.raises(RuntimeError):
+                with phase("broken"):
+                    raise RuntimeError("boom")
+
+        assert [span.name for span in profiler.spans] == ["broken"]
+
+    @pytest.mark.asyncio
+    async def test_follows_tasks_and_threads(self):
+        """Should record phases run in tasks and worker threads."""
+
+        def work():
+            with phase("thread"):
+                pass
+
+        async def task():
+            with phase("task"):
+                await asyncio.to_thread(work)
+
+        with profiling(Profiler()) as profiler:
+            with phase("run"):
+                await asyncio.gather(task(), task())
+
+        names = sorted(span.name for span in profiler.spans)
+        assert names == ["run", "task", "task", "thread", "thread"]
+        assert {s.depth for s in profiler.spans if s.name == "thread"} == {2}
+
+
+class TestProfiler:
+    """Tests for Profiler reports."""
+
+    def test_report_lists_phases_in_start_order(self):
+        """Should indent nested phases under the total run time."""
+        with profiling(Profiler()) as profiler:
+            with phase("first"):
+                with phase("nested"):
+                    pass
+            with phase("second"):
+                pass
+
+        lines = profiler.report().splitlines()
+        assert lines[0].startswith("Phase timings (total ")
+        assert [line.split("s  ", 2)[2] for line in lines[1:]] == [
+            "first",
+            "  nested",
+            "second",
+        ]
+
+    def test_writes_chrome_trace(self, tmp_path):
+        """Should write complete events in microseconds."""
+        with profiling(Profiler()) as profiler:
+            with phase("git diff"):
+                time.sleep(0.01)
+
+        path = tmp_path / "trace.json"
+        profiler.write_trace(path)
+
+        (event,) = json.loads(path.read_text())["traceEvents"]
+        assert event["name"] == "git diff"
+        assert event["ph"] == "X"
+        assert event["dur"] >= 10000
@@ -0,0 +1,123 @@
+"""Tests for token usage accounting and the usage log."""
+
+import time
+
+import pytest
+
+from lazypr.usage import (
+    TokenUsage,
+    estimate_cost,
+    get_usage_log_path,
+    load_usage_records,
+    record_usage,
+)
+
+
+@pytest.fixture(autouse=True)
+def state_home(tmp_path, monkeypatch):
+    """Keep the usage log out of the real home directory."""
+    monkeypatch.setenv("XDG_STATE_HOME", str(tmp_path))
+
+
+class TestTokenUsage:
+    """Tests for TokenUsage."""
+
+    def test_add_sums_counts_and_cost(self):
+        """Should add every count and the cost."""
+        usage = TokenUsage(requests=1, input_tokens=100, output_tokens=10, cost=0.5)
+        usage.add(TokenUsage(requests=2, input_tokens=50, estimated_tokens=40))
+
+        assert usage == TokenUsage(
+            requests=3,
+            input_tokens=150,
+            output_tokens=10,
+            estimated_tokens=40,
+            cost=0.5,
+        )
+
+    def test_unknown_price_makes_cost_unknown(self):
+        """Should not report a partial cost as the total."""
+        usage = TokenUsage(cost=0.5)
+        usage.add(TokenUsage(requests=1, cost=None))
+
+        assert usage.cost is None
+        assert usage.summary().endswith("cost unknown")
+
+    def test_summary(self):
+        """Should describe reported and estimated tokens and the cost."""
+        usage = TokenUsage(
+            requests=1,
+            input_tokens=12000,
+            output_tokens=300,
+            estimated_tokens=11500,
+            cost=0.0264,
+        )
+
+        assert usage.summary() == (
+            "Tokens: 12,000 in, 300 out in 1 request(s) "
+            "(estimated ~11,500 in), ~$0.0264"
+        )
+
+    def test_summary_shows_cache_hits(self):
+        """Should show input tokens served from the prompt cache."""
+        usage = TokenUsage(requests=1, input_tokens=2000, cache_read_tokens=1500)
+
+        assert usage.summary().startswith("Tokens: 2,000 in (1,500 cached), 0 out")
+
+
+class TestEstimateCost:
+    """Tests for estimate_cost() function."""
+
+    def test_prices_known_model(self):
+        """Should price input and output tokens from the price list."""
+        cost = estimate_cost("gpt-4.1", "openai", 1_000_000, 0)
+
+        assert cost == pytest.approx(2.0)
+
+    def test_prices_cache_reads_lower(self):
+        """Should charge cached input tokens at the cache read price."""
+        cost = estimate_cost(
+            "gpt-4.1", "openai", 1_000_000, 0, cache_read_tokens=1_000_000
+        )
+
+        assert cost == pytest.approx(0.5)
+
+    def test_returns_none_for_unknown_model(self):
+        """Should return None instead of guessing a price."""
+        assert estimate_cost("no-such-model", "test", 1000, 100) is None
+
+
+class TestUsageLog:
+    """Tests for record_usage() and load_usage_records()."""
+
+    def test_round_trip(self):
+        """Should append one record per run and read them back in order."""
+        record_usage("create", "openai:gpt-4.1", TokenUsage(requests=1, cost=0.01))
+        record_usage("batch", "openai:gpt-4.1", TokenUsage(requests=4, cost=None))
+
+        records = load_usage_records()
+
+        assert [(r.command, r.usage.requests) for r in records] == [
+            ("create", 1),
+            ("batch", 4),
+        ]
+        assert records[1].usage.cost is None
+
+    def test_skips_unreadable_lines(self):
+        """Should ignore corrupt lines, e.g. from an interrupted write."""
+        record_usage("create", "m", TokenUsage(requests=1))
+        with open(get_usage_log_path(), "a") as f:
+            f.write('{"timestamp": 1, "comm\n')
+
+        assert len(load_usage_records()) == 1
+
+    def test_filters_by_time(self):
+        """Should only return runs since the given timestamp."""
+        record_usage("create", "m", TokenUsage(requests=1))
+
+        assert load_usage_records(since=time.time() + 60) == []
+        assert len(load_usage_records(since=time.time() - 60)) == 1
+
+    def test_missing_log_is_empty(self):
+        """Should return no records before the first run."""
+        assert load_usage_records() == []
@@ -1,6 +1,8 @@
 """Tests for git and gh CLI validation."""
 
+import asyncio
 import subprocess
+import time
 import pytest
 from unittest.mock import patch, MagicMock
 
@@ -14,6 +16,7 @@ from lazypr import (
     ValidationError,
     is_branch_pushed_to_remote,
     push_branch_to_remote,
+    run_preflight_checks,
 )
 
 
@@ -170,3 +173,113 @@ class TestPushBranchToRemote:
             )
             with pytest.raises(ValidationError, match="Failed to push branch"):
                 push_branch_to_remote("feature-branch", "origin")
+
+
+class _SlowProcess:
+    """Stand-in for an asyncio subprocess that takes a while to finish."""
+
+    def __init__(self, stdout: bytes, returncode: int = 0, delay: float = 0.2):
+        self._stdout = stdout
+        self._delay = delay
+        self.returncode = returncode
+
+    async def communicate(self):
+        await asyncio.sleep(self._delay)
+        return self._stdout, b""
+
+
+def _fake_exec(outputs: dict[str, tuple[bytes, int]]):
+    """Build a create_subprocess_exec replacement keyed on the subcommand."""
+
+    async def fake_exec(*cmd, **kwargs):
+        key = " ".join(cmd[:2])
+        stdout, returncode = outputs.get(key, (b"", 0))
+        return _SlowProcess(stdout, returncode)
+
+    return fake_exec
+
+
+class TestRunPreflightChecks:
+    """Tests for run_preflight_checks() function."""
+
+    OK_OUTPUTS = {
+        "git remote": (b"origin\n", 0),
+        "git branch": (b"feature-branch\n", 0),
+        "git rev-list": (b"abc123\n", 0),
+    }
+
+    @pytest.mark.asyncio
+    async def test_runs_checks_concurrently(self):
+        """Should take about as long as the slowest check, not their sum."""
+        outputs = dict(self.OK_OUTPUTS)
+        with (
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch(
+                "lazypr.validation.asyncio.create_subprocess_exec",
+                side_effect=_fake_exec(outputs),
+            ),
+            patch(
+                "lazypr.validation.is_branch_pushed_to_remote_async",
+                return_value=True,
+            ),
+        ):
+            start = time.perf_counter()
+            result = await run_preflight_checks("main")
+            elapsed = time.perf_counter() - start
+
+        # Five 0.2s subprocesses would take a full second run one by one
+        assert elapsed < 0.6
+        assert result.current_branch == "feature-branch"
+        assert result.branch_pushed is True
+
+    @pytest.mark.asyncio
+    async def test_reports_all_failures_together(self):
+        """Should list every failed check in a single ValidationError."""
+        outputs = {
+            "gh auth": (b"", 1),
+            "git remote": (b"upstream\n", 0),
+            "git branch": (b"feature-branch\n", 0),
+            "git rev-list": (b"", 0),
+        }
+        with (
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch(
+                "lazypr.validation.asyncio.create_subprocess_exec",
+                side_effect=_fake_exec(outputs),
+            ),
+        ):
+            with pytest.raises(ValidationError) as exc_info:
+                await run_preflight_checks("main")
+
+        message = str(exc_info.value)
+        assert "gh CLI not authenticated" in message
+        assert "No 'origin' remote found" in message
+        assert "No commits ahead of 'main'" in message
+
+    @pytest.mark.asyncio
+    async def test_skips_git_checks_outside_repository(self):
+        """Should only report the repository failure for git checks."""
+        with (
+            patch("lazypr.validation.has_gh_cli", return_value=False),
+            patch(
+                "lazypr.validation.asyncio.create_subprocess_exec",
+                side_effect=_fake_exec({"git rev-parse": (b"", 128)}),
+            ),
+        ):
+            with pytest.raises(ValidationError) as exc_info:
+                await run_preflight_checks("main")
+
+        assert str(exc_info.value) == "Not in a git repository\ngh CLI not installed"
+
+    @pytest.mark.asyncio
+    async def test_treats_missing_executable_as_failure(self):
+        """Should report a failed check when the executable is missing."""
+        with (
+            patch("lazypr.validation.has_gh_cli", return_value=True),
+            patch(
+                "lazypr.validation.asyncio.create_subprocess_exec",
+                side_effect=FileNotFoundError,
+            ),
+        ):
+            with pytest.raises(ValidationError, match="Not in a git repository"):
+                await run_preflight_checks("main")